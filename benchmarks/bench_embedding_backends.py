@@ -0,0 +1,131 @@
+"""Compare the "torch" and "onnx-int8" embedding backends (src/embedder_registry.py).
+
+Chunks come from the papers in pdf/ and temp/ (through pdf_ingest, so the
+extraction cache is used). Each backend runs in its own process so that peak
+RSS is measured separately. Reports load time, throughput (chunks/sec), peak
+RSS and, against the torch backend, the mean cosine similarity of the chunk
+embeddings and the top-k retrieval overlap for a set of typical questions.
+
+    python benchmarks/bench_embedding_backends.py
+    python benchmarks/bench_embedding_backends.py --threads 4 --k 5
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+BACKENDS = ("torch", "onnx-int8")
+
+QUESTIONS = [
+    "What are the boundary conditions of the inlet and outlet?",
+    "What is the Reynolds number of the flow?",
+    "Which turbulence model is used?",
+    "What is the inlet velocity in m/s?",
+    "What is the angle of attack of the airfoil?",
+    "What solver is used in OpenFOAM?",
+    "What is the mesh size and number of cells?",
+    "What is the Mach number and total pressure at the nozzle inlet?",
+]
+
+
+def load_chunks():
+    import pdf_ingest, pdf_cache
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "pdf", "*.pdf")) + glob.glob(os.path.join(ROOT, "temp", "*.pdf"))):
+        _, document_chunks = pdf_ingest.extract_document(path, pdf_cache.file_sha256(path))
+        chunks.extend(document_chunks)
+    return chunks
+
+
+def worker(backend, threads, input_path, output_path):
+    import config, embedder_registry
+    config.embedding_backend = backend
+    config.embedding_threads = threads
+
+    with open(input_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    started = time.perf_counter()
+    embedder = embedder_registry.get_embedder()
+    load_time = time.perf_counter() - started
+
+    embedder.encode(data["chunks"][:8])  # warm-up
+    started = time.perf_counter()
+    chunk_vectors = np.asarray(embedder.encode(data["chunks"], batch_size=32), dtype='float32')
+    encode_time = time.perf_counter() - started
+    question_vectors = np.asarray(embedder.encode(data["questions"]), dtype='float32')
+
+    np.savez(output_path, chunks=chunk_vectors, questions=question_vectors)
+    print(json.dumps({
+        "load_time": load_time,
+        "chunks_per_second": len(data["chunks"]) / encode_time,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }))
+
+
+def top_k(chunk_vectors, question_vectors, k):
+    def unit(x):
+        return x / np.clip(np.linalg.norm(x, axis=1, keepdims=True), 1e-12, None)
+    scores = unit(question_vectors) @ unit(chunk_vectors).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--worker", nargs=3, metavar=("BACKEND", "INPUT", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker[0], args.threads, args.worker[1], args.worker[2])
+        return
+
+    chunks = load_chunks()
+    print(f"{len(chunks)} chunks, {len(QUESTIONS)} questions, threads={args.threads or 'default'}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "input.json")
+        with open(input_path, 'w', encoding='utf-8') as f:
+            json.dump({"chunks": chunks, "questions": QUESTIONS}, f)
+
+        results, vectors = {}, {}
+        for backend in BACKENDS:
+            output_path = os.path.join(tmp, f"{backend}.npz")
+            command = [sys.executable, __file__, "--worker", backend, input_path, output_path]
+            if args.threads:
+                command += ["--threads", str(args.threads)]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"{backend}: failed\n{completed.stderr.strip()}")
+                continue
+            results[backend] = json.loads(completed.stdout.strip().splitlines()[-1])
+            vectors[backend] = np.load(output_path)
+
+    print(f"{'backend':>10} {'load':>8} {'chunks/s':>10} {'peak RSS':>10} {'cosine':>8} {'top-k overlap':>14}")
+    reference = vectors.get("torch")
+    for backend, result in results.items():
+        cosine = overlap = float("nan")
+        if reference is not None:
+            a, b = reference["chunks"], vectors[backend]["chunks"]
+            cosine = float(np.mean(np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))))
+            ref_top = top_k(reference["chunks"], reference["questions"], args.k)
+            top = top_k(vectors[backend]["chunks"], vectors[backend]["questions"], args.k)
+            overlap = float(np.mean([len(set(r) & set(t)) / args.k for r, t in zip(ref_top, top)]))
+        print(f"{backend:>10} {result['load_time']:>7.1f}s {result['chunks_per_second']:>10.1f} "
+              f"{result['peak_rss_mb']:>8.0f}MB {cosine:>8.4f} {overlap:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Table-page pre-pass benchmark for src/pdf_ingest.py.
+
+For every PDF in pdf/ and temp/ (or the given files), compares running
+`page.extract_tables()` on every page ("all") with running it only on the
+pages `pdf_ingest.may_contain_tables` accepts ("heuristic"). Reports the
+table-extraction time per paper, the whole-page extraction time, and
+whether the heuristic still finds every table.
+
+The sample papers have raster figures, which extract_tables skips quickly.
+A synthetic page with a vector mesh (`--mesh` lines per side, drawn the way
+CFD papers export mesh and contour plots) is added to show the case the
+pre-pass is for.
+
+    python benchmarks/bench_table_detection.py
+    python benchmarks/bench_table_detection.py paper1.pdf paper2.pdf --repeat 5 --mesh 0
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import pdfplumber
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+import pdf_ingest
+
+
+def write_mesh_pdf(path, n):
+    """One-page PDF with an n x n grid of vector lines under a figure caption."""
+    ops = ["0.2 w"]
+    for i in range(n + 1):
+        offset = 400 * i / n
+        ops.append(f"{100 + offset:.2f} 200 m {100 + offset:.2f} 600 l S")
+        ops.append(f"100 {200 + offset:.2f} m 500 {200 + offset:.2f} l S")
+    ops.append("BT /F1 10 Tf 100 180 Td (Figure 3. Computational mesh) Tj ET")
+    stream = "\n".join(ops).encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    data, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def table_pass(file_path, table_detection):
+    """(seconds spent deciding and extracting tables, tables, candidate pages, pages)."""
+    elapsed, tables, candidates = 0.0, [], 0
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages:
+            # Text is extracted in both modes; only the table stage is timed
+            text = page.extract_text() or ""
+            start = time.perf_counter()
+            if table_detection == "all" or pdf_ingest.may_contain_tables(page, text):
+                candidates += 1
+                tables.extend(pdf_ingest._freeze_table(table) for table in page.extract_tables())
+            elapsed += time.perf_counter() - start
+            page.close()
+        return elapsed, tables, candidates, len(pdf.pages)
+
+
+def page_pass(file_path, table_detection):
+    start = time.perf_counter()
+    pdf_ingest.extract_pages(file_path, workers=1, table_detection=table_detection)
+    return time.perf_counter() - start
+
+
+def best_of(repeat, run):
+    results = [run() for _ in range(repeat)]
+    return min(results, key=lambda result: result[0] if isinstance(result, tuple) else result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf_paths", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mesh", type=int, default=120, help="lines per side of the synthetic mesh page (0 = none)")
+    args = parser.parse_args()
+    paths = args.pdf_paths or sorted(glob.glob(os.path.join(ROOT, "pdf", "*.pdf")) + glob.glob(os.path.join(ROOT, "temp", "*.pdf")))
+    if args.mesh:
+        mesh_path = os.path.join(tempfile.mkdtemp(), f"synthetic_mesh_{args.mesh}.pdf")
+        write_mesh_pdf(mesh_path, args.mesh)
+        paths.append(mesh_path)
+
+    print(f"{'paper':>40} {'pages':>5} {'cand.':>5} {'tables all':>10} {'heuristic':>9} {'missed':>6}"
+          f" {'table ms all':>12} {'heuristic':>9} {'page ms all':>11} {'heuristic':>9}")
+    totals = [0.0, 0.0, 0.0, 0.0]
+    for path in paths:
+        all_time, all_tables, _, pages = best_of(args.repeat, lambda: table_pass(path, "all"))
+        heuristic_time, heuristic_tables, candidates, _ = best_of(args.repeat, lambda: table_pass(path, "heuristic"))
+        all_pages = best_of(args.repeat, lambda: page_pass(path, "all"))
+        heuristic_pages = best_of(args.repeat, lambda: page_pass(path, "heuristic"))
+        missed = sum(1 for table in all_tables if table not in heuristic_tables)
+        for i, value in enumerate((all_time, heuristic_time, all_pages, heuristic_pages)):
+            totals[i] += value
+        print(f"{os.path.basename(path)[-40:]:>40} {pages:>5} {candidates:>5} {len(all_tables):>10} {len(heuristic_tables):>9}"
+              f" {missed:>6} {1e3 * all_time:>12.1f} {1e3 * heuristic_time:>9.1f} {1e3 * all_pages:>11.1f} {1e3 * heuristic_pages:>9.1f}")
+    print(f"{'total':>40} {'':>5} {'':>5} {'':>10} {'':>9} {'':>6}"
+          f" {1e3 * totals[0]:>12.1f} {1e3 * totals[1]:>9.1f} {1e3 * totals[2]:>11.1f} {1e3 * totals[3]:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
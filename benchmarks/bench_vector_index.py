@@ -0,0 +1,83 @@
+"""Build and query benchmark for the index types in src/vector_index.py.
+
+Uses synthetic clustered unit vectors (a stand-in for sentence embeddings of
+paper chunks) and reports, per corpus size and index type: build time, index
+size, mean query latency and recall@k against exact search.
+
+    python benchmarks/bench_vector_index.py                      # 1k, 100k, 1M chunks
+    python benchmarks/bench_vector_index.py --sizes 1000 100000  # skip the 1M run (~3 GB of vectors)
+"""
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+import config
+import vector_index
+
+
+def clustered_vectors(n, dim, n_clusters, rng):
+    """Unit vectors drawn around random centres, roughly like embeddings of topical text."""
+    centres = rng.standard_normal((n_clusters, dim)).astype('float32')
+    labels = rng.integers(0, n_clusters, n)
+    vectors = np.empty((n, dim), dtype='float32')
+    for start in range(0, n, 100_000):
+        stop = min(start + 100_000, n)
+        vectors[start:stop] = centres[labels[start:stop]] + 0.6 * rng.standard_normal((stop - start, dim)).astype('float32')
+    return vector_index.normalize(vectors)
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(size, dim, queries, k, index_types, rng):
+    corpus = clustered_vectors(size, dim, max(8, size // 500), rng)
+    query_vectors = corpus[rng.integers(0, size, queries)] + 0.05 * rng.standard_normal((queries, dim)).astype('float32')
+
+    exact = vector_index.build_index(corpus, metric="cosine", index_type="flat")
+    _, truth = vector_index.search(exact, query_vectors, k, metric="cosine")
+
+    for index_type in index_types:
+        started = time.perf_counter()
+        index = vector_index.configure_search(vector_index.build_index(corpus, metric="cosine", index_type=index_type))
+        build_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        _, found = vector_index.search(index, query_vectors, k, metric="cosine")
+        query_time = (time.perf_counter() - started) / queries
+
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        actual_type = type(index).__name__
+        print(f"{size:>9} {index_type:>6} {actual_type:>14} {build_time:>9.2f}s {size_mb:>9.1f}MB "
+              f"{query_time * 1e3:>9.3f}ms {recall_at_k(found, truth):>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768, help="embedding size (768 for all-mpnet-base-v2)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-types", nargs="+", default=list(vector_index.INDEX_TYPES))
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+    rng = np.random.default_rng(0)
+
+    print(f"dim={args.dim} queries={args.queries} k={args.k} hnsw_m={config.pdf_hnsw_m} "
+          f"ef_search={config.pdf_hnsw_ef_search} nprobe={config.pdf_ivf_nprobe} pq_m={config.pdf_pq_m}")
+    print(f"{'chunks':>9} {'type':>6} {'faiss index':>14} {'build':>10} {'size':>11} {'query':>11} {'recall':>8}")
+    for size in args.sizes:
+        run(size, args.dim, args.queries, args.k, args.index_types, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,15 @@
 import streamlit as st
-import PyPDF2
 import io
 import json
 from PIL import Image
 import base64
 import re
-import tiktoken
 from datetime import datetime
 
-import config, case_file_requirements, preprocess_OF_tutorial, set_config, main_run_chatcfd, qa_modules
+import config, case_file_requirements, preprocess_OF_tutorial, set_config, main_run_chatcfd, qa_modules, token_accounting, llm_rate_limiter, pdf_ingest
 import pathlib
 import os
-from openai_client_factory import create_chat_client
+from openai_client_factory import get_chat_client
 
 
 general_prompt = ''
@@ -38,7 +36,7 @@ def _extract_json_dict(text: str):
 
 class ChatBot:
     def __init__(self):
-        self.client = create_chat_client("DEEPSEEK_R1")
+        self.client = get_chat_client("DEEPSEEK_R1")
         self.model_name = os.environ.get("DEEPSEEK_R1_MODEL_NAME")
         # self.system_prompt = """You are an intelligent assistant capable of:
         # 1. Maintaining politeness and professionalism
@@ -61,13 +59,10 @@ class ChatBot:
             "qa_history": []
         }
 
-    def process_pdf(self, pdf_file):
+    def process_pdf(self, pdf_path):
         try:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-            return text
+            # The parsed document is reused when the case run reads the same paper
+            return pdf_ingest.get_document(pdf_path).text
         except Exception as e:
             # return f"PDF processing error: {str(e)}"
             return f"PDF 处理出错：{str(e)}"
@@ -75,11 +70,18 @@ class ChatBot:
     def get_response(self, messages):
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "system", "content": self.system_prompt}] + messages,
-                temperature=self.temperature,
-                extra_body={"chat_template_kwargs": {"enable_thinking": False}},
+            request_messages = [{"role": "system", "content": self.system_prompt}] + messages
+            response = llm_rate_limiter.call_with_retry(
+                "DEEPSEEK_R1",
+                lambda deadline: self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=request_messages,
+                    temperature=self.temperature,
+                    extra_body={"chat_template_kwargs": {"enable_thinking": False}},
+                    timeout=llm_rate_limiter.remaining_timeout(deadline),
+                ),
+                lambda: token_accounting.count_message_tokens(request_messages, self.model_name),
+                lambda response: response.usage.total_tokens,
             )
             # Record token usage
             usage = response.usage
@@ -98,12 +100,7 @@ class ChatBot:
 
     def count_tokens(self, text: str, model: str = "gpt-4o") -> int:
         """Use tiktoken to count the number of tokens"""
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-            return len(encoding.encode(text))
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
-            return len(encoding.encode(text))
+        return token_accounting.count_tokens(text, model)
 
 def initialize_session_state():
     if "messages" not in st.session_state:
@@ -225,13 +222,13 @@ def main():
                         with open(file_path, "wb") as f:
                             f.write(uploaded_file.getbuffer())
 
-                        config.pdf_path =  f"{config.TEMP_PATH}/{uploaded_file.name}"
+                        config.pdf_path = str(file_path)
 
                     except Exception as e:
                         # st.error(f"Failed at processed the pdf file: {str(e)}") 
                         st.error(f"处理 PDF 文件失败：{str(e)}") 
 
-                    text_content = st.session_state.chatbot.process_pdf(uploaded_file)
+                    text_content = st.session_state.chatbot.process_pdf(config.pdf_path)
                     config.paper_content = text_content
                     # st.session_state.file_content = f"The  contents：\n{text_content}"
                     st.session_state.file_content = f"文档内容：\n{text_content}"
@@ -70,6 +70,13 @@ OUTPUT_PATH = None
 case_grid = None
 pdf_path = None
 
+LLM_CACHE_PATH = f'{Base_PATH}/llm_cache'
+LLM_CASSETTE_PATH = f'{Base_PATH}/llm_cassettes'
+QA_LOG_PATH = f'{Base_PATH}/qa_logs'
+PDF_CACHE_PATH = f'{Base_PATH}/pdf_cache'
+EMBEDDING_MODEL_PATH = f'{Base_PATH}/models'
+PAPER_LIBRARY_PATH = f'{Base_PATH}/paper_library'
+
 ensure_directory_exists(Database_OFv24_PATH)
 ensure_directory_exists(OUTPUT_CHATCFD_PATH)
 ensure_directory_exists(TEMP_PATH)
@@ -78,6 +85,8 @@ paper_case_number = None
 
 paper_content = " "
 paper_table = " "
+# paper_tables.TableIndex over paper_table: typed values by quantity, for lookups and prompt rows
+paper_table_index = None
 
 boundary_type_match = None
 
@@ -154,6 +163,14 @@ string_of_thermodynamic_model = ", ".join(thermodynamic_model_keywords)
 
 case_log_write = False
 
+# all_qa_logs.jsonl is appended to every log_flush_every entries or log_flush_interval seconds
+log_flush_every = 20
+log_flush_interval = 5.0
+# Entries waiting for the background log writer before add_log blocks
+log_queue_size = 1000
+# Full QA log bodies spilled under QA_LOG_PATH are removed after this many days
+log_spill_keep_days = 7
+
 flag_OF_tutorial_processed = False
 
 error_history = []
@@ -162,6 +179,101 @@ mesh_convert_success = False
 
 set_controlDict_time = False
 
+# Dense retrieval (see vector_index.py). pdf_chunk_d is the squared L2 distance cut-off of the "l2" metric,
+# pdf_chunk_min_similarity the cut-off of "cosine". For unit-length embeddings such as all-mpnet-base-v2
+# they are related by similarity = 1 - d / 2; a config file that only sets pdf_chunk_d gets the matching
+# similarity (see set_config.read_in_config)
 pdf_chunk_d = 1.5
-
-case_ic_bc_from_paper = ""
\ No newline at end of file
+pdf_vector_metric = "cosine"
+pdf_chunk_min_similarity = 0.25
+pdf_index_type = "flat"
+pdf_hnsw_m = 32
+pdf_hnsw_ef_construction = 80
+pdf_hnsw_ef_search = 64
+pdf_ivf_nlist = 0  # 0 = about 4 * sqrt(number of vectors)
+pdf_ivf_nprobe = 16
+pdf_pq_m = 48
+pdf_pq_nbits = 8
+
+# "hybrid" fuses BM25 and dense rankings (reciprocal rank fusion); "dense" uses only the dense threshold
+pdf_retrieval_mode = "hybrid"
+pdf_retrieval_candidates = 20
+pdf_rrf_k = 60
+# A BM25 hit alone makes a chunk eligible only if it scores this share of the maximum BM25 score of the
+# question, or for a prompt of one of its per-call values (see prompt_builder.retrieval_query)
+pdf_bm25_min_share = 0.25
+
+# CFDCaseExtractor.query_many merges questions with overlapping excerpts into one prompt up to these sizes
+pdf_merge_max_questions = 4
+pdf_merge_max_chunks = 6
+
+# Worker processes for CFDCaseExtractor.process_pdf page extraction (1 = extract in-process)
+pdf_extract_workers = min(os.cpu_count() or 1, 4)
+pdf_extract_min_pages_per_worker = 4
+# "heuristic" runs pdfplumber table extraction only on pages with ruling lines and a caption or enough rules; "all" on every page
+pdf_table_detection = "heuristic"
+
+# Papers with at least this many pages are streamed into the paper library (pdf_ingest.stream_pdf)
+pdf_stream_min_pages = 100
+# Memory budget of one streaming embedding batch, in bytes
+pdf_ingest_memory_budget = 256 * 1024 * 1024
+
+# On-disk cache of extracted paper text, tables and chunks (see pdf_cache.py)
+pdf_cache_enabled = True
+pdf_cache_max_bytes = 256 * 1024 * 1024
+
+# Answer paper questions from the persistent multi-paper library (see paper_library.py), scoped to the current paper
+paper_library_enabled = False
+
+# Sentence embedding model for paper retrieval (see embedder_registry.py)
+embedding_model_name = 'sentence-transformers/all-mpnet-base-v2'
+# "torch" (SentenceTransformer) or "onnx-int8" (quantized ONNX Runtime, CPU only; see onnx_embedder.py).
+# Check the int8 vectors against torch on your model with benchmarks/bench_embedding_backends.py before switching.
+embedding_backend = "torch"
+embedding_device = "cpu"
+# Never download the model; it must already be under EMBEDDING_MODEL_PATH
+embedding_local_only = True
+# torch intra-op threads for CPU inference (None = torch default)
+embedding_threads = None
+
+case_ic_bc_from_paper = ""
+
+# On-disk cache of LLM completions, used only by QA_NoContext_* objects created with use_cache=True
+# (the yes/no error classifications in file_corrector and conversation summaries)
+llm_cache_enabled = True
+llm_cache_max_bytes = 512 * 1024 * 1024
+llm_cache_max_age_days = 30
+
+# Pooled OpenAI-compatible HTTP clients (see openai_client_factory.get_chat_client)
+llm_pool_max_connections = 20
+llm_pool_max_keepalive = 10
+llm_pool_keepalive_expiry = 60.0
+llm_connect_timeout = 10.0
+llm_read_timeout = 600.0
+
+# Upper bound on concurrent requests for qa_modules.ask_many
+llm_max_concurrency = 8
+
+# Request a final usage chunk on streamed calls (disabled automatically if the endpoint rejects it)
+llm_stream_include_usage = True
+
+# Sliding context window for QA_Context_* conversations
+context_token_budget = 32000
+context_keep_recent_messages = 4
+
+# Rate limits per endpoint prefix, e.g. {"DEEPSEEK_R1": {"requests_per_minute": 60, "tokens_per_minute": 300000}};
+# endpoints without an entry are not throttled
+llm_rate_limits = {}
+llm_max_retries = 5
+llm_backoff_base = 1.0
+llm_backoff_max = 60.0
+# Seconds for a whole LLM call, including rate-limit waits, retries and backoff
+llm_call_deadline = 900.0
+
+# LLM transport: "live", "record", "replay" or "stub" (see llm_transport.py)
+llm_transport_mode = "live"
+llm_cassette_path = f'{LLM_CASSETTE_PATH}/cassette.jsonl'
+llm_replay_latency = 0.0
+llm_replay_chunk_latency = 0.0
+llm_stub_port = 0
+llm_stub_replies_path = None
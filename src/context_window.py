@@ -0,0 +1,90 @@
+"""Token-budgeted sliding context window for multi-turn QA conversations."""
+import config
+import token_accounting
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+class ConversationWindow:
+    """Keeps a conversation within a token budget.
+
+    Pinned messages (e.g. system prompts) are always sent. The most recent
+    messages are sent verbatim; once the budget is exceeded, the oldest
+    unpinned messages are folded into a running summary produced by
+    `summarize(previous_summary, messages) -> str`. The summary is cached and
+    only extended when more messages fall out of the window, so a long
+    conversation costs one summarization call every few turns rather than
+    one per turn. If summarizing fails, the oldest messages are left out of
+    that request but kept in the history, so the next build retries.
+    """
+
+    def __init__(self, summarize=None, token_budget=None, keep_recent_messages=None, model_name=None):
+        self.summarize = summarize
+        self.token_budget = token_budget or config.context_token_budget
+        self.keep_recent_messages = keep_recent_messages or config.context_keep_recent_messages
+        self.model_name = model_name
+        self.pinned: list[dict[str, str]] = []
+        self.history: list[dict[str, str]] = []
+        self.summary = ""
+        self.summarized_count = 0
+
+    def _tokens(self, messages):
+        return sum(
+            token_accounting.TOKENS_PER_MESSAGE + token_accounting.count_tokens(m["content"], self.model_name)
+            for m in messages
+        )
+
+    def pin(self, content, role="system"):
+        self.pinned.append({"role": role, "content": content})
+
+    def append(self, role, content):
+        self.history.append({"role": role, "content": content})
+
+    def _summary_messages(self):
+        if not self.summary:
+            return []
+        return [{"role": "system", "content": SUMMARY_PREFIX + self.summary}]
+
+    def build(self):
+        """Return `(messages, dropped_tokens)` for the next request.
+
+        `dropped_tokens` is the number of history tokens that are not sent
+        verbatim, net of the summary that replaces them.
+        """
+        recent = self.history[self.summarized_count:]
+        fixed_tokens = self._tokens(self.pinned)
+
+        if fixed_tokens + self._tokens(self._summary_messages()) + self._tokens(recent) > self.token_budget:
+            left_out = self._fold_into_summary(recent, fixed_tokens)
+            recent = self.history[self.summarized_count + left_out:]
+
+        summary_messages = self._summary_messages()
+        dropped_tokens = max(
+            self._tokens(self.history[:len(self.history) - len(recent)]) - self._tokens(summary_messages), 0
+        )
+        return self.pinned + summary_messages + recent, dropped_tokens
+
+    def _fold_into_summary(self, recent, fixed_tokens):
+        """Fold the oldest of `recent` into the summary; returns how many to leave out unsummarized."""
+        # Shrink to half the budget so that the summary is not rebuilt on every turn
+        target = max(self.token_budget // 2 - fixed_tokens, 0)
+        keep = len(recent)
+        kept_tokens = self._tokens(recent)
+        while keep > self.keep_recent_messages and kept_tokens > target:
+            kept_tokens -= self._tokens([recent[len(recent) - keep]])
+            keep -= 1
+
+        fold = recent[:len(recent) - keep]
+        if not fold:
+            return 0
+
+        if self.summarize is not None:
+            try:
+                self.summary = self.summarize(self.summary, fold)
+            except Exception as e:
+                # Keep the turns for the next summary attempt; this request only sends the recent ones
+                print(f"Failed to summarize earlier conversation turns: {e}; "
+                      f"leaving {len(fold)} messages out of this request")
+                return len(fold)
+        self.summarized_count += len(fold)
+        return 0
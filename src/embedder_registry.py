@@ -0,0 +1,113 @@
+"""Process-wide registry of sentence embedders.
+
+Models are loaded lazily, once per (model, backend, device), from a local
+directory: `config.EMBEDDING_MODEL_PATH/<model name>` (see
+test_env/download_model.py) or otherwise the Hugging Face cache. With
+`config.embedding_local_only` set, nothing is downloaded.
+
+`config.embedding_backend` selects "torch" (SentenceTransformer) or
+"onnx-int8" (onnx_embedder.OnnxSentenceEmbedder, exported on first use).
+"""
+import os
+import threading
+
+import config
+
+_embedders = {}
+_lock = threading.Lock()
+_threads_configured = False
+
+
+def local_model_dir(model_name):
+    """Local directory for `model_name`, or None if it has not been downloaded there."""
+    if os.path.isdir(model_name):
+        return model_name
+    for candidate in (model_name, model_name.split("/")[-1], model_name.replace("/", "_")):
+        path = os.path.join(config.EMBEDDING_MODEL_PATH, candidate)
+        if os.path.isfile(os.path.join(path, "modules.json")) or os.path.isfile(os.path.join(path, "config.json")):
+            return path
+    return None
+
+
+def resolve_model_dir(model_name):
+    """Local directory of a downloaded model, including models that are only in the Hugging Face cache."""
+    local_dir = local_model_dir(model_name)
+    if local_dir:
+        return local_dir
+    from huggingface_hub import snapshot_download
+    return snapshot_download(model_name, local_files_only=True)
+
+
+def embedding_id(model_name=None):
+    """Identity of the vectors an embedder produces; backends give (slightly) different vectors."""
+    model_name = model_name or config.embedding_model_name
+    if config.embedding_backend == "torch":
+        return model_name
+    return f"{model_name}#{config.embedding_backend}"
+
+
+def _load_onnx(model_name):
+    import onnx_embedder
+
+    onnx_dir = onnx_embedder.onnx_model_dir(model_name)
+    if not os.path.isfile(os.path.join(onnx_dir, onnx_embedder.QUANTIZED_MODEL)):
+        print(f"Exporting an int8 ONNX copy of {model_name} to {onnx_dir} (one-off).")
+        onnx_embedder.export_quantized(resolve_model_dir(model_name), onnx_dir)
+    return onnx_embedder.OnnxSentenceEmbedder(onnx_dir, threads=config.embedding_threads)
+
+
+def _configure_threads():
+    global _threads_configured
+    if _threads_configured or not config.embedding_threads:
+        return
+    import torch
+    torch.set_num_threads(config.embedding_threads)
+    _threads_configured = True
+
+
+def _load(model_name, device):
+    if config.embedding_backend == "onnx-int8":
+        return _load_onnx(model_name)
+    if config.embedding_backend != "torch":
+        raise ValueError(f"Unknown embedding backend '{config.embedding_backend}', expected 'torch' or 'onnx-int8'")
+
+    from sentence_transformers import SentenceTransformer
+
+    _configure_threads()
+    local_dir = local_model_dir(model_name)
+    if local_dir:
+        return SentenceTransformer(local_dir, device=device, local_files_only=True)
+
+    try:
+        # Hugging Face cache (e.g. populated by test_env/download_model.py before the local directory existed)
+        return SentenceTransformer(model_name, device=device, local_files_only=True)
+    except OSError:
+        if config.embedding_local_only:
+            raise OSError(
+                f"Embedding model '{model_name}' is not available locally. Run test_env/download_model.py, "
+                f"copy it to {config.EMBEDDING_MODEL_PATH}, or set embedding_local_only to false for one run."
+            )
+
+    return SentenceTransformer(model_name, device=device, cache_folder=config.EMBEDDING_MODEL_PATH)
+
+
+def get_embedder(model_name=None):
+    """The shared SentenceTransformer for `model_name` (default: config.embedding_model_name)."""
+    model_name = model_name or config.embedding_model_name
+    key = (model_name, config.embedding_backend, config.embedding_device)
+
+    embedder = _embedders.get(key)
+    if embedder is not None:
+        return embedder
+
+    with _lock:
+        embedder = _embedders.get(key)
+        if embedder is None:
+            embedder = _embedders[key] = _load(model_name, config.embedding_device)
+    return embedder
+
+
+def clear():
+    """Drop all loaded models (e.g. after changing the embedding settings)."""
+    with _lock:
+        _embedders.clear()
@@ -3,7 +3,9 @@ import shutil
 import os
 import file_writer
 
-from qa_modules import QA_NoContext_deepseek_V3,QA_NoContext_deepseek_R1
+from qa_modules import QA_NoContext_deepseek_V3,QA_NoContext_deepseek_R1, ask_many, GlobalLogManager
+import openfoam_error_rules
+from prompt_builder import PromptBuilder
 import json
 import re
 import random
@@ -86,10 +88,22 @@ def list_case_file(case_path):
                 file_list.append(rel_path)
     return file_list
 
+def _rule_verdict(verdict):
+    """Count whether the local OpenFOAM error rules answered or the LLM is needed."""
+    if verdict is None:
+        GlobalLogManager.increment_metric("error_rules_llm_fallbacks")
+    else:
+        GlobalLogManager.increment_metric("error_rules_hits")
+    return verdict
+
 def identify_error_to_add_new_file(running_error):
 
-    analyze_error_to_add_new_file = f'''{config.general_prompts}. OpenFOAM File Requirement Analyzer
-        Analyze the runtime error {running_error} to:
+    local_answer = _rule_verdict(openfoam_error_rules.missing_file(running_error, config.OUTPUT_PATH))
+    if local_answer is not None:
+        return local_answer
+
+    analyze_error_to_add_new_file = PromptBuilder().stable(f'''{config.general_prompts}. OpenFOAM File Requirement Analyzer
+        Analyze the runtime error given at the end of this prompt to:
 
         1. Check if it contains the exact phrase "cannot find file"
         2. If present:
@@ -111,9 +125,9 @@ Examples of valid responses:
 system/fvSchemes
 constant/g
 no
-'''
+''').volatile("Runtime error", running_error).build()
 
-    qa = QA_NoContext_deepseek_V3()
+    qa = QA_NoContext_deepseek_V3(use_cache=True)
 
     answer = qa.ask(analyze_error_to_add_new_file)
 
@@ -166,14 +180,14 @@ def add_new_file(file_name):
 
     other_case_file_content = read_files_to_dict(config.OUTPUT_PATH)
 
-    add_new_file_prompt = f'''
-    A new case file {file_name} must be add to the OpenFOAM case dir. The file contents of other case files are: {other_case_file_content}. Please respond the file contents for the new file which can make this case run correctly with other case files. Ensure the dimension is correct if the dimension shows in the file content.
+    add_new_file_prompt = PromptBuilder().stable('''
+    A new case file (named at the end of this prompt) must be add to the OpenFOAM case dir. The file contents of other case files are also given at the end of this prompt. Please respond the file contents for the new file which can make this case run correctly with other case files. Ensure the dimension is correct if the dimension shows in the file content.
 
     In your response: Absolutely AVOID any elements including but not limited to:
     - Markdown code block markers (``` or  ```)
     - Extra comments or explanations
     - Unnecessary empty lines or indentation
-    '''
+    ''').volatile("The file contents of other case files", other_case_file_content).volatile("The new case file", file_name).build()
 
     qa = QA_NoContext_deepseek_R1()
 
@@ -191,14 +205,14 @@ def identify_file_name_from_error(running_error):
 
     case_files = list_case_file(config.OUTPUT_PATH)
 
-    analyze_running_error_prompt = f'''
-    Analyze the provided OpenFOAM runtime error { {running_error} } to identify the file requires revision. The result must be one of the following files: { {case_files} }. You response must only include the case name.
+    analyze_running_error_prompt = PromptBuilder().stable('''
+    Analyze the provided OpenFOAM runtime error to identify the file requires revision. The result must be one of the case files listed below. You response must only include the case name.
 
     In your response: Absolutely AVOID any elements including but not limited to:
     - Markdown code block markers (``` or ```)
     - Extra comments or explanations
     - Unnecessary empty lines or indentation
-    '''
+    ''').volatile("Case files", case_files).volatile("Runtime error", running_error).build()
     
     qa = QA_NoContext_deepseek_R1()
 
@@ -265,17 +279,17 @@ def analyze_running_error_with_all_case_file_content(running_error):
 
     case_files = dict_to_json_string(case_files)
 
-    analyze_running_error_prompt = f'''
-    Analyze the provided OpenFOAM runtime error { {running_error} } to identify the root cause and which case file needs to be revised to fix the runtime error. The OpenFOAM case files are given as json-format string as { {all_case_file_content} }. 
+    analyze_running_error_prompt = PromptBuilder().stable('''
+    Analyze the provided OpenFOAM runtime error to identify the root cause and which case file needs to be revised to fix the runtime error. The OpenFOAM case files are given below as json-format string. 
     Your response must be a json format string with following keys and values:
-    - a 'wrong_file' key, and its value the file name which will be revised to fix the error. This file name must be one of the case files { {case_files} }.
+    - a 'wrong_file' key, and its value the file name which will be revised to fix the error. This file name must be one of the listed case files.
     - a 'advices_for_revision' key, and its value provide a step-by-step fix of the 'wrong_file' to fix the error. Ensure the advice addresses the error’s technical cause (e.g., CFL violation, invalid discretization scheme, missing required keyword). The advice must be a string.
 
     In your JSON response: Absolutely AVOID any elements including but not limited to:
     - Markdown code block markers (``` or ```)
     - Extra comments or explanations
     - Unnecessary empty lines or indentation
-    '''
+    ''').volatile("Case files", case_files).volatile("OpenFOAM case file contents", all_case_file_content).volatile("Runtime error", running_error).build()
     
     qa = QA_NoContext_deepseek_R1()
 
@@ -299,8 +313,8 @@ def analyze_running_error_2(running_error, file_name):
 
     case_files = list_case_file(config.OUTPUT_PATH)
 
-    analyze_running_error_prompt = f'''
-    Analyze the provided OpenFOAM runtime error {running_error} to identify the root cause. Give advice on correcting the file {file_name} with the file contents as {file_content}.
+    analyze_running_error_prompt = PromptBuilder().stable('''
+    Analyze the provided OpenFOAM runtime error to identify the root cause. Give advice on correcting the case file given below.
 
     In your response: Provide a step-by-step fix (e.g., adjust endTime, modify tolerance in solver settings, correct boundary type in U). Ensure the advice addresses the error’s technical cause (e.g., CFL violation, invalid discretization scheme, missing required keyword). The advice must be a string.
 
@@ -308,7 +322,7 @@ def analyze_running_error_2(running_error, file_name):
     - Markdown code block markers (``` or ```)
     - Extra comments or explanations
     - Unnecessary empty lines or indentation
-    '''
+    ''').volatile("File name", file_name).volatile("File contents", file_content).volatile("Runtime error", running_error).build()
     
     qa = QA_NoContext_deepseek_R1()
 
@@ -325,11 +339,15 @@ def analyze_error_repetition(error_history):
         error_minus_2 = error_history[-2]
         error_minus_3 = error_history[-3]
 
-        analyze_running_error_repetition_prompt = f'''
-        Analyze the following three error histories to identify whether the error have repetitively shown three time. Error 1: {error_minus_1}. Error 2: {error_minus_2}. Error 3: {error_minus_3}. If the error have repetitively shown three times, respond 'yes'; otherwise, respond 'no'. You must only respond 'yes' or 'no'.
-        '''
+        local_answer = _rule_verdict(openfoam_error_rules.errors_repeated([error_minus_1, error_minus_2, error_minus_3]))
+        if local_answer is not None:
+            return local_answer
 
-        qa = QA_NoContext_deepseek_R1()
+        analyze_running_error_repetition_prompt = PromptBuilder().stable('''
+        Analyze the following three error histories to identify whether the error have repetitively shown three time. If the error have repetitively shown three times, respond 'yes'; otherwise, respond 'no'. You must only respond 'yes' or 'no'.
+        ''').volatile("Error 1", error_minus_1).volatile("Error 2", error_minus_2).volatile("Error 3", error_minus_3).build()
+
+        qa = QA_NoContext_deepseek_R1(use_cache=True)
 
         answer = qa.ask(analyze_running_error_repetition_prompt)
 
@@ -350,13 +368,13 @@ def rewrite_file(file_name, reference_files):
     with open(file_path, "r", encoding="utf-8") as file:
         file_content = file.read()
 
-    correct_file_prompt = f'''{config.general_prompts}
-    Please rewrite the {file_name} file for the OpenFOAM case. The original file content is: {file_content}. You can reference these files from OpenFOAM tutorial {reference_files} for formating and key values. Ensure the dimension is correct if the dimension shows in the file content.
+    correct_file_prompt = PromptBuilder().stable(f'''{config.general_prompts}
+    Please rewrite the OpenFOAM case file given at the end of this prompt. You can reference the files from OpenFOAM tutorial given below for formating and key values. Ensure the dimension is correct if the dimension shows in the file content.
 
     In your response: Absolutely AVOID any elements including but not limited to:
     - Markdown code block markers (``` or  ```)
     - Extra comments or explanations
-    '''
+    ''').stable(f"Reference files from OpenFOAM tutorial: [[[ {reference_files} ]]]").volatile("File name", file_name).volatile("The original file content", file_content).build()
 
     qa = QA_NoContext_deepseek_V3()
 
@@ -374,15 +392,19 @@ def rewrite_file(file_name, reference_files):
         file_write_successful = True
 
 def detect_dimension_error(running_error):
+
+    local_answer = _rule_verdict(openfoam_error_rules.is_dimension_error(running_error))
+    if local_answer is not None:
+        return local_answer
     
-    detect_dimension_error = f'''{config.general_prompts}\nAnalyze the OpenFOAM runtime error {running_error} to determine if it explicitly indicates a dimensional inequality. Look for patterns such as:
+    detect_dimension_error = PromptBuilder().stable(f'''{config.general_prompts}\nAnalyze the OpenFOAM runtime error given at the end of this prompt to determine if it explicitly indicates a dimensional inequality. Look for patterns such as:
 
     - Imbalanced dimension comparisons (e.g., [dim1] != [dim2], a != b where a and b - are dimensions).
     - Keywords like dimensions, incompatible dimensions, or dimension mismatch.
     - Explicit dimension lists (e.g., [0 0 0 -1 0 0 0] != [0 0 0 -2 0 0 0])
-    If the error directly references dimensional inequality (as defined above), respond 'yes'. If not, or if the error is unrelated (e.g., syntax, segmentation faults, solver crashes), respond 'no'. Only reply with 'yes' or 'no'.'''
+    If the error directly references dimensional inequality (as defined above), respond 'yes'. If not, or if the error is unrelated (e.g., syntax, segmentation faults, solver crashes), respond 'no'. Only reply with 'yes' or 'no'.''').volatile("Runtime error", running_error).build()
 
-    qa = QA_NoContext_deepseek_V3()
+    qa = QA_NoContext_deepseek_V3(use_cache=True)
 
     answer = qa.ask(detect_dimension_error)
 
@@ -401,32 +423,36 @@ def strongly_correct_all_dimension_with_reference_files():
 
     folder_path = Path(case_0_folder)
 
+    # Build one prompt per field file first; the LLM calls are independent and run concurrently
+    field_paths = []
+    correct_dimension_prompts = []
+
     for file_path in folder_path.iterdir():
         file_content = None
         file_name = f'0/{file_path.name}'
 
         reference_files = find_reference_files_by_solver(file_name)
 
-        if file_path.is_file():
-            field_file = f'{case_0_folder}/{file_path.name}'
-
         with open(file_path, "r", encoding="utf-8") as file:
             file_content = file.read()
-            a = 1
 
-        correct_dimension_prompt =   f'''{config.general_prompts}
-        Please check the dimension of the OpenFOAM field file {file_path.name} and correct it according to the dimensions of the reference file contents. The original file content is: {file_content}. The reference file contents are: {reference_files}. You must not revise any other contents of the original file except for the dimension.
+        correct_dimension_prompt = PromptBuilder().stable(f'''{config.general_prompts}
+        Please check the dimension of the OpenFOAM field file given at the end of this prompt and correct it according to the dimensions of the reference file contents. You must not revise any other contents of the original file except for the dimension.
 
         In your response: Absolutely AVOID any elements including but not limited to:
         - Markdown code block markers (``` or  ```)
         - Extra comments or explanations
         - Unnecessary empty lines or indentation
-        '''
+        ''').stable(f"The reference file contents: [[[ {reference_files} ]]]").volatile("Field file", file_path.name).volatile("The original file content", file_content).build()
+
+        field_paths.append(file_path)
+        correct_dimension_prompts.append(correct_dimension_prompt)
 
-        qa = QA_NoContext_deepseek_V3()
+    qa = QA_NoContext_deepseek_V3()
 
-        answer = qa.ask(correct_dimension_prompt)
+    answers = ask_many(qa, correct_dimension_prompts)
 
+    for file_path, answer in zip(field_paths, answers):
         answer = file_writer.extract_pure_response(answer)
 
         try:
@@ -449,8 +475,8 @@ def analyze_running_error_with_reference_files(running_error, file_name,early_re
 
     case_files = list_case_file(config.OUTPUT_PATH)
 
-    analyze_running_error_prompt = f'''
-    Analyze the provided OpenFOAM runtime error [[[ {running_error} ]]] to identify the root cause. Give advice on correcting the file { {file_name} } with the file contents as [[[ {file_content} ]]]. The revision must not alter the file to voilate these initial and boundary conditions in the paper [[[ {config.case_ic_bc_from_paper} ]]]. You can refer to these files from OpenFOAM tutorial [[[ {reference_files} ]]] to improve the correction advice.
+    analyze_running_error_prompt = PromptBuilder().stable('''
+    Analyze the provided OpenFOAM runtime error to identify the root cause. Give advice on correcting the case file given at the end of this prompt. The revision must not alter the file to voilate the initial and boundary conditions in the paper. You can refer to the files from OpenFOAM tutorial to improve the correction advice.
 
     In your response: Provide a step-by-step fix. Ensure the advice addresses the error's technical cause. The advice must be a string.
 
@@ -458,7 +484,9 @@ def analyze_running_error_with_reference_files(running_error, file_name,early_re
     - Markdown code block markers (``` or ```)
     - Extra comments or explanations
     - Unnecessary empty lines or indentation
-    '''
+    ''').stable(f"Initial and boundary conditions in the paper: [[[ {config.case_ic_bc_from_paper} ]]]").stable(f"Files from OpenFOAM tutorial: [[[ {reference_files} ]]]")
+
+    analyze_running_error_prompt = analyze_running_error_prompt.volatile("File name", file_name).volatile("File contents", file_content).volatile("Runtime error", running_error).build()
     
     qa = QA_NoContext_deepseek_R1()
 
@@ -478,13 +506,13 @@ def single_file_corrector2(file_name, advices_for_revision, reference_files):
     with open(file_path, "r", encoding="utf-8") as file:
         file_content = file.read()
 
-    correct_file_prompt = f'''{config.general_prompts} Correct the OpenFOAM case file.
-    Please correct the { {file_name} } file with file contents as { {file_content} } to strictly adhere to the following correction advice { {advices_for_revision} }. Ensure the dimension in [] is correct if the dimension shows in the file content. You must not change any other contents of the file except for the correction advice or dimension in [].
+    correct_file_prompt = PromptBuilder().stable(f'''{config.general_prompts} Correct the OpenFOAM case file.
+    Please correct the case file given at the end of this prompt to strictly adhere to the correction advice given below. Ensure the dimension in [] is correct if the dimension shows in the file content. You must not change any other contents of the file except for the correction advice or dimension in [].
 
     In your final response after "Here is my response:", absolutely AVOID any elements including but not limited to:
     - Markdown code block markers (``` or  ```)
     - Extra comments or explanations
-    '''
+    ''').volatile("File name", file_name).volatile("File contents", file_content).volatile("Correction advice", advices_for_revision).build()
 
     #     # You can reference these files from OpenFOAM tutorial { {reference_files} } for formatting.
 
@@ -511,30 +539,34 @@ def ensure_all_field_file_dimensions():
 
     folder_path = Path(case_0_folder)
 
+    field_paths = []
+    correct_dimension_prompts = []
+
     for file_path in folder_path.iterdir():
         file_content = None
-        if file_path.is_file():
-            field_file = f'{case_0_folder}/{file_path.name}'
 
         with open(file_path, "r", encoding="utf-8") as file:
             file_content = file.read()
-            a = 1
 
         # reference_files = find_reference_files_by_solver(field_file)
 
-        correct_dimension_prompt =   f'''{config.general_prompts}
-        Please check the dimension of the OpenFOAM field file {file_path.name} and correct it if the dimension is incorrect. The file content is: {file_content}.
+        correct_dimension_prompt = PromptBuilder().stable(f'''{config.general_prompts}
+        Please check the dimension of the OpenFOAM field file given at the end of this prompt and correct it if the dimension is incorrect.
 
         In your response: Absolutely AVOID any elements including but not limited to:
         - Markdown code block markers (``` or  ```)
         - Extra comments or explanations
         - Unnecessary empty lines or indentation
-        '''
+        ''').volatile("Field file", file_path.name).volatile("The file content", file_content).build()
+
+        field_paths.append(file_path)
+        correct_dimension_prompts.append(correct_dimension_prompt)
 
-        qa = QA_NoContext_deepseek_V3()
+    qa = QA_NoContext_deepseek_V3()
 
-        answer = qa.ask(correct_dimension_prompt)
+    answers = ask_many(qa, correct_dimension_prompts)
 
+    for file_path, answer in zip(field_paths, answers):
         answer = file_writer.extract_pure_response(answer)
 
         try:
@@ -544,4 +576,4 @@ def ensure_all_field_file_dimensions():
         except Exception as e:
             print(f"Errors occur during write_field_to_file: {e}")
         else: # Successfully executed the field file write operation
-            file_write_successful = True
+            file_write_successful = True
\ No newline at end of file
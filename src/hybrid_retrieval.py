@@ -0,0 +1,125 @@
+"""Lexical (BM25) retrieval over paper chunks and rank fusion with dense results.
+
+Dense embeddings miss exact numbers, units and symbols ("Re = 6e6",
+"inlet velocity 51.4 m/s"), while BM25 misses paraphrases; reciprocal rank
+fusion combines both rankings without having to calibrate their scores.
+
+A lexical hit only makes a chunk eligible on its own when it matches a
+large enough share of the query's BM25 weight (`min_share`); otherwise a
+question that shares nothing but common words with the paper would always
+get `top_k` chunks, whatever the dense threshold says. A query made of
+independent parts (the per-call values of a setup prompt) is searched part
+by part (`search_segments`), as a long query rarely reaches that share in
+any one chunk.
+"""
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+# Words (optionally joined by - or /, e.g. k-omega, m/s) and numbers (1.5, 6e6, 10^5 -> 10, 5)
+_TOKEN = re.compile(r"[a-z]+(?:[-/][a-z0-9]+)*|\d+(?:\.\d+)?(?:e[-+]?\d+)?")
+
+# Function words and question words; single letters are kept as they are often symbols (k, u, p)
+STOPWORDS = frozenset("""
+    about above after again all also am an and any are as at be been before being below between both but by
+    can could did do does doing done during each else for from further had has have having he her here hers
+    him his how however i if in into is it its itself just may me might more most must my no nor not now of
+    off on once only or other our ours out over own same shall she should so some such than that the their
+    theirs them then there these they this those through thus to too under until up upon us very was we were
+    what when where whether which while who whom whose why will with within without would you your yours
+""".split())
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = [Counter(tokenize(doc)) for doc in documents]
+        self.doc_lengths = np.array([sum(tf.values()) for tf in self.term_frequencies], dtype='float32')
+        self.avg_doc_length = float(self.doc_lengths.mean()) if len(documents) else 0.0
+
+        # term -> (document indices, term counts)
+        postings = {}
+        for doc_id, tf in enumerate(self.term_frequencies):
+            for term, count in tf.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(doc_id)
+                postings[term][1].append(count)
+        self.postings = {
+            term: (np.array(ids, dtype='int64'), np.array(counts, dtype='float32'))
+            for term, (ids, counts) in postings.items()
+        }
+        n = len(documents)
+        self.idf = {
+            term: math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            for term, (ids, _) in self.postings.items()
+        }
+        # idf of a term that occurs in no document
+        self.unseen_idf = math.log(1 + (n + 0.5) / 0.5)
+
+    def __len__(self):
+        return len(self.term_frequencies)
+
+    def scores(self, query):
+        scores = np.zeros(len(self), dtype='float32')
+        if not len(self):
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            ids, counts = self.postings[term]
+            scores[ids] += self.idf[term] * counts * (self.k1 + 1) / (counts + norm[ids])
+        return scores
+
+    def max_score(self, query):
+        """Upper bound of `scores(query)`: every query term saturated in one document."""
+        return sum(self.idf.get(term, self.unseen_idf) for term in set(tokenize(query))) * (self.k1 + 1)
+
+    def search(self, query, top_k, min_share=0.0):
+        """(indices, scores) of the best `top_k` documents with a non-zero score.
+
+        With `min_share`, only documents scoring at least that fraction of
+        `max_score(query)` are returned.
+        """
+        scores = self.scores(query)
+        floor = min_share * self.max_score(query)
+        candidates = np.flatnonzero((scores > 0) & (scores >= floor))
+        order = candidates[np.argsort(-scores[candidates], kind="stable")][:top_k]
+        return order.tolist(), scores[order].tolist()
+
+
+    def search_segments(self, segments, top_k, min_share=0.0):
+        """Indices of the best `top_k` documents for a query made of `segments`, each searched on its own.
+
+        Each segment must reach `min_share` of its own weight; the per-segment rankings are fused by RRF.
+        """
+        rankings = [self.search(segment, top_k, min_share=min_share)[0] for segment in segments]
+        if len(rankings) == 1:
+            return rankings[0]
+        return reciprocal_rank_fusion(rankings)[:top_k]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked lists of ids: score(id) = sum over lists of 1 / (k + rank)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=lambda item: (-fused[item], item))
+
+
+def fuse(dense_ranking, lexical_ranking, relevant, top_k, k=60):
+    """Best `top_k` ids of the fused ranking that are `relevant` dense hits or in `lexical_ranking`.
+
+    `lexical_ranking` should hold confident BM25 hits only (see `BM25Index.search(min_share=...)`).
+    """
+    eligible = set(relevant) | set(lexical_ranking)
+    fused = reciprocal_rank_fusion([dense_ranking, lexical_ranking], k=k)
+    return [item for item in fused if item in eligible][:top_k]
@@ -0,0 +1,276 @@
+"""Shared rate limiting, retry and deadline handling for LLM endpoints.
+
+Each endpoint prefix (DEEPSEEK_V3 / DEEPSEEK_R1) gets a limiter with two
+token buckets, one for requests/min and one for tokens/min, configured via
+`config.llm_rate_limits`. Requests reserve capacity before they are sent and
+wait if the bucket is empty. A 429 drains both buckets for the Retry-After
+period, so concurrent callers back off together. Retryable errors are
+retried with jittered exponential backoff. Every call, including its
+throttling waits, retries and backoff, runs under one deadline
+(`config.llm_call_deadline`); once it has passed, or a wait would pass it,
+the call fails with `LLMDeadlineExceeded` and is not retried.
+"""
+import asyncio
+import random
+import threading
+import time
+
+import openai
+
+import config
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """Raised when an LLM call (including a slow stream) runs past its deadline."""
+
+
+_metrics: dict[str, float] = {}
+_metrics_lock = threading.Lock()
+
+
+def _record(name, amount=1):
+    with _metrics_lock:
+        _metrics[name] = _metrics.get(name, 0) + amount
+
+
+def get_metrics() -> dict[str, float]:
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `rate_per_minute` of 0 or None disables it."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute or 0)
+        self.refill_per_second = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def reserve(self, amount) -> float:
+        """Take `amount` from the bucket and return how long the caller must wait."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            # A single request larger than the bucket still goes through once the bucket is full
+            amount = min(amount, self.capacity)
+            self.level -= amount
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.refill_per_second
+
+    def adjust(self, amount):
+        """Debit (positive) or credit (negative) `amount` after the fact."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level -= amount
+
+    def drain(self, seconds):
+        """Make the bucket empty for the next `seconds`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level = min(self.level, -seconds * self.refill_per_second)
+
+
+class EndpointLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def reserve(self, estimated_tokens) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def penalize(self, retry_after):
+        self.requests.drain(retry_after)
+        self.tokens.drain(retry_after)
+
+
+_limiters: dict[str, EndpointLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(prefix) -> EndpointLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get(prefix)
+        if limiter is None:
+            limits = config.llm_rate_limits.get(prefix, {})
+            limiter = EndpointLimiter(
+                requests_per_minute=limits.get("requests_per_minute"),
+                tokens_per_minute=limits.get("tokens_per_minute"),
+            )
+            _limiters[prefix] = limiter
+        return limiter
+
+
+def backoff_delay(attempt) -> float:
+    """Exponential backoff with full jitter."""
+    cap = min(config.llm_backoff_max, config.llm_backoff_base * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+def _retry_after(error) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _deadline_exceeded():
+    return LLMDeadlineExceeded(f"LLM call exceeded its {config.llm_call_deadline}s deadline")
+
+
+def check_deadline(deadline):
+    if time.monotonic() > deadline:
+        raise _deadline_exceeded()
+
+
+def remaining_timeout(deadline) -> float:
+    """Per-request HTTP timeout: never longer than the time left before `deadline`."""
+    return max(min(config.llm_read_timeout, deadline - time.monotonic()), 0.1)
+
+
+def _record_timeout(prefix):
+    _record(f"{prefix}.errors")
+    _record(f"{prefix}.timeouts")
+
+
+def _handle_failure(prefix, limiter, error, attempt, deadline):
+    """Record a failed attempt and return the delay before retrying, or None to give up."""
+    _record(f"{prefix}.errors")
+    if isinstance(error, openai.APITimeoutError):
+        _record(f"{prefix}.timeouts")
+    if attempt >= config.llm_max_retries:
+        return None
+
+    delay = backoff_delay(attempt)
+    if isinstance(error, openai.RateLimitError):
+        _record(f"{prefix}.rate_limited")
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            limiter.penalize(retry_after)
+            delay = max(delay, retry_after)
+    if time.monotonic() + delay >= deadline:
+        # The retry could not start before the call's deadline
+        return None
+    _record(f"{prefix}.retries")
+    _record(f"{prefix}.backoff_seconds", delay)
+    print(f"LLM call to {prefix} failed ({type(error).__name__}: {error}), retrying in {delay:.1f}s")
+    return delay
+
+
+def _throttle_wait(prefix, limiter, estimated_tokens, deadline):
+    """Reserve capacity and return how long to wait for it; raise if the wait would pass `deadline`."""
+    wait = limiter.reserve(estimated_tokens)
+    if wait > 0:
+        if time.monotonic() + wait >= deadline:
+            _record_timeout(prefix)
+            raise _deadline_exceeded()
+        _record(f"{prefix}.throttled_seconds", wait)
+    return wait
+
+
+def _estimate(limiter, estimated_tokens):
+    # Only pay for the prompt token estimate when a tokens/min limit is configured
+    if not limiter.tokens.enabled:
+        return 0
+    return estimated_tokens() if callable(estimated_tokens) else estimated_tokens
+
+
+def call_with_retry(prefix, request, estimated_tokens=0, actual_tokens=None):
+    """Run `request(deadline)` under the endpoint's rate limits, with retries.
+
+    `estimated_tokens` may be a number or a callable that is only evaluated
+    when the endpoint has a tokens/min limit. `actual_tokens(result)`, if
+    given, reports the real token usage so the tokens/min bucket can be
+    corrected after the call. `deadline` is the same for every attempt.
+    """
+    limiter = get_limiter(prefix)
+    estimated_tokens = _estimate(limiter, estimated_tokens)
+    deadline = time.monotonic() + config.llm_call_deadline
+    attempt = 0
+    while True:
+        wait = _throttle_wait(prefix, limiter, estimated_tokens, deadline)
+        if wait > 0:
+            time.sleep(wait)
+
+        _record(f"{prefix}.requests")
+        try:
+            result = request(deadline)
+        except LLMDeadlineExceeded:
+            # The deadline covers the whole call, so there is no time left to retry
+            _record_timeout(prefix)
+            raise
+        except RETRYABLE_ERRORS as e:
+            delay = _handle_failure(prefix, limiter, e, attempt, deadline)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        if actual_tokens is not None and limiter.tokens.enabled:
+            limiter.record_usage(estimated_tokens, actual_tokens(result))
+        return result
+
+
+async def call_with_retry_async(prefix, request, estimated_tokens=0, actual_tokens=None):
+    """Async counterpart of `call_with_retry`; `request(deadline)` is a coroutine function."""
+    limiter = get_limiter(prefix)
+    estimated_tokens = _estimate(limiter, estimated_tokens)
+    deadline = time.monotonic() + config.llm_call_deadline
+    attempt = 0
+    while True:
+        wait = _throttle_wait(prefix, limiter, estimated_tokens, deadline)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        _record(f"{prefix}.requests")
+        try:
+            try:
+                result = await asyncio.wait_for(request(deadline), timeout=max(deadline - time.monotonic(), 0))
+            except LLMDeadlineExceeded:
+                raise
+            except asyncio.TimeoutError:
+                raise _deadline_exceeded()
+        except LLMDeadlineExceeded:
+            _record_timeout(prefix)
+            raise
+        except RETRYABLE_ERRORS as e:
+            delay = _handle_failure(prefix, limiter, e, attempt, deadline)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+
+        if actual_tokens is not None and limiter.tokens.enabled:
+            limiter.record_usage(estimated_tokens, actual_tokens(result))
+        return result
@@ -0,0 +1,176 @@
+"""Minimal local OpenAI-compatible chat-completions server.
+
+Used with `llm_transport_mode = "stub"` to run the pipeline offline and
+deterministically. Replies come from a JSONL file of
+`{"match": "<substring of the last user message>", "reply": "..."}` rules
+(first match wins), falling back to `default_reply`. Streaming responses are
+sent as server-sent events, word by word, followed by a usage chunk when the
+request asks for `stream_options.include_usage`.
+
+Run standalone with:
+    python llm_stub_server.py --port 8997 --replies replies.jsonl
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Here is my thought process: stub.\nHere is my response:\nno"
+
+
+class StubSettings:
+    def __init__(self, replies=None, default_reply=DEFAULT_REPLY, first_token_latency=0.0, token_latency=0.0):
+        self.replies = replies or []
+        self.default_reply = default_reply
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        replies = []
+        if path:
+            with open(path, "r", encoding="utf-8") as f:
+                replies = [json.loads(line) for line in f if line.strip()]
+        return cls(replies=replies, **kwargs)
+
+    def reply_for(self, messages):
+        last_user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        for rule in self.replies:
+            if rule.get("match", "") in last_user:
+                return rule["reply"]
+        return self.default_reply
+
+
+def _approx_tokens(text):
+    return max(len(text.split()), 1) if text else 0
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    settings: StubSettings = StubSettings()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        messages = request.get("messages", [])
+        model = request.get("model", "stub")
+        reply = self.settings.reply_for(messages)
+        usage = {
+            "prompt_tokens": sum(_approx_tokens(str(m.get("content") or "")) for m in messages),
+            "completion_tokens": _approx_tokens(reply),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if self.settings.first_token_latency:
+            time.sleep(self.settings.first_token_latency)
+
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send_event(payload):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        send_event(chunk({"role": "assistant", "content": ""}))
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            if i and self.settings.token_latency:
+                time.sleep(self.settings.token_latency)
+            send_event(chunk({"content": word if i == 0 else " " + word}))
+        send_event(chunk({}, finish_reason="stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send_event({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": usage,
+            })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def start_stub_server(host="127.0.0.1", port=0, settings: StubSettings | None = None):
+    """Start the stub server in a daemon thread; returns `(server, base_url)`."""
+    handler = type("StubHandler", (_StubHandler,), {"settings": settings or StubSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="llm-stub-server", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8997)
+    parser.add_argument("--replies", default=None, help="JSONL file of {match, reply} rules")
+    parser.add_argument("--default-reply", default=DEFAULT_REPLY)
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    settings = StubSettings.from_file(
+        args.replies,
+        default_reply=args.default_reply,
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+    )
+    server, base_url = start_stub_server(args.host, args.port, settings)
+    print(f"Stub chat-completions server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
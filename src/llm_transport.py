@@ -0,0 +1,291 @@
+"""Record/replay HTTP transports for the OpenAI-compatible clients.
+
+`config.llm_transport_mode` selects how `openai_client_factory` talks to the
+LLM endpoint:
+
+- "live":   plain HTTP (default).
+- "record": forward to the endpoint and append every request/response pair,
+            including the individual server-sent events of streamed
+            responses, to the JSONL cassette at `config.llm_cassette_path`.
+- "replay": serve responses from the cassette without network access,
+            optionally with `llm_replay_latency` before the first byte and
+            `llm_replay_chunk_latency` between streamed events.
+- "stub":   talk to a local OpenAI-compatible server (llm_stub_server).
+
+Requests are matched on method, path and the canonical JSON body, so a
+replayed run must issue the same prompts as the recorded one. When a
+request was recorded several times its responses are served in order.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+import httpx
+
+import config
+
+TRANSPORT_MODES = ("live", "record", "replay", "stub")
+
+
+class CassetteMissError(RuntimeError):
+    """A replayed request has no recorded response in the cassette."""
+
+
+def request_key(method: str, url: str, body: bytes) -> str:
+    try:
+        canonical_body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False)
+    except (ValueError, UnicodeDecodeError):
+        canonical_body = body.decode("utf-8", errors="replace")
+    # Match on the path only; the host differs between record, replay and stub runs
+    path = urlparse(str(url)).path.rstrip("/")
+    payload = f"{method.upper()} {path}\n{canonical_body}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _split_events(body: str) -> list[str]:
+    return [event + "\n\n" for event in body.split("\n\n") if event.strip()]
+
+
+class Cassette:
+    """Append-only JSONL store of recorded request/response pairs."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict[str, list[dict]] | None = None
+        self._served: dict[str, int] = {}
+
+    def append(self, entry: dict) -> None:
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _load(self) -> dict[str, list[dict]]:
+        entries: dict[str, list[dict]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries.setdefault(entry["key"], []).append(entry)
+        return entries
+
+    def next_response(self, key: str) -> dict:
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            recorded = self._entries.get(key)
+            if not recorded:
+                raise CassetteMissError(f"No recorded response for request {key[:12]} in {self.path}")
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+            # Once every recorded response was served, keep returning the last one
+            return recorded[min(index, len(recorded) - 1)]["response"]
+
+
+def _record_entry(request: httpx.Request, status_code: int, headers: httpx.Headers, body: bytes) -> dict:
+    content_type = headers.get("content-type", "")
+    text = body.decode("utf-8", errors="replace")
+    response = {"status_code": status_code, "content_type": content_type}
+    if content_type.startswith("text/event-stream"):
+        response["events"] = _split_events(text)
+    else:
+        response["body"] = text
+    try:
+        request_body = json.loads(request.content)
+    except ValueError:
+        request_body = request.content.decode("utf-8", errors="replace")
+    return {
+        "key": request_key(request.method, str(request.url), request.content),
+        "recorded_at": datetime.now().isoformat(),
+        "request": {"method": request.method, "path": request.url.path, "body": request_body},
+        "response": response,
+    }
+
+
+def _identity_encoding(request: httpx.Request) -> None:
+    # Record plain bytes so that the cassette stays human-readable
+    request.headers["Accept-Encoding"] = "identity"
+
+
+class _TeeStream(httpx.SyncByteStream):
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._chunks: list[bytes] = []
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._chunks.append(chunk)
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+        self._on_close(b"".join(self._chunks))
+
+
+class _AsyncTeeStream(httpx.AsyncByteStream):
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._chunks: list[bytes] = []
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._chunks.append(chunk)
+            yield chunk
+
+    async def aclose(self):
+        await self._stream.aclose()
+        self._on_close(b"".join(self._chunks))
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, inner: httpx.BaseTransport | None = None, **transport_kwargs):
+        self.cassette = cassette
+        self.inner = inner or httpx.HTTPTransport(**transport_kwargs)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        _identity_encoding(request)
+        response = self.inner.handle_request(request)
+
+        def on_close(body):
+            self.cassette.append(_record_entry(request, response.status_code, response.headers, body))
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TeeStream(response.stream, on_close),
+            extensions=response.extensions,
+        )
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, inner: httpx.AsyncBaseTransport | None = None, **transport_kwargs):
+        self.cassette = cassette
+        self.inner = inner or httpx.AsyncHTTPTransport(**transport_kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        _identity_encoding(request)
+        response = await self.inner.handle_async_request(request)
+
+        def on_close(body):
+            self.cassette.append(_record_entry(request, response.status_code, response.headers, body))
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_AsyncTeeStream(response.stream, on_close),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def _replay_parts(response: dict) -> list[bytes]:
+    if "events" in response:
+        return [event.encode("utf-8") for event in response["events"]]
+    return [response.get("body", "").encode("utf-8")]
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, parts, first_byte_latency, chunk_latency):
+        self._parts = parts
+        self._first_byte_latency = first_byte_latency
+        self._chunk_latency = chunk_latency
+
+    def __iter__(self):
+        if self._first_byte_latency:
+            time.sleep(self._first_byte_latency)
+        for i, part in enumerate(self._parts):
+            if i and self._chunk_latency:
+                time.sleep(self._chunk_latency)
+            yield part
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, parts, first_byte_latency, chunk_latency):
+        self._parts = parts
+        self._first_byte_latency = first_byte_latency
+        self._chunk_latency = chunk_latency
+
+    async def __aiter__(self):
+        if self._first_byte_latency:
+            await asyncio.sleep(self._first_byte_latency)
+        for i, part in enumerate(self._parts):
+            if i and self._chunk_latency:
+                await asyncio.sleep(self._chunk_latency)
+            yield part
+
+
+class ReplayTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, latency: float = 0.0, chunk_latency: float = 0.0):
+        self.cassette = cassette
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        response = self.cassette.next_response(request_key(request.method, str(request.url), request.content))
+        return httpx.Response(
+            status_code=response["status_code"],
+            headers={"content-type": response["content_type"]},
+            stream=_ReplayStream(_replay_parts(response), self.latency, self.chunk_latency),
+        )
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, latency: float = 0.0, chunk_latency: float = 0.0):
+        self.cassette = cassette
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        response = self.cassette.next_response(request_key(request.method, str(request.url), request.content))
+        return httpx.Response(
+            status_code=response["status_code"],
+            headers={"content-type": response["content_type"]},
+            stream=_AsyncReplayStream(_replay_parts(response), self.latency, self.chunk_latency),
+        )
+
+
+_cassettes: dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: str | None = None) -> Cassette:
+    path = path or config.llm_cassette_path
+    with _cassettes_lock:
+        cassette = _cassettes.get(path)
+        if cassette is None:
+            cassette = _cassettes[path] = Cassette(path)
+        return cassette
+
+
+def build_transport(limits: httpx.Limits | None = None, async_: bool = False):
+    """Transport for the configured `llm_transport_mode`, or None for plain HTTP."""
+    mode = config.llm_transport_mode
+    if mode not in TRANSPORT_MODES:
+        raise ValueError(f"Unknown llm_transport_mode '{mode}', expected one of {TRANSPORT_MODES}")
+
+    transport_kwargs = {"limits": limits} if limits is not None else {}
+    if mode == "record":
+        cls = AsyncRecordingTransport if async_ else RecordingTransport
+        return cls(get_cassette(), **transport_kwargs)
+    if mode == "replay":
+        cls = AsyncReplayTransport if async_ else ReplayTransport
+        return cls(get_cassette(), config.llm_replay_latency, config.llm_replay_chunk_latency)
+    return None
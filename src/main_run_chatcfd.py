@@ -1,6 +1,7 @@
 import config, preprocess_OF_tutorial, case_file_requirements, qa_modules, file_writer, run_of_case,file_corrector, set_config
-import PyPDF2, pdfplumber, pdf_chunk_ask_question
+import PyPDF2, pdf_chunk_ask_question, pdf_ingest, paper_library, paper_tables
 import json
+from prompt_builder import PromptBuilder
 
 test_solver = None
 
@@ -32,25 +33,12 @@ def _extract_json_dict(text: str):
         return None
 
 def process_pdf_pdfplumber(file_path):
-    text = ""
-    tables = []
-
-    with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            # Extract text
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-
-            # Extract tables
-            page_tables = page.extract_tables()
-            if page_tables:
-                for table in page_tables:
-                    tables.append(table)
+    # Shares the parse with CFDCaseExtractor and ChatBot (see pdf_ingest.get_document)
+    document = pdf_ingest.get_document(file_path)
 
     return {
-        "text": text,
-        "tables": tables
+        "text": document.text,
+        "tables": [list(map(list, table)) for table in document.tables]
     }
 
 def process_pdf_PyPDF2(pdf_file):
@@ -63,25 +51,20 @@ def process_pdf_PyPDF2(pdf_file):
     except Exception as e:
         return f"PDF processing error: {str(e)}"
 
-def pdf_chunk_ask():
-    extractor = pdf_chunk_ask_question.CFDCaseExtractor()
-    extractor.process_pdf(config.pdf_path)
-
-    initial_files = []
-    for i in config.global_files:
-        if "0/" in i:
-            initial_files.append(i[2:])
-
-    bc_prompt = f'''What are the boundary conditions (B.C.)? The boundary type in the paper might be spelling-incorrect. You must validate the boundary type against the OpenFOAM boundary name list and correct them. You must only correct the spelling and mustn't change boundary type. YOU MUST NOT CHANGE THE BOUNDARY TYPE EXCEPT FOR SPELLING CORRECTION. When boundary names include a slash (e.g., a/b), they must be divided into distinct boundaries ('a' and 'b') and listed separately. The OpenFOAM boundary name list [[[ {config.string_of_boundary_type_keywords} ]]]. You must clearly point out the B.C. for these boundaries [[[ {config.case_boundary_names}]]] and do not include other boundaries. You must consider fields [[[ {initial_files} ]]]. Validate your answer for two times before response. In your response, only show the final result in of the corrected boundary condition and do not show any correction or validation process. The final response must be a json-format string.'''
-
-    bc_response = extractor.query_case_setup(bc_prompt, context = True)
+def boundary_conditions_prompt(initial_files):
+    return PromptBuilder().stable(f'''What are the boundary conditions (B.C.)? The boundary type in the paper might be spelling-incorrect. You must validate the boundary type against the OpenFOAM boundary name list and correct them. You must only correct the spelling and mustn't change boundary type. YOU MUST NOT CHANGE THE BOUNDARY TYPE EXCEPT FOR SPELLING CORRECTION. When boundary names include a slash (e.g., a/b), they must be divided into distinct boundaries ('a' and 'b') and listed separately. The OpenFOAM boundary name list [[[ {config.string_of_boundary_type_keywords} ]]]. You must clearly point out the B.C. for the case boundaries given below and do not include other boundaries. You must consider the fields given below. Validate your answer for two times before response. In your response, only show the final result in of the corrected boundary condition and do not show any correction or validation process. The final response must be a json-format string.''').volatile("Case boundaries", config.case_boundary_names).volatile("Fields", initial_files)
 
-    ic_bc_prompt = f'''I want to simulate the case with these descrpition [[[{test_case_description}]]] in the paper using OpenFOAM-v2406. What are the values of initial and boundary conditions? You must strictly follow this list of boundary conditions {bc_response}, and you must not change any boundary type in the list. The flow condition might be given as non-dimensional parameters such as Re, Ma, or other paramters. Convert these flow parameters to the field values. Validate your answer for two times before response. In your response, only show the final result of the initial and boundary conditions and do not show any correction or validation process. The final response must be a json-format string showing initial and boundary conditions.'''
 
-    ic_bc_response = extractor.query_case_setup(ic_bc_prompt, context = True)
+def initial_and_boundary_conditions_prompt(bc_response):
+    ic_bc_prompt = PromptBuilder().stable('''I want to simulate the case with the description given below in the paper using OpenFOAM-v2406. What are the values of initial and boundary conditions? You must strictly follow the list of boundary conditions given below, and you must not change any boundary type in the list. The flow condition might be given as non-dimensional parameters such as Re, Ma, or other paramters. Convert these flow parameters to the field values. Validate your answer for two times before response. In your response, only show the final result of the initial and boundary conditions and do not show any correction or validation process. The final response must be a json-format string showing initial and boundary conditions.''').volatile("Case description", test_case_description).volatile("List of boundary conditions", bc_response)
+    # Only the table rows giving flow quantities, not every table in the paper
+    table_rows = config.paper_table_index.prompt_rows(paper_tables.QUANTITIES) if config.paper_table_index else ""
+    if table_rows:
+        ic_bc_prompt.volatile("Flow quantities in the paper's tables", table_rows)
+    return ic_bc_prompt
 
-    config.case_ic_bc_from_paper = ic_bc_response
 
+def case_files_prompt(ic_bc_response):
     OF_header = '''/*--------------------------------*- C++ -*----------------------------------*\\\\\\n| =========                 |                                                 |\\n| \\\\\\\\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox           |\\n|  \\\\\\\\    /   O peration     | Version:  v2406                                 |\\n|   \\\\\\\\  /    A nd           | Website:  www.openfoam.com                      |\\n|    \\\\\\\\/     M anipulation  |                                                 |\\n\\\\*---------------------------------------------------------------------------*/'''
 
     Foamfile_string = '''FoamFile
@@ -93,11 +76,11 @@ def pdf_chunk_ask():
 }
 '''
 
-    case_file_prompts = f'''I want to simulate the case with these descrpition [[[{test_case_description}]]] in the paper using OpenFOAM-v2406. I want to use the {config.case_solver} and {config.case_turbulece_model}. Please draft all the cases files [[[ {config.global_files} ]]] necessary to run the case for me. 
-    - You must strictly follow these initial and boundary conditions [[[ {ic_bc_response} ]]]. Do not add or miss any boundaries.
+    return PromptBuilder().stable(f'''I want to simulate the case with the description given below in the paper using OpenFOAM-v2406, with the solver and turbulence model given below. Please draft all the cases files listed below necessary to run the case for me. 
+    - You must strictly follow the initial and boundary conditions given below. Do not add or miss any boundaries.
     - I have already prepared the grid for this case and you don't need to prepare the blockMeshDict.
     - You must response in the json format with the keys as files name as 0/*, system/*, constant/*, and the value are file contents.
-    - You must make sure the system/controlDict is correct especially the application entry is write as [[[ application   {config.case_solver};]]]
+    - You must make sure the system/controlDict is correct especially the application entry is write as [[[ application   <solver>;]]] with the solver given below.
     - For each file, avoid generating the heading lines of the OpenFOAM file, such as [[[{OF_header}]]], but do not omit the FoamFile content such as [[[ {Foamfile_string} ]]]. 
     Validate your answer for two times before response.
     - If wavetransmissive boundary presents, you must set the derived parameter of this boundary type lInf = 1. such as [[[type            waveTransmissive; lInf            1;]]]
@@ -108,9 +91,28 @@ def pdf_chunk_ask():
     - Unnecessary empty lines or indentation
     - Any text outside JSON structure
     - Make sure both key and value are string
-    '''
+    ''').volatile("Solver", config.case_solver).volatile("Turbulence model", config.case_turbulece_model).volatile("Case files", config.global_files).volatile("Case description", test_case_description).volatile("Initial and boundary conditions", ic_bc_response)
+
+
+def pdf_chunk_ask():
+    if config.paper_library_enabled:
+        extractor = paper_library.LibraryCaseExtractor()
+    else:
+        extractor = pdf_chunk_ask_question.CFDCaseExtractor()
+    extractor.process_pdf(config.pdf_path)
+
+    initial_files = []
+    for i in config.global_files:
+        if "0/" in i:
+            initial_files.append(i[2:])
+
+    bc_response = extractor.query_case_setup(boundary_conditions_prompt(initial_files), context = True)
+
+    ic_bc_response = extractor.query_case_setup(initial_and_boundary_conditions_prompt(bc_response), context = True)
+
+    config.case_ic_bc_from_paper = ic_bc_response
 
-    case_file = extractor.query_case_setup(case_file_prompts, context = True)
+    case_file = extractor.query_case_setup(case_files_prompt(ic_bc_response), context = True)
     
 
     # build_case_file_prompt = f'''I want to use the {test_solver} and {test_turbulence_model} model to simulate the case. The boundary conditions are: 
@@ -183,7 +185,9 @@ def main(file_name):
 
     set_config.load_openfoam_environment()
     
-    config.paper_content, config.paper_table = process_pdf_pdfplumber(config.pdf_path)
+    paper = process_pdf_pdfplumber(config.pdf_path)
+    config.paper_content, config.paper_table = paper["text"], paper["tables"]
+    config.paper_table_index = paper_tables.TableIndex(config.paper_table)
     # config.paper_content = process_pdf(config.pdf_path)
 
     case_file_requirements.extract_boundary_names(config.case_grid)
@@ -311,6 +315,7 @@ def main(file_name):
             
             continue  # Explicitly continue to next iteration
 
+    qa_modules.GlobalLogManager.export_case_log()
 
     a = 1
 
@@ -0,0 +1,173 @@
+"""Int8-quantized ONNX Runtime backend for sentence embeddings.
+
+`OnnxSentenceEmbedder` reproduces a sentence-transformers model (transformer,
+pooling and optional normalization) on ONNX Runtime with dynamically
+quantized int8 weights. It is used instead of SentenceTransformer when
+`config.embedding_backend = "onnx-int8"`; see embedder_registry.
+
+The ONNX model is exported once from the local PyTorch model:
+
+    python src/onnx_embedder.py sentence-transformers/all-mpnet-base-v2
+
+which writes models/all-mpnet-base-v2-onnx-int8/. Inference itself only
+needs onnxruntime and tokenizers, not torch or transformers.
+"""
+import argparse
+import inspect
+import json
+import os
+import shutil
+
+import numpy as np
+
+import config
+
+QUANTIZED_MODEL = "model_quantized.onnx"
+SETTINGS_FILE = "onnx_embedder.json"
+
+
+def onnx_model_dir(model_name):
+    return os.path.join(config.EMBEDDING_MODEL_PATH, f"{model_name.rstrip('/').split('/')[-1]}-onnx-int8")
+
+
+def _read_json(path, default=None):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return default
+
+
+def sentence_transformer_settings(model_dir):
+    """Pooling mode, normalization and max sequence length of a sentence-transformers model directory."""
+    modules = _read_json(os.path.join(model_dir, "modules.json"), [])
+    pooling_mode = "mean"
+    normalize = False
+    for module in modules:
+        if module.get("type", "").endswith("Normalize"):
+            normalize = True
+        if module.get("type", "").endswith("Pooling"):
+            pooling = _read_json(os.path.join(model_dir, module.get("path", ""), "config.json"), {})
+            if pooling.get("pooling_mode_cls_token"):
+                pooling_mode = "cls"
+            elif pooling.get("pooling_mode_max_tokens"):
+                pooling_mode = "max"
+    max_seq_length = _read_json(os.path.join(model_dir, "sentence_bert_config.json"), {}).get("max_seq_length", 512)
+    return {"pooling": pooling_mode, "normalize": normalize, "max_seq_length": max_seq_length}
+
+
+def export_quantized(model_dir, output_dir):
+    """Export the transformer of a sentence-transformers model to ONNX and quantize its weights to int8."""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModel.from_pretrained(model_dir).eval()
+
+    sample = tokenizer(["Reynolds number of the inlet flow"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    dynamic = {0: "batch", 1: "sequence"}
+    # The TorchScript exporter: newer torch defaults to the dynamo one, which needs onnxscript
+    # and ignores dynamic_axes
+    export_options = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "last_hidden_state": dynamic},
+            opset_version=14,
+            **export_options
+        )
+
+    tokenizer.save_pretrained(output_dir)
+    settings = dict(sentence_transformer_settings(model_dir), pad_token=tokenizer.pad_token)
+    with open(os.path.join(output_dir, SETTINGS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(settings, f, indent=2)
+
+    # Written last: its presence marks a complete export (see embedder_registry._load_onnx)
+    quantize_dynamic(fp32_path, os.path.join(output_dir, QUANTIZED_MODEL), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    if os.path.exists(fp32_path + ".data"):
+        os.remove(fp32_path + ".data")
+    return output_dir
+
+
+class OnnxSentenceEmbedder:
+    """Subset of the SentenceTransformer interface used by the pipeline: `encode`."""
+
+    def __init__(self, model_dir, threads=None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        settings = _read_json(os.path.join(model_dir, SETTINGS_FILE), {})
+        self.pooling = settings.get("pooling", "mean")
+        self.normalize = settings.get("normalize", True)
+        self.max_seq_length = settings.get("max_seq_length", 512)
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, QUANTIZED_MODEL), options, providers=["CPUExecutionProvider"]
+        )
+        # The fast tokenizer file directly: importing transformers would also import torch (~700 MB RSS)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.max_seq_length)
+        pad_token = settings.get("pad_token") or "<pad>"
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+    def _pool(self, hidden, mask):
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        if self.pooling == "max":
+            return np.where(mask[..., None] > 0, hidden, -np.inf).max(axis=1)
+        mask = mask[..., None].astype('float32')
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True,
+               normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        # Batch similar lengths together to keep padding small
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+
+        embeddings = [None] * len(sentences)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            encodings = self.tokenizer.encode_batch([sentences[i] for i in batch])
+            input_ids = np.array([e.ids for e in encodings], dtype='int64')
+            mask = np.array([e.attention_mask for e in encodings], dtype='int64')
+            hidden = self.session.run(None, {"input_ids": input_ids, "attention_mask": mask})[0]
+            pooled = self._pool(hidden, mask)
+            if self.normalize or normalize_embeddings:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for i, vector in zip(batch, pooled):
+                embeddings[i] = vector
+
+        result = np.asarray(embeddings, dtype='float32').reshape(len(sentences), -1)
+        return result[0] if single else result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export an int8 ONNX copy of a local sentence-transformers model.")
+    parser.add_argument("model_name", nargs="?", default=config.embedding_model_name)
+    parser.add_argument("--output-dir")
+    args = parser.parse_args()
+
+    import embedder_registry
+    model_dir = embedder_registry.resolve_model_dir(args.model_name)
+    output_dir = args.output_dir or onnx_model_dir(args.model_name)
+    try:
+        print(export_quantized(model_dir, output_dir))
+    except Exception:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
+import asyncio
 import os
+import threading
+import weakref
 from urllib.parse import urlparse
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+import config
+import llm_transport
 
 try:
-    from openai import AzureOpenAI
+    from openai import AzureOpenAI, AsyncAzureOpenAI
 except ImportError:  # pragma: no cover - fallback for older SDKs
     AzureOpenAI = None
+    AsyncAzureOpenAI = None
 
 
 def _looks_like_azure(url: str | None) -> bool:
@@ -18,31 +26,177 @@ def _azure_endpoint(url: str) -> str:
     return f"{parsed.scheme}://{parsed.netloc}"
 
 
-def create_chat_client(prefix: str) -> OpenAI:
+_stub_base_url: str | None = None
+_stub_lock = threading.Lock()
+
+
+def _stub_server_url() -> str:
+    """Start the local stub server once per process and return its base URL."""
+    global _stub_base_url
+    with _stub_lock:
+        if _stub_base_url is None:
+            import llm_stub_server
+
+            settings = llm_stub_server.StubSettings.from_file(
+                config.llm_stub_replies_path,
+                first_token_latency=config.llm_replay_latency,
+                token_latency=config.llm_replay_chunk_latency,
+            )
+            _, _stub_base_url = llm_stub_server.start_stub_server(port=config.llm_stub_port, settings=settings)
+            print(f"LLM stub server started at {_stub_base_url}")
+        return _stub_base_url
+
+
+def _endpoint_settings(prefix: str) -> tuple[str | None, str | None, str | None]:
+    if config.llm_transport_mode == "stub":
+        return os.environ.get(f"{prefix}_KEY") or "stub", _stub_server_url(), None
+    return (
+        os.environ.get(f"{prefix}_KEY"),
+        os.environ.get(f"{prefix}_BASE_URL"),
+        os.environ.get(f"{prefix}_API_VERSION"),
+    )
+
+
+def _check_azure_settings(prefix: str, api_version: str | None, azure_cls) -> None:
+    if not api_version:
+        raise RuntimeError(
+            f"{prefix}_BASE_URL points to an Azure deployment but no API "
+            f"version was provided. Set {prefix}_API_VERSION in chatcfd_config.json."
+        )
+    if azure_cls is None:
+        raise RuntimeError(
+            "Azure endpoint detected but the installed openai package does not "
+            "support AzureOpenAI. Upgrade the dependency to >=1.0.0."
+        )
+
+
+def create_chat_client(prefix: str, http_client: httpx.Client | None = None, **client_kwargs) -> OpenAI:
     """Return an OpenAI-compatible client for the configured deployment."""
-    api_key = os.environ.get(f"{prefix}_KEY")
-    base_url = os.environ.get(f"{prefix}_BASE_URL")
-    api_version = os.environ.get(f"{prefix}_API_VERSION")
+    api_key, base_url, api_version = _endpoint_settings(prefix)
+    if http_client is None and config.llm_transport_mode in ("record", "replay"):
+        http_client = _build_http_client()
 
     if _looks_like_azure(base_url):
-        if not api_version:
-            raise RuntimeError(
-                f"{prefix}_BASE_URL points to an Azure deployment but no API "
-                f"version was provided. Set {prefix}_API_VERSION in chatcfd_config.json."
-            )
-        if AzureOpenAI is None:
-            raise RuntimeError(
-                "Azure endpoint detected but the installed openai package does not "
-                "support AzureOpenAI. Upgrade the dependency to >=1.0.0."
-            )
+        _check_azure_settings(prefix, api_version, AzureOpenAI)
         return AzureOpenAI(
             api_key=api_key,
             azure_endpoint=_azure_endpoint(base_url),
             api_version=api_version,
+            http_client=http_client,
+            **client_kwargs,
         )
 
     return OpenAI(
         api_key=api_key,
         base_url=base_url,
+        http_client=http_client,
+        **client_kwargs,
+    )
+
+
+def create_async_chat_client(prefix: str, http_client: httpx.AsyncClient | None = None, **client_kwargs) -> AsyncOpenAI:
+    """Async counterpart of `create_chat_client`."""
+    api_key, base_url, api_version = _endpoint_settings(prefix)
+    if http_client is None and config.llm_transport_mode in ("record", "replay"):
+        http_client = _build_async_http_client()
+
+    if _looks_like_azure(base_url):
+        _check_azure_settings(prefix, api_version, AsyncAzureOpenAI)
+        return AsyncAzureOpenAI(
+            api_key=api_key,
+            azure_endpoint=_azure_endpoint(base_url),
+            api_version=api_version,
+            http_client=http_client,
+            **client_kwargs,
+        )
+
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=http_client,
+        **client_kwargs,
+    )
+
+
+_client_registry: dict[tuple, OpenAI] = {}
+_registry_lock = threading.Lock()
+
+
+def _pool_settings(async_: bool = False) -> dict:
+    limits = httpx.Limits(
+        max_connections=config.llm_pool_max_connections,
+        max_keepalive_connections=config.llm_pool_max_keepalive,
+        keepalive_expiry=config.llm_pool_keepalive_expiry,
     )
+    settings = dict(
+        limits=limits,
+        timeout=httpx.Timeout(config.llm_read_timeout, connect=config.llm_connect_timeout),
+    )
+    # record / replay modes swap in the transports from llm_transport
+    transport = llm_transport.build_transport(limits, async_=async_)
+    if transport is not None:
+        settings["transport"] = transport
+    return settings
+
+
+def _build_http_client() -> httpx.Client:
+    """Keep-alive HTTP client with the pool limits and timeouts from config."""
+    return httpx.Client(**_pool_settings())
+
+
+def _build_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(**_pool_settings(async_=True))
+
+
+def get_chat_client(prefix: str) -> OpenAI:
+    """Return the process-wide pooled client for `prefix` (DEEPSEEK_V3 / DEEPSEEK_R1).
+
+    Clients are created once and reused so that every LLM call shares the same
+    connection pool instead of paying for a new TLS handshake. The registry is
+    keyed on the endpoint settings, so re-reading the config yields a new client.
+    SDK-level retries are disabled; llm_rate_limiter owns retry and backoff.
+    """
+    key = (prefix, config.llm_transport_mode, *_endpoint_settings(prefix))
+    with _registry_lock:
+        client = _client_registry.get(key)
+        if client is None:
+            client = create_chat_client(prefix, http_client=_build_http_client(), max_retries=0)
+            _client_registry[key] = client
+        return client
+
+
+def close_chat_clients() -> None:
+    """Close all pooled clients, e.g. before the process exits."""
+    with _registry_lock:
+        for client in _client_registry.values():
+            client.close()
+        _client_registry.clear()
+
+
+# Async clients hold connections bound to the event loop that created them,
+# so they are pooled per loop rather than per process.
+_async_client_registry: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple, AsyncOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_chat_client(prefix: str) -> AsyncOpenAI:
+    """Return the pooled async client for `prefix` on the running event loop."""
+    loop = asyncio.get_running_loop()
+    key = (prefix, config.llm_transport_mode, *_endpoint_settings(prefix))
+    with _registry_lock:
+        clients = _async_client_registry.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = create_async_chat_client(prefix, http_client=_build_async_http_client(), max_retries=0)
+            clients[key] = client
+        return client
+
 
+async def aclose_async_chat_clients() -> None:
+    """Close the async clients pooled on the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _registry_lock:
+        clients = _async_client_registry.pop(loop, {})
+    for client in clients.values():
+        await client.close()
@@ -0,0 +1,104 @@
+"""Deterministic classification of common OpenFOAM fatal errors.
+
+Each classifier returns a definite answer when the error text matches a
+well-known OpenFOAM message and `None` when it is not confident, in which
+case the caller falls back to the LLM.
+"""
+import re
+
+# e.g. [0 1 -1 0 0 0 0]
+_DIMENSION_SET = r"\[\s*-?\d+(?:\.\d+)?(?:\s+-?\d+(?:\.\d+)?){4,6}\s*\]"
+
+DIMENSION_ERROR_PATTERNS = [
+    re.compile(_DIMENSION_SET + r"\s*(?:!=|=|==)\s*" + _DIMENSION_SET),
+    re.compile(r"incompatible dimensions for operation", re.IGNORECASE),
+    re.compile(r"different dimensions for", re.IGNORECASE),
+    re.compile(r"LHS and RHS of .* have different dimensions", re.IGNORECASE),
+    re.compile(r"dimensions?\s+(?:mismatch|are inconsistent|inconsistent)", re.IGNORECASE),
+]
+
+# Fatal errors whose cause is clearly something other than dimensions
+NON_DIMENSION_ERROR_PATTERNS = [
+    re.compile(r"cannot find file", re.IGNORECASE),
+    re.compile(r"keyword \S+ is undefined in dictionary", re.IGNORECASE),
+    re.compile(r"Entry '?\S+'? not found in dictionary", re.IGNORECASE),
+    re.compile(r"Unknown (?:patchField|fvPatchField|boundary condition|\w+) type", re.IGNORECASE),
+    re.compile(r"Cannot find patchField entry for", re.IGNORECASE),
+    re.compile(r"Unknown (?:discretisation|interpolation|ddt|div|grad|laplacian|snGrad) scheme", re.IGNORECASE),
+    re.compile(r"Unknown \w+ type \w+", re.IGNORECASE),
+    re.compile(r"Floating point exception|sigFpe", re.IGNORECASE),
+    re.compile(r"Segmentation fault|sigSegv", re.IGNORECASE),
+    re.compile(r"Maximum number of iterations exceeded", re.IGNORECASE),
+    re.compile(r"command not found", re.IGNORECASE),
+    re.compile(r"Expected a '?[;{}()]'? while reading|Parsing error|wrong token type", re.IGNORECASE),
+]
+
+_MISSING_FILE = re.compile(r'cannot find file\s+"([^"]+)"', re.IGNORECASE)
+_CASE_RELATIVE = re.compile(r"^(?:.*/)?((?:0|system|constant)/[^/\s]+(?:/[^/\s]+)*)$")
+
+# Lines that change from run to run without changing the error itself
+_VOLATILE_LINES = re.compile(
+    r"^\s*(?:Build|Arch|Exec|Date|Time|Host|PID|I/O|Case|nProcs|fileModificationChecking|"
+    r"allowSystemOperations|ExecutionTime|ClockTime|Courant Number|deltaT)\b.*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+_HEX_ADDRESS = re.compile(r"0x[0-9a-fA-F]+")
+_STACK_FRAME = re.compile(r"^\s*#\d+\s+.*$", re.MULTILINE)
+_FATAL_BLOCK = re.compile(r"-->\s*FOAM FATAL (?:IO )?ERROR.*?(?=^\s*From\b|\Z)", re.DOTALL | re.MULTILINE)
+
+
+def is_dimension_error(running_error: str) -> bool | None:
+    """True/False if the error clearly is/isn't a dimension mismatch, None if unsure."""
+    text = running_error or ""
+    if any(p.search(text) for p in DIMENSION_ERROR_PATTERNS):
+        return True
+    if "dimension" in text.lower():
+        return None
+    if any(p.search(text) for p in NON_DIMENSION_ERROR_PATTERNS):
+        return False
+    return None
+
+
+def missing_file(running_error: str, case_path: str | None = None) -> str | None:
+    """Case-relative path (0/..., system/..., constant/...) of a missing file, 'no', or None if unsure."""
+    text = running_error or ""
+    if "cannot find file" not in text.lower():
+        # The LLM prompt answers 'no' whenever this exact phrase is absent
+        return "no"
+
+    match = _MISSING_FILE.search(text)
+    if not match:
+        return None
+    path = match.group(1).strip().replace("\\", "/")
+    if case_path:
+        case_prefix = case_path.rstrip("/").replace("\\", "/") + "/"
+        if path.startswith(case_prefix):
+            path = path[len(case_prefix):]
+    relative = _CASE_RELATIVE.match(path)
+    return relative.group(1) if relative else None
+
+
+def normalize_error(running_error: str) -> str:
+    """Strip run-specific noise (banner lines, addresses, stack frames, whitespace)."""
+    text = _VOLATILE_LINES.sub("", running_error or "")
+    text = _STACK_FRAME.sub("", text)
+    text = _HEX_ADDRESS.sub("0x", text)
+    return " ".join(text.split())
+
+
+def error_signature(running_error: str) -> str | None:
+    """The normalized FOAM FATAL ERROR block, or None if the text has none."""
+    match = _FATAL_BLOCK.search(running_error or "")
+    return normalize_error(match.group(0)) if match else None
+
+
+def errors_repeated(errors: list[str]) -> bool | None:
+    """True/False if the errors clearly are/aren't the same error, None if unsure."""
+    normalized = [normalize_error(e) for e in errors]
+    if len(set(normalized)) == 1:
+        return True
+
+    signatures = [error_signature(e) for e in errors]
+    if all(signatures):
+        return len(set(signatures)) == 1
+    return None
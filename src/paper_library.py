@@ -0,0 +1,472 @@
+"""Persistent library of papers sharing one chunk store and one vector index.
+
+Papers are added, updated and removed incrementally:
+- document metadata and chunk texts live in SQLite (`library.sqlite`);
+- vectors live in a single FAISS index (`library.faiss`, see vector_index)
+  keyed by chunk id, so a paper's vectors are removed without touching
+  the others.
+
+Adding a paper goes through pdf_ingest, so its parse and chunk embeddings
+come from the pdf cache when they exist, and a paper whose content and
+extractor settings are unchanged is skipped. Papers of at least
+`config.pdf_stream_min_pages` pages are streamed (pdf_ingest.stream_pdf),
+so a thesis is never held in memory as a whole. The index is rebuilt only
+when the embedding model or index settings change.
+
+Queries are scoped to some documents (a FAISS ID selector restricts the
+search to their chunk ids) or run across the whole library;
+`LibraryCaseExtractor` provides the CFDCaseExtractor query methods on top.
+
+    python src/paper_library.py sync pdf/
+    python src/paper_library.py query "inlet velocity" --doc 3
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import faiss
+import numpy as np
+
+import config
+import embedder_registry
+import pdf_cache
+import pdf_ingest
+import vector_index
+from hybrid_retrieval import BM25Index, fuse
+from prompt_builder import retrieval_query
+from pdf_chunk_ask_question import CFDCaseExtractor
+
+# BM25 indexes kept for recently queried scopes (one per set of documents)
+MAX_LEXICAL_SCOPES = 8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    content_hash TEXT NOT NULL,
+    document_key TEXT NOT NULL,
+    added_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id INTEGER NOT NULL REFERENCES documents(doc_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_by_document ON chunks(doc_id, position);
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _document_key(content_hash):
+    # Same key as the extraction cache: a new extractor version re-chunks every paper
+    return pdf_cache.settings_key(content_hash, pdf_ingest.extractor_settings())
+
+
+class PaperLibrary:
+    def __init__(self, root=None, embedding_model=None):
+        self.root = root or config.PAPER_LIBRARY_PATH
+        self.embedding_model = embedding_model or config.embedding_model_name
+        os.makedirs(self.root, exist_ok=True)
+        self.index_path = os.path.join(self.root, "library.faiss")
+
+        self._lock = threading.RLock()
+        self._lexical = OrderedDict()
+        self._db = sqlite3.connect(os.path.join(self.root, "library.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(_SCHEMA)
+        self.index = self._load_index()
+
+    # ---- settings and persistence ----
+
+    def _get_setting(self, name):
+        row = self._db.execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_setting(self, name, value):
+        self._db.execute("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)", (name, value))
+
+    def _index_settings(self):
+        settings = dict(vector_index.index_settings(), embedding_id=embedder_registry.embedding_id(self.embedding_model))
+        return json.dumps(settings, sort_keys=True)
+
+    def _mark_changed(self):
+        """Bump the library generation; the saved index is current only if it was written at the same generation."""
+        generation = int(self._get_setting("generation") or 0) + 1
+        self._set_setting("generation", str(generation))
+        self._lexical.clear()
+
+    def _load_index(self):
+        current = (
+            self._get_setting("index_settings") == self._index_settings()
+            and self._get_setting("index_generation") == self._get_setting("generation")
+        )
+        chunk_count = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        if current and chunk_count == 0:
+            return None
+        if current and os.path.exists(self.index_path):
+            try:
+                index = faiss.read_index(self.index_path)
+            except RuntimeError:
+                index = None
+            if index is not None and index.ntotal == chunk_count:
+                return vector_index.configure_search(index)
+
+        # Embedding model or index settings changed, or the library was not saved cleanly
+        self.index = None
+        self._rebuild(reuse_vectors=False)
+        return self.index
+
+    def _save_index(self):
+        if self.index is None:
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+        else:
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+        self._set_setting("index_settings", self._index_settings())
+        self._set_setting("index_generation", self._get_setting("generation") or "0")
+        self._db.commit()
+
+    # ---- vector index ----
+
+    def _new_index(self, vectors, chunk_ids):
+        vectors = vector_index.prepare(vectors)
+        index = vector_index.new_index(vectors.shape[1], n_train=len(vectors))
+        if faiss.try_extract_index_ivf(index) is None:
+            # IVF indexes store ids themselves; flat and HNSW need the id map
+            index = faiss.IndexIDMap2(index)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add_with_ids(vectors, np.asarray(chunk_ids, dtype='int64'))
+        return vector_index.configure_search(index)
+
+    def _holds_exact_vectors(self):
+        return isinstance(vector_index.base_index(self.index), (faiss.IndexFlat, faiss.IndexHNSWFlat))
+
+    def _rebuild(self, reuse_vectors=True):
+        """Rebuild the index over all chunks, from the current index's vectors if it stores them exactly."""
+        rows = self._db.execute("SELECT chunk_id, text FROM chunks ORDER BY chunk_id").fetchall()
+        if not rows:
+            self.index = None
+            self._save_index()
+            return
+        chunk_ids = [chunk_id for chunk_id, _ in rows]
+        if reuse_vectors and self.index is not None and self._holds_exact_vectors():
+            vectors = np.vstack([self.index.reconstruct(chunk_id) for chunk_id in chunk_ids])
+        else:
+            # Embeddings are cached per chunk text, so only chunks missing from the cache are encoded
+            vectors = pdf_ingest.embed_chunks(self.embedding_model, [text for _, text in rows])
+        self.index = self._new_index(vectors, chunk_ids)
+        self._save_index()
+
+    def _needs_training(self):
+        # An "ivfpq" library starts out flat (too few vectors to train) until it is large enough
+        if self.index is None or not isinstance(vector_index.base_index(self.index), faiss.IndexFlat):
+            return False
+        trainable = vector_index.new_index(self.index.d, n_train=self.index.ntotal)
+        return not isinstance(trainable, faiss.IndexFlat)
+
+    def _remove_vectors(self, chunk_ids):
+        if self.index is None or not chunk_ids:
+            return False
+        try:
+            self.index.remove_ids(faiss.IDSelectorBatch(np.asarray(chunk_ids, dtype='int64')))
+            return False
+        except RuntimeError:
+            # HNSW cannot remove vectors: rebuild it without them once the rows are gone
+            return True
+
+    # ---- documents ----
+
+    def documents(self):
+        rows = self._db.execute(
+            "SELECT d.doc_id, d.path, d.content_hash, d.added_at, COUNT(c.chunk_id) "
+            "FROM documents d LEFT JOIN chunks c ON c.doc_id = d.doc_id "
+            "GROUP BY d.doc_id ORDER BY d.doc_id"
+        ).fetchall()
+        return [
+            {"doc_id": doc_id, "path": path, "content_hash": content_hash, "added_at": added_at, "chunks": chunks}
+            for doc_id, path, content_hash, added_at, chunks in rows
+        ]
+
+    def doc_id(self, path_or_id):
+        """Document id for a path or an id, or None if it is not in the library."""
+        if isinstance(path_or_id, int):
+            row = self._db.execute("SELECT doc_id FROM documents WHERE doc_id = ?", (path_or_id,)).fetchone()
+        else:
+            row = self._db.execute(
+                "SELECT doc_id FROM documents WHERE path = ?", (os.path.abspath(path_or_id),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _chunk_ids(self, doc_ids):
+        placeholders = ",".join("?" * len(doc_ids))
+        return [row[0] for row in self._db.execute(
+            f"SELECT chunk_id FROM chunks WHERE doc_id IN ({placeholders}) ORDER BY chunk_id", list(doc_ids)
+        )]
+
+    def chunk_texts(self, chunk_ids):
+        """{chunk id: text} for the given chunk ids."""
+        chunk_ids = list(chunk_ids)
+        texts = {}
+        # SQLite limits the number of bound parameters per statement
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            texts.update(self._db.execute(
+                f"SELECT chunk_id, text FROM chunks WHERE chunk_id IN ({placeholders})", batch
+            ).fetchall())
+        return texts
+
+    def _delete_documents(self, doc_ids):
+        """Remove the documents' rows and vectors; True if the index must be rebuilt."""
+        rebuild = self._remove_vectors(self._chunk_ids(doc_ids))
+        self._db.executemany("DELETE FROM documents WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+        return rebuild
+
+    def _add_document(self, file_path):
+        """Add or update one paper without saving the index; returns (doc_id, whether the index must be rebuilt)."""
+        path = os.path.abspath(file_path)
+        content_hash = pdf_cache.file_sha256(path)
+        key = _document_key(content_hash)
+
+        row = self._db.execute("SELECT doc_id, document_key FROM documents WHERE path = ?", (path,)).fetchone()
+        if row and row[1] == key:
+            return row[0], False
+
+        if row is None:
+            # A paper that was moved keeps its chunks and vectors
+            for doc_id, old_path in self._db.execute(
+                    "SELECT doc_id, path FROM documents WHERE document_key = ?", (key,)).fetchall():
+                if not os.path.exists(old_path):
+                    self._db.execute("UPDATE documents SET path = ? WHERE doc_id = ?", (path, doc_id))
+                    self._mark_changed()
+                    return doc_id, False
+
+        if pdf_ingest.page_count(path) >= config.pdf_stream_min_pages:
+            # Theses and long reports: parsed, chunked and embedded a batch at a time
+            batches = pdf_ingest.stream_pdf(path, self.embedding_model)
+        else:
+            document = pdf_ingest.get_document(path, self.embedding_model)
+            batches = [(document.chunks, document.embeddings)]
+        rebuild = self._delete_documents([row[0]]) if row else False
+
+        cursor = self._db.execute(
+            "INSERT INTO documents (path, content_hash, document_key, added_at) VALUES (?, ?, ?, ?)",
+            (path, content_hash, _document_key(content_hash), datetime.now().isoformat())
+        )
+        doc_id = cursor.lastrowid
+        position = 0
+        for chunks, embeddings in batches:
+            chunk_ids = [
+                self._db.execute(
+                    "INSERT INTO chunks (doc_id, position, text) VALUES (?, ?, ?)", (doc_id, position + offset, text)
+                ).lastrowid
+                for offset, text in enumerate(chunks)
+            ]
+            position += len(chunk_ids)
+            if not chunk_ids:
+                continue
+            if self.index is None:
+                self.index = self._new_index(embeddings, chunk_ids)
+            else:
+                self.index.add_with_ids(vector_index.prepare(embeddings), np.asarray(chunk_ids, dtype='int64'))
+        self._mark_changed()
+        return doc_id, rebuild
+
+    def _commit(self, rebuild):
+        if rebuild or self._needs_training():
+            self._rebuild()
+        else:
+            self._save_index()
+
+    def add_many(self, file_paths):
+        """Add new papers and re-ingest changed ones, saving the index once; returns their document ids."""
+        with self._lock:
+            doc_ids = []
+            rebuild = False
+            try:
+                for file_path in file_paths:
+                    doc_id, needs_rebuild = self._add_document(file_path)
+                    doc_ids.append(doc_id)
+                    rebuild = rebuild or needs_rebuild
+            except Exception:
+                # Keep the rows and the index in step: drop the partial change and reload the index
+                self._db.rollback()
+                self._lexical.clear()
+                self.index = self._load_index()
+                raise
+            self._commit(rebuild)
+            return doc_ids
+
+    def add(self, file_path):
+        """Add a paper, or update it if its content changed; returns its document id."""
+        return self.add_many([file_path])[0]
+
+    def remove(self, *paths_or_ids):
+        """Remove papers by path or document id; returns the ids that were removed."""
+        with self._lock:
+            doc_ids = [doc_id for doc_id in map(self.doc_id, paths_or_ids) if doc_id is not None]
+            if not doc_ids:
+                return []
+            rebuild = self._delete_documents(doc_ids)
+            self._mark_changed()
+            self._commit(rebuild)
+            return doc_ids
+
+    def sync(self, directory, remove_missing=True):
+        """Bring the library in line with the PDFs in `directory`: add new and changed ones, remove deleted ones."""
+        directory = os.path.abspath(directory)
+        paths = sorted(glob.glob(os.path.join(directory, "**", "*.pdf"), recursive=True))
+        with self._lock:
+            doc_ids = self.add_many(paths)
+            if remove_missing:
+                missing = [
+                    document["doc_id"] for document in self.documents()
+                    if document["path"].startswith(directory + os.sep) and not os.path.exists(document["path"])
+                ]
+                self.remove(*missing)
+            return doc_ids
+
+    # ---- retrieval ----
+
+    def _lexical_index(self, doc_ids):
+        """BM25 index over the chunks of `doc_ids` (None = all) and the chunk id of each entry."""
+        scope = None if doc_ids is None else tuple(sorted(doc_ids))
+        entry = self._lexical.get(scope)
+        if entry is None:
+            if scope is None:
+                rows = self._db.execute("SELECT chunk_id, text FROM chunks ORDER BY chunk_id").fetchall()
+            else:
+                texts = self.chunk_texts(self._chunk_ids(scope))
+                rows = sorted(texts.items())
+            entry = (BM25Index([text for _, text in rows]), [chunk_id for chunk_id, _ in rows])
+            self._lexical[scope] = entry
+            while len(self._lexical) > MAX_LEXICAL_SCOPES:
+                self._lexical.popitem(last=False)
+        else:
+            self._lexical.move_to_end(scope)
+        return entry
+
+    def retrieve(self, questions, top_k, doc_ids=None):
+        """Chunk ids of the relevant chunks for each question, searching `doc_ids` only (None = the whole library).
+
+        Same ranking as CFDCaseExtractor._retrieve: one batched encode and
+        search on each question's `retrieval_query`, fused with BM25 in
+        "hybrid" retrieval mode.
+        """
+        queries = [retrieval_query(question) for question in questions]
+        with self._lock:
+            if self.index is None:
+                return [[] for _ in queries]
+            scope = None if doc_ids is None else self._chunk_ids(doc_ids)
+            if scope is not None and not scope:
+                return [[] for _ in queries]
+
+            hybrid = config.pdf_retrieval_mode == "hybrid"
+            search_k = max(top_k, config.pdf_retrieval_candidates) if hybrid else top_k
+            query_embeds = embedder_registry.get_embedder(self.embedding_model).encode([text for text, _ in queries])
+            scores, indices = vector_index.search(self.index, query_embeds, search_k, ids=scope)
+
+            bm25, chunk_ids = self._lexical_index(doc_ids) if hybrid else (None, None)
+            retrieved = []
+            for (_, segments), row_indices, row_scores in zip(queries, indices, scores):
+                dense = [int(i) for i, score in zip(row_indices, row_scores) if i >= 0 and vector_index.is_relevant(score)]
+                if not hybrid:
+                    retrieved.append(dense)
+                    continue
+                positions = bm25.search_segments(segments, search_k, min_share=config.pdf_bm25_min_share)
+                dense_ranking = [int(i) for i in row_indices if i >= 0]
+                lexical = [chunk_ids[p] for p in positions]
+                retrieved.append(fuse(dense_ranking, lexical, dense, top_k, k=config.pdf_rrf_k))
+            return retrieved
+
+
+class _ChunkTexts:
+    """`extractor.chunks[chunk_id]` backed by the library's chunk store."""
+
+    def __init__(self, library):
+        self.library = library
+
+    def __getitem__(self, chunk_id):
+        return self.library.chunk_texts([chunk_id])[chunk_id]
+
+
+class LibraryCaseExtractor(CFDCaseExtractor):
+    """CFDCaseExtractor answering from a PaperLibrary, scoped to `doc_ids` (None = the whole library)."""
+
+    def __init__(self, library=None, doc_ids=None):
+        self.library = library or get_library()
+        super().__init__(self.library.embedding_model)
+        self.doc_ids = None if doc_ids is None else list(doc_ids)
+        # Only checked for "is there anything to search"; retrieval goes through the library
+        self.index = self.library.index
+        self.chunks = _ChunkTexts(self.library)
+
+    def process_pdf(self, file_path):
+        """Add the paper to the library (a no-op if it is unchanged) and scope queries to it."""
+        self.doc_ids = [self.library.add(file_path)]
+        self.index = self.library.index
+
+    def _retrieve(self, questions, top_k):
+        return self.library.retrieve(questions, top_k, self.doc_ids)
+
+
+_library = None
+_library_lock = threading.Lock()
+
+def get_library():
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = PaperLibrary()
+        return _library
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the persistent paper library.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    add = commands.add_parser("add")
+    add.add_argument("pdf_paths", nargs="+")
+    remove = commands.add_parser("remove")
+    remove.add_argument("papers", nargs="+", help="paths or document ids")
+    sync = commands.add_parser("sync")
+    sync.add_argument("directory")
+    sync.add_argument("--keep-missing", action="store_true", help="keep papers whose file was deleted")
+    query = commands.add_parser("query", help="print the chunks retrieved for a question")
+    query.add_argument("question")
+    query.add_argument("--doc", type=int, action="append", help="restrict to this document id (repeatable)")
+    query.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    library = get_library()
+    if args.command == "add":
+        print(library.add_many(args.pdf_paths))
+    elif args.command == "remove":
+        print(library.remove(*(int(p) if p.isdigit() else p for p in args.papers)))
+    elif args.command == "sync":
+        library.sync(args.directory, remove_missing=not args.keep_missing)
+    elif args.command == "query":
+        chunk_ids = library.retrieve([args.question], args.top_k, args.doc)[0]
+        texts = library.chunk_texts(chunk_ids)
+        for chunk_id in chunk_ids:
+            print(f"--- chunk {chunk_id}\n{texts[chunk_id]}")
+        return
+
+    for document in library.documents():
+        print(f"{document['doc_id']:>5}  {document['chunks']:>5} chunks  {document['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""Typed, unit-aware view of the tables pdfplumber extracts from a paper.
+
+Every table becomes a pandas DataFrame with numeric columns converted to
+floats, and every value the tables give for a flow quantity (velocity,
+pressure, temperature, Re, Ma, ...) becomes a row of
+`TableIndex.parameters`, indexed by quantity and converted to SI units:
+
+    tables = TableIndex(document.tables)
+    tables.lookup("pressure")           # DataFrame of the pressure values
+    tables.prompt_rows(["velocity"])    # markdown of the matching table rows only
+
+A value's quantity is the one named by a "name = value" assignment in the
+cell, else the one its unit implies (m/s is a velocity), else the first one
+mentioned by the words before it in the cell, the row labels or the column
+header. Velocities, pressures, temperatures, densities and viscosities
+without a known unit are left out, and a value given twice is listed once.
+Prompts get only the rows and columns mentioning the requested quantities
+instead of whole tables.
+"""
+import argparse
+import math
+import re
+from dataclasses import dataclass
+
+import pandas as pd
+
+QUANTITIES = (
+    "velocity", "pressure", "temperature", "reynolds", "mach",
+    "density", "viscosity", "turbulence", "angle_of_attack"
+)
+# Quantities that only make sense with a unit; a bare number for them is not a value ("Gauge Pressure–0")
+DIMENSIONAL_QUANTITIES = ("velocity", "pressure", "temperature", "density", "viscosity")
+
+# Words that identify a quantity anywhere in a label
+_QUANTITY_WORDS = {
+    "velocity": r"velocit|speed",
+    "pressure": r"pressure",
+    "temperature": r"temperature",
+    "reynolds": r"reynolds",
+    "mach": r"\bmach\b",
+    "density": r"density",
+    "viscosity": r"viscosity",
+    "turbulence": r"turbulen|intensity|kinetic energy|dissipation|k-(?:epsilon|omega|ε|ω)|\bsst\b|spalart",
+    "angle_of_attack": r"angle of attack|incidence|\baoa\b",
+}
+# Symbols that identify a quantity when they are the whole label (after normalization)
+_QUANTITY_SYMBOLS = {
+    "velocity": {"u", "u∞", "uinf", "u0", "uin", "v∞", "vinf", "uref"},
+    "pressure": {"p", "p0", "p∞", "pinf", "pt", "ps", "ptotal", "pout", "pin"},
+    "temperature": {"t", "t0", "t∞", "tinf", "tt", "ttotal"},
+    "reynolds": {"re", "re∞", "rec", "reinf"},
+    "mach": {"ma", "m", "m∞", "ma∞", "minf"},
+    "density": {"ρ", "rho", "ρ∞"},
+    "viscosity": {"μ", "mu", "ν", "nu"},
+    "turbulence": {"k", "ω", "omega", "ε", "epsilon", "tu", "nut", "νt"},
+    "angle_of_attack": {"α", "alpha"},
+}
+
+# normalized unit -> (SI unit, scale, offset): si = value * scale + offset
+_UNITS = {
+    "m/s": ("m/s", 1.0, 0.0),
+    "km/h": ("m/s", 1 / 3.6, 0.0),
+    "ft/s": ("m/s", 0.3048, 0.0),
+    "Pa": ("Pa", 1.0, 0.0),
+    "kPa": ("Pa", 1e3, 0.0),
+    "MPa": ("Pa", 1e6, 0.0),
+    "bar": ("Pa", 1e5, 0.0),
+    "atm": ("Pa", 101325.0, 0.0),
+    "psi": ("Pa", 6894.757, 0.0),
+    "K": ("K", 1.0, 0.0),
+    "°C": ("K", 1.0, 273.15),
+    "°F": ("K", 5 / 9, 273.15 - 32 * 5 / 9),
+    "kg/m3": ("kg/m3", 1.0, 0.0),
+    "Pa·s": ("Pa·s", 1.0, 0.0),
+    "m2/s": ("m2/s", 1.0, 0.0),
+    "%": ("", 0.01, 0.0),
+    "°": ("°", 1.0, 0.0),
+    "deg": ("°", 1.0, 0.0),
+}
+_UNIT_QUANTITIES = {
+    "m/s": "velocity", "Pa": "pressure", "K": "temperature",
+    "kg/m3": "density", "Pa·s": "viscosity", "m2/s": "viscosity",
+}
+
+_UNIT_PATTERN = (
+    r"m\s*/\s*s|m\s*s\s*[-−⁻]\s*[1¹]|km\s*/\s*h|ft\s*/\s*s|[kKM]?Pa\s*[·.]?\s*s|[kKM]?Pa|bar|atm|psi"
+    r"|°\s*[CF]|℃|K|kg\s*/?\s*m\s*(?:3|³|\^3|-3|−3)|m\s*(?:2|²|\^2)\s*/\s*s|%|°|deg"
+)
+_SUPERSCRIPTS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹⁻⁺−", "0123456789-+-")
+# 10^5, 1.5, -3e5, 1,000, 6×10^6; the sign must be attached and not follow a letter (k-epsilon, Case-1)
+_NUMBER = (
+    r"(?<![\w.])(?P<number>10\s*\^\s*[-+]?\d+|[-+]?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?:[eE][-+]?\d+)?"
+    r"(?:\s*[x×*·]\s*10\s*\^\s*[-+]?\d+)?)"
+)
+_QUANTITY_VALUE = re.compile(_NUMBER + rf"(?:\s*(?P<unit>{_UNIT_PATTERN}))?(?![\w.])")
+_ASSIGNMENT = re.compile(
+    r"(?P<label>[A-Za-z∞ρμνωεα][\w∞ρμνωεα \-]*?)\s*[=:]\s*" + _QUANTITY_VALUE.pattern
+)
+
+
+def _clean_cell(cell):
+    return " ".join(str(cell).split()) if cell is not None else ""
+
+
+def _normalize(text):
+    """Cell text with superscripts made explicit: 10⁶ -> 10^6, m s⁻¹ -> m s-1, − -> -."""
+    text = re.sub(r"10([⁻⁺]?[⁰¹²³⁴⁵⁶⁷⁸⁹]+)", r"10^\1", _clean_cell(text))
+    return text.translate(_SUPERSCRIPTS)
+
+
+def _number_value(number):
+    number = re.sub(r"[\s,]", "", number)
+    power = re.fullmatch(r"(?:(.+?)[x×*·])?10\^([-+]?\d+)", number)
+    if power:
+        return float(power.group(1) or 1.0) * 10.0 ** int(power.group(2))
+    return float(number)
+
+
+def parse_number(text):
+    """Float value of a number as written in papers (1,000 / 6×10^6 / 10⁵ / 1.2E+5), or None."""
+    text = _normalize(text)
+    return _number_value(text) if re.fullmatch(_NUMBER, text) else None
+
+
+def normalize_unit(unit):
+    """Canonical spelling of a unit ("m s-1" -> "m/s", "℃" -> "°C"), or None if it is not known."""
+    if not unit:
+        return None
+    unit = re.sub(r"\s+", "", unit.translate(_SUPERSCRIPTS))
+    if re.fullmatch(r"m/s|ms-1", unit):
+        return "m/s"
+    if re.fullmatch(r"kg/?m(?:3|\^3|-3)", unit):
+        return "kg/m3"
+    if re.fullmatch(r"m(?:2|\^2)/s", unit):
+        return "m2/s"
+    if re.fullmatch(r"[kKM]?Pa[·.]?s", unit):
+        return "Pa·s"
+    unit = {"℃": "°C", "kpa": "kPa", "KPa": "kPa", "mpa": "MPa", "pa": "Pa"}.get(unit, unit)
+    return unit if unit in _UNITS else None
+
+
+def to_si(value, unit):
+    """(value in SI units, SI unit); values with unknown units are returned unchanged."""
+    unit = normalize_unit(unit)
+    if unit is None or value is None or math.isnan(value):
+        return value, unit or ""
+    si_unit, scale, offset = _UNITS[unit]
+    return value * scale + offset, si_unit
+
+
+def _symbol(label):
+    return re.sub(r"[\s_{}$\\]", "", label.lower())
+
+
+def quantities_in(text):
+    """Quantities a label or question mentions, in QUANTITIES order."""
+    text = _clean_cell(text)
+    lowered = text.lower()
+    # "Pressure (P)": the parenthesized part may be a symbol or a unit
+    symbols = {_symbol(part) for part in re.split(r"[()\[\],]", text) if part.strip()}
+    return [
+        quantity for quantity in QUANTITIES
+        if re.search(_QUANTITY_WORDS[quantity], lowered) or symbols & _QUANTITY_SYMBOLS[quantity]
+    ]
+
+
+def _header_unit(header):
+    """Unit given in a header such as "Velocity (m/s)", "U [m s-1]" or "Pressure, Pa"."""
+    for part in re.findall(r"[(\[]([^)\]]+)[)\]]", header) + re.findall(r",\s*(\S+)\s*$", header):
+        unit = normalize_unit(part)
+        if unit:
+            return unit
+    return None
+
+
+@dataclass(frozen=True)
+class ParameterTable:
+    number: int
+    # Leading columns naming the rows (e.g. "Boundary", "Variable")
+    label_columns: tuple
+    # Raw cell text, merged cells filled in; columns named after the header row
+    text: pd.DataFrame
+    # Same shape; numeric columns as float64, other columns as text
+    values: pd.DataFrame
+    # column -> unit given in its header
+    units: dict
+    # "Unit" column giving the unit of each row, if any
+    unit_column: str
+    # column -> quantities its header mentions
+    column_quantities: dict
+
+
+def parse_table(rows, number=0):
+    """ParameterTable for a pdfplumber table (list of rows of str or None), or None if it has no data rows."""
+    width = max((len(row) for row in rows), default=0)
+    rows = [list(row) + [None] * (width - len(row)) for row in rows]
+    rows = [row for row in rows if any(_clean_cell(cell) for cell in row)]
+    if len(rows) < 2 or width < 2:
+        return None
+
+    # Row labels: the first column plus the columns its header cell spans (None = merged into the left cell)
+    label_count = 1
+    while label_count < width and rows[0][label_count] is None:
+        label_count += 1
+
+    header = [_clean_cell(cell) for cell in rows[0]]
+    rows = rows[1:]
+    # Second header row ("Name | Variable | | "): labels filled in, nothing in the value columns
+    while len(rows) > 1 and not any(_clean_cell(cell) for cell in rows[0][label_count:]):
+        header = [f"{name} {_clean_cell(cell)}".strip() for name, cell in zip(header, rows[0])]
+        rows = rows[1:]
+
+    columns = []
+    for position, name in enumerate(header):
+        name = name or f"column {position + 1}"
+        while name in columns:
+            name += "'"
+        columns.append(name)
+
+    # pdfplumber reports the continuation of a vertically merged cell as None
+    data = []
+    for row in rows:
+        previous = data[-1] if data else [""] * width
+        data.append([_clean_cell(cell) if cell is not None else previous[i] for i, cell in enumerate(row)])
+    text = pd.DataFrame(data, columns=columns)
+
+    values = text.copy()
+    for column in columns:
+        parsed = text[column].map(parse_number)
+        filled = text[column] != ""
+        # A column is numeric when at least half of its non-empty cells are plain numbers
+        if filled.any() and parsed[filled].notna().sum() * 2 >= filled.sum():
+            values[column] = parsed.astype("float64")
+
+    return ParameterTable(
+        number=number,
+        label_columns=tuple(columns[:label_count]),
+        text=text,
+        values=values,
+        units={column: unit for column in columns if (unit := _header_unit(column))},
+        unit_column=next((column for column in columns if re.fullmatch(r"units?", column, re.IGNORECASE)), None),
+        column_quantities={column: found for column in columns if (found := quantities_in(column))},
+    )
+
+
+def _cell_parameters(table, row, column):
+    """(quantity, name, value, unit) given in one cell: explicit assignments, then numbers named by their context."""
+    cell = _normalize(table.text.at[row, column])
+    labels = [table.text.at[row, label] for label in table.label_columns if label != column]
+    labels = [label for label in labels if label]
+    default_unit = table.units.get(column)
+    if default_unit is None and table.unit_column:
+        default_unit = normalize_unit(table.text.at[row, table.unit_column])
+    parameters = []
+    for segment in cell.split(";"):
+        assigned = []
+        for match in _ASSIGNMENT.finditer(segment):
+            found = quantities_in(match.group("label"))
+            if found:
+                unit = normalize_unit(match.group("unit")) or default_unit
+                parameters.append((found[0], match.group("label").strip(), _number_value(match.group("number")), unit))
+                assigned.append(match.span())
+
+        for match in _QUANTITY_VALUE.finditer(segment):
+            if any(start <= match.start() < end for start, end in assigned):
+                continue
+            unit = normalize_unit(match.group("unit")) or default_unit
+            if unit in _UNIT_QUANTITIES:
+                # The unit settles it: 75.18 m/s is a velocity whatever the row is called
+                quantity = _UNIT_QUANTITIES[unit]
+            else:
+                # Nearest context first: words before the number, innermost row label, column header
+                contexts = [segment[:match.start()]] + labels[-1:] + [column]
+                found = next((found for found in map(quantities_in, contexts) if found), None)
+                if not found:
+                    continue
+                quantity = found[0]
+            name = " / ".join(labels) or column
+            parameters.append((quantity, name, _number_value(match.group("number")), unit))
+    return parameters
+
+
+class TableIndex:
+    """The quantity values of a paper's tables (see module docstring)."""
+
+    COLUMNS = ["quantity", "name", "value", "unit", "si_value", "si_unit", "table", "row", "column", "text"]
+
+    def __init__(self, tables):
+        self.tables = [
+            table for table in (parse_table(rows, number) for number, rows in enumerate(tables, start=1)) if table
+        ]
+        records = []
+        for table in self.tables:
+            for row in table.text.index:
+                # Label columns name the rows; "NH 3" is not a value
+                for column in table.text.columns.drop(list(table.label_columns)):
+                    for quantity, name, value, unit in _cell_parameters(table, row, column):
+                        si_value, si_unit = to_si(value, unit)
+                        if quantity in DIMENSIONAL_QUANTITIES and not si_unit:
+                            continue
+                        records.append((
+                            quantity, name, value, unit or "", si_value, si_unit,
+                            table.number, row, column, table.text.at[row, column]
+                        ))
+        parameters = pd.DataFrame.from_records(records, columns=self.COLUMNS)
+        # The same value given twice (e.g. in the OpenFOAM and the Fluent column of one row) is listed once
+        parameters = parameters.drop_duplicates(subset=["quantity", "si_value", "si_unit"])
+        self.parameters = parameters.reset_index(drop=True).set_index("quantity")
+
+    def __len__(self):
+        return len(self.parameters)
+
+    def lookup(self, quantity):
+        """All values given for `quantity` (DataFrame, one row per value, in table order)."""
+        if quantity not in QUANTITIES:
+            raise ValueError(f"Unknown quantity '{quantity}', expected one of {QUANTITIES}")
+        return self.parameters.loc[self.parameters.index == quantity]
+
+    def value(self, quantity, name=None):
+        """First SI value of `quantity` (whose name contains `name`, if given), or None."""
+        found = self.lookup(quantity)
+        if name is not None:
+            found = found[found["name"].str.contains(name, case=False, regex=False)]
+        return None if found.empty else float(found["si_value"].iloc[0])
+
+    def relevant(self, quantities):
+        """[(table, DataFrame of the rows and columns mentioning any of `quantities`)]."""
+        quantities = set(quantities)
+        selected = []
+        for table in self.tables:
+            columns = [c for c, found in table.column_quantities.items() if quantities & set(found)]
+            if columns:
+                # Quantity columns: every row, with the label column in front
+                keep = list(table.label_columns) + [c for c in columns if c not in table.label_columns]
+                selected.append((table, table.text[keep]))
+                continue
+            found = self.parameters[self.parameters.index.isin(quantities) & (self.parameters["table"] == table.number)]
+            rows = sorted(set(found["row"]) | {
+                row for row in table.text.index
+                if any(quantities & set(quantities_in(table.text.at[row, label])) for label in table.label_columns)
+            })
+            if rows:
+                selected.append((table, table.text.loc[rows]))
+        return selected
+
+    def prompt_rows(self, quantities=QUANTITIES):
+        """Markdown of the table rows mentioning `quantities`, or "" if there are none."""
+        blocks = []
+        for table, frame in self.relevant(quantities):
+            lines = ["| " + " | ".join(frame.columns) + " |", "|" + "---|" * len(frame.columns)]
+            lines += ["| " + " | ".join(row) + " |" for row in frame.itertuples(index=False)]
+            blocks.append(f"Table {table.number}:\n" + "\n".join(lines))
+        return "\n\n".join(blocks)
+
+
+def main():
+    import pdf_ingest
+
+    parser = argparse.ArgumentParser(description="Print the quantity values found in a paper's tables.")
+    parser.add_argument("pdf_path")
+    parser.add_argument("quantities", nargs="*", default=list(QUANTITIES))
+    args = parser.parse_args()
+
+    pages = pdf_ingest.extract_pages(args.pdf_path)
+    index = TableIndex([table for page in pages for table in page.tables])
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(index.parameters[["name", "value", "unit", "si_value", "si_unit", "table"]])
+    print()
+    print(index.prompt_rows(args.quantities))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""On-disk caches for paper ingest (see pdf_ingest.ingest_pdf).
+
+- `ExtractionCache` stores the parsed pages, tables and chunks of a paper
+  as gzipped JSON, keyed by the PDF's content hash and the extractor settings.
+- `EmbeddingCache` stores chunk vectors per embedded batch (usually one
+  paper, or one `stream_pdf` batch) in a single .npz file, keyed by the
+  embedding model and the hashes of the chunk texts, so re-chunked papers
+  only embed new chunks. A per-model manifest maps each text hash to its
+  batch file, so a lookup only opens the files holding the missing keys.
+- `IndexStore` keeps a FAISS index per document, loaded memory-mapped.
+
+All three share one directory and one size budget: entry mtimes are
+refreshed on every hit, and once the directory grows beyond `max_bytes`
+the least recently used files are removed. Eviction walks the whole
+directory, so it runs every `EVICT_EVERY_PUTS` writes, or once a tenth
+of the budget has been written since the last one, rather than on every
+write.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing
+
+import faiss
+import numpy as np
+
+import config
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def settings_key(content_hash, settings):
+    payload = json.dumps({"content": content_hash, "settings": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict_lru(cache_dir, max_bytes):
+    """Remove least recently used files under `cache_dir` until it is at most `max_bytes`."""
+    if max_bytes is None or not os.path.isdir(cache_dir):
+        return
+
+    entries = []
+    total_bytes = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_bytes += stat.st_size
+
+    if total_bytes <= max_bytes:
+        return
+
+    entries.sort()
+    for _, size, path in entries:
+        _remove(path)
+        total_bytes -= size
+        if total_bytes <= max_bytes:
+            break
+
+
+# Writes to a cache directory between two evictions
+EVICT_EVERY_PUTS = 50
+# ... or the fraction of its size budget written since the last eviction
+EVICT_WRITTEN_FRACTION = 0.1
+
+_pending_writes = {}
+_pending_lock = threading.Lock()
+
+
+def record_write(cache_dir, max_bytes, size):
+    """Account a `size`-byte write to `cache_dir` and run `evict_lru` when one is due."""
+    with _pending_lock:
+        puts, written = _pending_writes.get(cache_dir, (0, 0))
+        puts, written = puts + 1, written + size
+        due = puts >= EVICT_EVERY_PUTS or (max_bytes is not None and written >= max_bytes * EVICT_WRITTEN_FRACTION)
+        _pending_writes[cache_dir] = (0, 0) if due else (puts, written)
+    if due:
+        evict_lru(cache_dir, max_bytes)
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ExtractionCache:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or config.PDF_CACHE_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else config.pdf_cache_max_bytes
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, "extract", f"{key}.json.gz")
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, EOFError, json.JSONDecodeError):
+            return None
+        _touch(path)
+        return entry
+
+    def put(self, key, entry):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        record_write(self.cache_dir, self.max_bytes, _size(path))
+
+
+# Per-model SQLite table mapping chunk text keys to the batch file holding their vector
+MANIFEST_NAME = "manifest.sqlite"
+# Keys per IN (...) query, below SQLite's default variable limit
+_SQL_VARIABLES = 500
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, cache_dir=None, max_bytes=None):
+        self.model_name = model_name
+        self.cache_dir = cache_dir or config.PDF_CACHE_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else config.pdf_cache_max_bytes
+        # Model names contain slashes (e.g. sentence-transformers/all-mpnet-base-v2)
+        self.model_dir = os.path.join(self.cache_dir, "embeddings", re.sub(r"[^\w.-]+", "_", model_name))
+
+    @staticmethod
+    def text_key(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def batch_key(keys):
+        return hashlib.sha256("".join(keys).encode("ascii")).hexdigest()
+
+    def _batch_path(self, batch_key):
+        return os.path.join(self.model_dir, f"{batch_key}.npz")
+
+    def _batch_paths(self):
+        try:
+            names = os.listdir(self.model_dir)
+        except OSError:
+            return []
+        return [os.path.join(self.model_dir, name) for name in names if name.endswith(".npz")]
+
+    def _manifest(self):
+        """Connection to the text key -> batch file manifest, rebuilt from the batch files if it is missing."""
+        os.makedirs(self.model_dir, exist_ok=True)
+        path = os.path.join(self.model_dir, MANIFEST_NAME)
+        existed = os.path.exists(path)
+        db = sqlite3.connect(path, timeout=30)
+        db.execute("CREATE TABLE IF NOT EXISTS batch_keys (key TEXT PRIMARY KEY, batch TEXT NOT NULL)")
+        if not existed:
+            # A cache written before the manifest existed, or one whose manifest was evicted
+            for batch_path in self._batch_paths():
+                try:
+                    with np.load(batch_path) as batch:
+                        keys = batch["keys"].tolist()
+                except (OSError, ValueError, KeyError, EOFError):
+                    continue
+                self._record_batch(db, os.path.basename(batch_path)[:-len(".npz")], keys)
+            db.commit()
+        return db
+
+    @staticmethod
+    def _record_batch(db, batch_key, keys):
+        db.executemany("INSERT OR REPLACE INTO batch_keys (key, batch) VALUES (?, ?)", ((key, batch_key) for key in keys))
+
+    @staticmethod
+    def _lookup(db, keys):
+        """{batch key: [text keys]} for the `keys` listed in the manifest."""
+        batches = {}
+        keys = list(keys)
+        for start in range(0, len(keys), _SQL_VARIABLES):
+            part = keys[start:start + _SQL_VARIABLES]
+            rows = db.execute(
+                f"SELECT key, batch FROM batch_keys WHERE key IN ({','.join('?' * len(part))})", part
+            )
+            for key, batch in rows:
+                batches.setdefault(batch, []).append(key)
+        return batches
+
+    def _load_rows(self, path, positions, found):
+        """Move the vectors of `path` whose keys are in `positions` into `found`; False if the file is unreadable."""
+        try:
+            with np.load(path) as batch:
+                batch_keys = batch["keys"]
+                rows = [row for row, key in enumerate(batch_keys) if key in positions]
+                if not rows:
+                    return True
+                vectors = batch["vectors"]
+        except (OSError, ValueError, KeyError, EOFError):
+            return False
+        for row in rows:
+            for i in positions.pop(batch_keys[row], ()):
+                found[i] = vectors[row]
+        _touch(path)
+        return True
+
+    def get_many(self, texts):
+        """{position in `texts`: vector} for the texts that are cached.
+
+        The batch written for exactly these texts is read first; for the
+        chunks it does not cover, the manifest names the batches to read.
+        """
+        keys = [self.text_key(text) for text in texts]
+        positions = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(key, []).append(i)
+
+        found = {}
+        exact_key = self.batch_key(keys)
+        if os.path.exists(self._batch_path(exact_key)):
+            self._load_rows(self._batch_path(exact_key), positions, found)
+        if not positions or not os.path.isdir(self.model_dir):
+            return found
+
+        with closing(self._manifest()) as db:
+            stale = []
+            for batch_key in self._lookup(db, positions):
+                if batch_key == exact_key:
+                    continue
+                if not self._load_rows(self._batch_path(batch_key), positions, found):
+                    stale.append(batch_key)
+            if stale:
+                # Evicted or damaged batch files
+                with db:
+                    db.executemany("DELETE FROM batch_keys WHERE batch = ?", ((key,) for key in stale))
+        return found
+
+    def put_many(self, texts, vectors):
+        """Store the vectors of `texts` as one batch file and list its keys in the manifest."""
+        if not texts:
+            return
+        keys = [self.text_key(text) for text in texts]
+        batch_key = self.batch_key(keys)
+        path = self._batch_path(batch_key)
+        os.makedirs(self.model_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=np.asarray(keys), vectors=np.asarray(vectors, dtype='float32'))
+        os.replace(tmp_path, path)
+        with closing(self._manifest()) as db, db:
+            self._record_batch(db, batch_key, keys)
+        record_write(self.cache_dir, self.max_bytes, _size(path))
+
+
+# IO_FLAG_MMAP_IFC (faiss >= 1.8) also maps the vectors of flat indexes; older versions ignore IO_FLAG_MMAP for them
+_MMAP_FLAGS = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+
+class IndexStore:
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or config.PDF_CACHE_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else config.pdf_cache_max_bytes
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, "index", f"{key}.faiss")
+
+    def load(self, key):
+        path = self._entry_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            index = faiss.read_index(path, _MMAP_FLAGS)
+        except RuntimeError:
+            _remove(path)
+            return None
+        _touch(path)
+        return index
+
+    def save(self, key, index):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, path)
+        record_write(self.cache_dir, self.max_bytes, _size(path))
+
+
+_extraction_cache = None
+_index_store = None
+
+def get_extraction_cache():
+    global _extraction_cache
+    if _extraction_cache is None:
+        _extraction_cache = ExtractionCache()
+    return _extraction_cache
+
+def get_index_store():
+    global _index_store
+    if _index_store is None:
+        _index_store = IndexStore()
+    return _index_store
@@ -1,116 +1,118 @@
-import pdfplumber
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from pdfplumber.utils import within_bbox
 import re
-import tiktoken
 from datetime import datetime
-import qa_modules, config, os
-from openai_client_factory import create_chat_client
+import qa_modules, config, os, token_accounting, pdf_ingest, embedder_registry, vector_index
+from openai_client_factory import get_chat_client
+from prompt_builder import PromptBuilder, retrieval_query
+from hybrid_retrieval import BM25Index, fuse
 
 class CFDCaseExtractor:
-    def __init__(self, model_name='sentence-transformers/all-mpnet-base-v2'):
-        self.embedder = SentenceTransformer(model_name)
-        self.client = create_chat_client("DEEPSEEK_R1")
+    def __init__(self, model_name=None):
+        self.model_name = model_name or config.embedding_model_name
+        self.client = get_chat_client("DEEPSEEK_R1")
         self.gpt_model = os.environ.get("DEEPSEEK_R1_MODEL_NAME")
         self.index = None
+        self.bm25 = None
         self.chunks = []
         self.token_usage = []  # New token usage statistics storage
-        self.encoder = tiktoken.encoding_for_model("gpt-4")
+        self.encoder = token_accounting.get_encoding("gpt-4")
+
+    @property
+    def embedder(self):
+        # Loaded on first use and shared by every extractor in the process
+        return embedder_registry.get_embedder(self.model_name)
 
     def process_pdf(self, file_path):
         """Optimized PDF processing workflow (fixed bbox error)"""
-        with pdfplumber.open(file_path) as pdf:
-            text_blocks = []
-            for i, page in enumerate(pdf.pages):
-                # Define valid text area (in points)
-                bbox = (
-                    50,  # left margin
-                    50,  # top margin (skip header)
-                    page.width - 50,  # right margin
-                    page.height - 50  # bottom margin (skip footer)
-                )
-                
-                # Create filter function (key fix)
-                crop_filter = lambda obj: (
-                    obj["x0"] >= bbox[0] and
-                    obj["top"] >= bbox[1] and
-                    obj["x1"] <= bbox[2] and
-                    obj["bottom"] <= bbox[3]
-                )
-                
-                # Apply area filtering
-                cropped_page = page.filter(crop_filter)
-                
-                # Optimize text extraction parameters
-                text = cropped_page.extract_text(
-                    layout=True,
-                    x_tolerance=3,
-                    y_tolerance=2,
-                    keep_blank_chars=False,
-                    extra_attrs=["size", "fontname"]
-                )
-                
-                # Text cleaning
-                cleaned_text = self.clean_text(text, page_number=i+1)
-                if cleaned_text:
-                    text_blocks.append(cleaned_text)
-        
-        # 4. Intelligent chunking strategy
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=600,
-            chunk_overlap=100,
-            separators=[
-                r"\n\s*[A-Z][A-Z\s]+\s*:\s*\n",  # Match headings like "METHODOLOGY:"
-                r"\n\s*\d+\.\s*[A-Z]",          # Match section numbers like "3. RESULTS"
-                "\n\n"
-            ]
-        )
-        self.chunks = splitter.split_text("\n".join(text_blocks))
-        
-        # Filter empty chunks and short text
-        self.chunks = [chunk for chunk in self.chunks 
-                    if len(chunk.strip()) > 50]
-        
-        # Create FAISS index
-        embeddings = self.embedder.encode(self.chunks, 
-                                        convert_to_numpy=True,
-                                        show_progress_bar=False)
-        embeddings = np.array(embeddings).astype('float32')
+        # Parsing, chunking and embedding happen once per paper in pdf_ingest
+        document = pdf_ingest.get_document(file_path, self.model_name)
+        self.chunks = list(document.chunks)
         
-        self.index = faiss.IndexFlatL2(embeddings.shape[1])
-        self.index.add(embeddings)
+        # FAISS index, persisted per document in the pdf cache
+        self.index = pdf_ingest.get_index(document)
+        self.bm25 = BM25Index(self.chunks)
         
 
     def clean_text(self, text, page_number):
         """Multi-stage text cleaning"""
-        # Stage 1: Merge broken words
-        text = re.sub(r'(?<=\w)-\n(?=\w)', '', text)  # Connect words split by line breaks
-        
-        # Stage 2: Handle numbers and units
-        text = re.sub(r'\n(?=\d+\s*[A-Za-z]{1,3}\b)', ' ', text)  # Fix unit line breaks
-        
-        # Stage 3: Remove isolated page numbers
-        text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)
-        
-        # Stage 4: Compress whitespace
-        text = re.sub(r'\n{3,}', '\n\n', text)  # Compress multiple line breaks to two
-        text = re.sub(r'[ \t]{2,}', ' ', text)   # Compress multiple spaces to one
-        
-        # Stage 5: Filter small text segments (possibly chart annotations)
-        lines = [line.strip() for line in text.split('\n') if len(line.strip()) > 3]
-        
-        # Add page metadata
-        return f"Page {page_number}:\n" + "\n".join(lines) if lines else ""
+        return pdf_ingest.clean_text(text, page_number)
 
     def _count_tokens(self, text):
         """Use Tiktoken for precise token counting"""
-        return len(self.encoder.encode(text))
+        return token_accounting.count_tokens(text, "gpt-4")
+
+    def _retrieve(self, questions, top_k):
+        """Indices of the relevant chunks for each question (string or PromptBuilder), from one batched encode and search.
+
+        Questions are searched on `retrieval_query`: a PromptBuilder on its
+        per-call values only. In "hybrid" retrieval mode the dense
+        candidates are fused with BM25 candidates by reciprocal rank fusion.
+        A chunk qualifies if it is within the dense threshold of the question
+        or matches at least config.pdf_bm25_min_share of the BM25 weight of
+        one of the question's values.
+        """
+        queries = [retrieval_query(question) for question in questions]
+        hybrid = config.pdf_retrieval_mode == "hybrid" and self.bm25 is not None
+        search_k = max(top_k, config.pdf_retrieval_candidates) if hybrid else top_k
+
+        query_embeds = self.embedder.encode([text for text, _ in queries])
+        scores, indices = vector_index.search(self.index, query_embeds, search_k)
+
+        retrieved = []
+        for (_, segments), row_indices, row_scores in zip(queries, indices, scores):
+            dense = [int(i) for i, score in zip(row_indices, row_scores) if i >= 0 and vector_index.is_relevant(score)]
+            if not hybrid:
+                retrieved.append(dense)
+                continue
+            lexical = self.bm25.search_segments(segments, search_k, min_share=config.pdf_bm25_min_share)
+            dense_ranking = [int(i) for i in row_indices if i >= 0]
+            retrieved.append(fuse(dense_ranking, lexical, dense, top_k, k=config.pdf_rrf_k))
+        return retrieved
+
+    @staticmethod
+    def _instructions():
+        return PromptBuilder().stable(
+            "You are a CFD expert assistant. Extract technical parameters from research papers and structure answers in markdown tables. Analyze the CFD paper excerpts given below."
+        )
+
+    def _build_prompt(self, question, relevant_chunks):
+        # Instructions and the static part of the question first, paper excerpts and per-case values last
+        if not isinstance(question, PromptBuilder):
+            question = PromptBuilder().volatile("Extract specific details about", question)
+        return self._instructions().volatile("CFD paper excerpts", relevant_chunks).extend(question).build()
+
+    def _build_merged_prompt(self, questions, relevant_chunks):
+        prompt = self._instructions().stable(
+            f"Answer each of the {len(questions)} numbered questions given at the end separately. "
+            "Start the answer to question N with a line '### Answer N' and write nothing before the first answer."
+        ).volatile("CFD paper excerpts", relevant_chunks)
+        for n, question in enumerate(questions, start=1):
+            prompt.volatile(f"Question {n}", str(question))
+        return prompt.build()
+
+    @staticmethod
+    def _split_merged_answer(response, count):
+        """Answers of a merged prompt in question order, or None if the response does not follow the format."""
+        parts = re.split(r"^\s*#+\s*Answer\s+(\d+)\s*:?\s*$", response, flags=re.MULTILINE)
+        answers = {}
+        for number, answer in zip(parts[1::2], parts[2::2]):
+            answers[int(number)] = answer.strip()
+        if sorted(answers) != list(range(1, count + 1)):
+            return None
+        return [answers[n] for n in range(1, count + 1)]
+
+    @staticmethod
+    def _new_qa(context):
+        if context == True:
+            return qa_modules.QA_Context_deepseek_R1()
+        return qa_modules.QA_NoContext_deepseek_R1()
 
     def query_case_setup(self, question, top_k=3, context = False):
-        """Enhanced query method with token statistics"""
+        """Enhanced query method with token statistics
+
+        `question` is a string or a PromptBuilder; for the latter its stable
+        segments are placed ahead of the retrieved excerpts.
+        """
         try:
             # Initialize request record
             request_entry = {
@@ -127,9 +129,7 @@ class CFDCaseExtractor:
                 raise ValueError("Please process PDF document using process_pdf first")
 
             # Semantic retrieval phase
-            query_embed = self.embedder.encode([question])
-            distances, indices = self.index.search(query_embed, top_k)
-            relevant_chunks = [self.chunks[i] for i, d in zip(indices[0], distances[0]) if d < config.pdf_chunk_d]
+            relevant_chunks = [self.chunks[i] for i in self._retrieve([question], top_k)[0]]
 
             # Record context token consumption
             context_tokens = sum(self._count_tokens(chunk) for chunk in relevant_chunks)
@@ -139,21 +139,10 @@ class CFDCaseExtractor:
                 request_entry["status"] = "empty"
                 self.token_usage.append(request_entry)
                 return "No relevant CFD configuration information found"
-            
-            prompt = f'''You are a CFD expert assistant. Extract technical parameters from research papers and structure answers in markdown tables.
-            Analyze these CFD paper excerpts:
-            [[[ {relevant_chunks} ]]]
-            Extract specific details about: [[[ {question} ]]] 
-            '''
 
-            qa = None
-
-            if context == True:
-                qa = qa_modules.QA_Context_deepseek_R1()
-            else:
-                qa = qa_modules.QA_NoContext_deepseek_R1()
+            prompt = self._build_prompt(question, relevant_chunks)
 
-            R1_response = qa.ask(prompt)
+            R1_response = self._new_qa(context).ask(prompt)
 
             return R1_response
 
@@ -164,6 +153,91 @@ class CFDCaseExtractor:
             })
             self.token_usage.append(request_entry)
             return f"Processing error: {str(e)}"
+
+    def _group_questions(self, retrieved):
+        """Greedily merge questions whose retrieved chunks overlap, within the configured caps."""
+        groups = []  # [question positions, chunk indices in retrieval order]
+        for position, chunk_ids in enumerate(retrieved):
+            if not chunk_ids:
+                continue
+            for members, group_chunks in groups:
+                union = group_chunks + [i for i in chunk_ids if i not in group_chunks]
+                if (set(chunk_ids) & set(group_chunks)
+                        and len(members) < config.pdf_merge_max_questions
+                        and len(union) <= config.pdf_merge_max_chunks):
+                    members.append(position)
+                    group_chunks[:] = union
+                    break
+            else:
+                groups.append(([position], list(chunk_ids)))
+        return groups
+
+    def query_many(self, questions, top_k=3, context = False):
+        """Answer several independent questions about the paper.
+
+        All questions are embedded in one batch and searched with a single
+        index.search call. Questions whose excerpts overlap are answered by
+        one merged R1 prompt (falling back to separate prompts if the merged
+        answer cannot be split); the remaining prompts run concurrently when
+        `context` is False. Returns the answers in question order.
+
+        main_run_chatcfd.pdf_chunk_ask does not use this: each of its prompts
+        contains the answer to the previous one.
+        """
+        if not self.index:
+            raise ValueError("Please process PDF document using process_pdf first")
+
+        questions = list(questions)
+        retrieved = self._retrieve(questions, top_k)
+        answers = ["No relevant CFD configuration information found"] * len(questions)
+        for question, chunk_ids in zip(questions, retrieved):
+            if not chunk_ids:
+                self.token_usage.append({
+                    "timestamp": datetime.now().isoformat(),
+                    "question": question,
+                    "context_tokens": 0,
+                    "status": "empty",
+                    "error": None
+                })
+
+        groups = self._group_questions(retrieved)
+        prompts = []
+        for members, chunk_ids in groups:
+            relevant_chunks = [self.chunks[i] for i in chunk_ids]
+            if len(members) == 1:
+                prompts.append(self._build_prompt(questions[members[0]], relevant_chunks))
+            else:
+                prompts.append(self._build_merged_prompt([questions[m] for m in members], relevant_chunks))
+
+        responses = self._ask_all(prompts, context)
+
+        retry = []
+        for (members, chunk_ids), response in zip(groups, responses):
+            if len(members) == 1:
+                answers[members[0]] = response
+                continue
+            split = self._split_merged_answer(response, len(members))
+            if split is None:
+                retry.extend((m, chunk_ids) for m in members)
+                continue
+            for member, answer in zip(members, split):
+                answers[member] = answer
+
+        if retry:
+            # The merged answer did not follow the format: ask those questions one by one
+            responses = self._ask_all(
+                [self._build_prompt(questions[m], [self.chunks[i] for i in retrieved[m]]) for m, _ in retry],
+                context
+            )
+            for (member, _), response in zip(retry, responses):
+                answers[member] = response
+
+        return answers
+
+    def _ask_all(self, prompts, context):
+        if context == True:
+            return [self._new_qa(context).ask(prompt) for prompt in prompts]
+        return qa_modules.ask_many(qa_modules.QA_NoContext_deepseek_R1(), prompts)
     
     
     # def _validate_response(self, response):
@@ -0,0 +1,534 @@
+"""Single ingest stage for research papers.
+
+`get_document` parses a PDF once and returns an immutable `PaperDocument`
+holding the plain page text, the cleaned layout text, tables, retrieval
+chunks and (computed on first use) their embeddings. ChatBot, main_run_chatcfd and CFDCaseExtractor
+all read from the same document instead of re-parsing the file.
+
+Pages are parsed by `extract_pages`, optionally spreading contiguous page
+ranges over a process pool. Each worker opens the PDF once for its range;
+results are returned in page order.
+
+For theses and long reports `stream_pdf` is the bounded-memory path: pages
+are parsed one at a time (`iter_pages`), chunked a window at a time
+(`iter_chunks`) and embedded in batches sized by a memory budget, so only
+one page, a window of text and one batch are held at once.
+"""
+import multiprocessing
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+import numpy as np
+import pdfplumber
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+import config
+import embedder_registry
+import pdf_cache
+import vector_index
+
+CHUNK_SIZE = 600
+CHUNK_OVERLAP = 100
+# Chunks with fewer (stripped) characters than this are dropped
+MIN_CHUNK_CHARS = 50
+# Regular expressions, tried in order; the last ones guarantee chunks of at most CHUNK_SIZE
+CHUNK_SEPARATORS = (
+    r"\n\s*[A-Z][A-Z\s]+\s*:\s*\n",  # Match headings like "METHODOLOGY:"
+    r"\n\s*\d+\.\s*[A-Z]",          # Match section numbers like "3. RESULTS"
+    r"\n\n",
+    r"\n",
+    r" "
+)
+
+# Parsed documents kept in memory by get_document
+MAX_CACHED_DOCUMENTS = 4
+
+# iter_chunks splits the text once this many characters are buffered
+CHUNK_WINDOW_CHARS = 50 * CHUNK_SIZE
+# Rough peak memory per chunk in an embedding batch (text, vector and encoder activations)
+STREAM_BYTES_PER_CHUNK = 2 * 1024 * 1024
+
+# Bump when the output of clean_text/_extract_page changes so that cached extractions are redone
+EXTRACTOR_VERSION = 4
+
+# Header/footer/side margins (in points) excluded from the text area
+PAGE_MARGIN = 50
+X_TOLERANCE = 3
+Y_TOLERANCE = 2
+
+TABLE_DETECTION_MODES = ("heuristic", "all")
+TABLE_CAPTION = re.compile(r"^\s*(?:Table|TABLE|Tab\.)\s*[\dIVX]+", re.MULTILINE)
+# A page without a "Table N" caption needs this many ruling lines (edges) and
+# this many characters per edge inside the ruled area before extract_tables runs
+TABLE_MIN_RULES = 16
+TABLE_MIN_CHARS_PER_RULE = 0.5
+
+
+def extractor_settings():
+    """Everything that determines the pages and chunks produced for a given PDF."""
+    return {
+        "version": EXTRACTOR_VERSION,
+        "page_margin": PAGE_MARGIN,
+        "x_tolerance": X_TOLERANCE,
+        "y_tolerance": Y_TOLERANCE,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "chunk_separators": list(CHUNK_SEPARATORS),
+        "chunk_window_chars": CHUNK_WINDOW_CHARS,
+        "min_chunk_chars": MIN_CHUNK_CHARS,
+        "table_detection": config.pdf_table_detection
+    }
+
+
+def clean_text(text, page_number):
+    """Multi-stage text cleaning"""
+    # Stage 1: Merge broken words
+    text = re.sub(r'(?<=\w)-\n(?=\w)', '', text)  # Connect words split by line breaks
+    
+    # Stage 2: Handle numbers and units
+    text = re.sub(r'\n(?=\d+\s*[A-Za-z]{1,3}\b)', ' ', text)  # Fix unit line breaks
+    
+    # Stage 3: Remove isolated page numbers
+    text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)
+    
+    # Stage 4: Compress whitespace
+    text = re.sub(r'\n{3,}', '\n\n', text)  # Compress multiple line breaks to two
+    text = re.sub(r'[ \t]{2,}', ' ', text)   # Compress multiple spaces to one
+    
+    # Stage 5: Filter small text segments (possibly chart annotations)
+    lines = [line.strip() for line in text.split('\n') if len(line.strip()) > 3]
+    
+    # Add page metadata
+    return f"Page {page_number}:\n" + "\n".join(lines) if lines else ""
+
+
+def extract_page_text(page):
+    """Layout-mode text of a pdfplumber page without its header, footer and side margins."""
+    # Define valid text area (in points)
+    bbox = (
+        PAGE_MARGIN,  # left margin
+        PAGE_MARGIN,  # top margin (skip header)
+        page.width - PAGE_MARGIN,  # right margin
+        page.height - PAGE_MARGIN  # bottom margin (skip footer)
+    )
+    
+    # Filter on object positions rather than cropping, which fails on objects crossing the bbox
+    crop_filter = lambda obj: (
+        obj["x0"] >= bbox[0] and
+        obj["top"] >= bbox[1] and
+        obj["x1"] <= bbox[2] and
+        obj["bottom"] <= bbox[3]
+    )
+    
+    cropped_page = page.filter(crop_filter)
+    
+    return cropped_page.extract_text(
+        layout=True,
+        x_tolerance=X_TOLERANCE,
+        y_tolerance=Y_TOLERANCE,
+        keep_blank_chars=False,
+        extra_attrs=["size", "fontname"]
+    )
+
+
+@dataclass(frozen=True)
+class Page:
+    number: int
+    # pdfplumber's default extract_text() output
+    text: str
+    # Layout-mode text without margins, after clean_text (prefixed with "Page N:")
+    layout_text: str
+    tables: tuple
+
+
+def _freeze_table(table):
+    return tuple(tuple(row) for row in table)
+
+
+def may_contain_tables(page, text):
+    """Cheap pre-pass deciding whether `page.extract_tables()` is worth running.
+
+    pdfplumber's default table strategy builds cells from ruling lines, so a
+    page with fewer than two horizontal and two vertical edges cannot yield a
+    table. Pages with a "Table N" caption are always extracted. Otherwise the
+    page needs TABLE_MIN_RULES edges with text between them: meshes and plots
+    drawn as vector lines are grids without text, and extract_tables spends
+    seconds turning them into junk tables.
+    """
+    edges = page.edges
+    horizontal = sum(1 for edge in edges if edge["orientation"] == "h")
+    vertical = len(edges) - horizontal
+    if horizontal < 2 or vertical < 2:
+        return False
+    if TABLE_CAPTION.search(text):
+        return True
+    if len(edges) < TABLE_MIN_RULES:
+        return False
+
+    x0 = min(edge["x0"] for edge in edges)
+    x1 = max(edge["x1"] for edge in edges)
+    top = min(edge["top"] for edge in edges)
+    bottom = max(edge["bottom"] for edge in edges)
+    chars = sum(
+        1 for char in page.chars
+        if x0 <= char["x0"] and char["x1"] <= x1 and top <= char["top"] and char["bottom"] <= bottom
+    )
+    return chars >= TABLE_MIN_CHARS_PER_RULE * len(edges)
+
+
+def _extract_page(page, page_number, table_detection="heuristic"):
+    text = page.extract_text() or ""
+    if table_detection == "all" or may_contain_tables(page, text):
+        tables = tuple(_freeze_table(table) for table in page.extract_tables())
+    else:
+        tables = ()
+    return Page(
+        number=page_number,
+        text=text,
+        layout_text=clean_text(extract_page_text(page), page_number),
+        tables=tables
+    )
+
+
+def iter_pages(file_path, page_numbers=None, table_detection="heuristic"):
+    """Parsed `Page`s for the given 1-based page numbers (default: all), one at a time."""
+    with pdfplumber.open(file_path) as pdf:
+        if page_numbers is None:
+            page_numbers = range(1, len(pdf.pages) + 1)
+        for page_number in page_numbers:
+            page = pdf.pages[page_number - 1]
+            try:
+                yield _extract_page(page, page_number, table_detection)
+            finally:
+                # Release the page's parsed objects; large papers otherwise keep every page in memory
+                page.close()
+
+
+def _extract_page_range(file_path, page_numbers, table_detection="heuristic"):
+    """Worker: parsed `Page`s for the given 1-based page numbers."""
+    return list(iter_pages(file_path, page_numbers, table_detection))
+
+
+def page_count(file_path):
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def _page_ranges(page_count, parts):
+    size, extra = divmod(page_count, parts)
+    ranges, start = [], 1
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def _pool_context():
+    """Start method of the extraction pool.
+
+    Not fork: the caller is multithreaded (Streamlit script threads, the QA
+    log writer, HTTP connection pools), and a forked child can deadlock on a
+    lock another thread held at fork time. The fork server is a fresh
+    single-threaded process that imports this module once and forks the
+    workers from there, so they start almost as fast as forked ones.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _check_table_detection(table_detection):
+    if table_detection not in TABLE_DETECTION_MODES:
+        raise ValueError(f"Unknown table detection '{table_detection}', expected one of {TABLE_DETECTION_MODES}")
+
+
+def extract_pages(file_path, workers=1, min_pages_per_worker=4, table_detection="heuristic"):
+    """Parse every page of a PDF into `Page`s, in page order.
+
+    With `workers` > 1 the pages are split into contiguous ranges and
+    extracted in a process pool; small documents are extracted inline.
+    `table_detection` "heuristic" runs table extraction only on the pages
+    `may_contain_tables` accepts, "all" on every page.
+    """
+    _check_table_detection(table_detection)
+    pages_total = page_count(file_path)
+
+    workers = min(workers or 1, os.cpu_count() or 1, pages_total // max(min_pages_per_worker, 1))
+    if workers <= 1:
+        return _extract_page_range(file_path, range(1, pages_total + 1), table_detection)
+
+    # Two ranges per worker so that one slow (figure-heavy) range does not stall the pool
+    ranges = _page_ranges(pages_total, workers * 2)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+            results = pool.map(_extract_page_range, [file_path] * len(ranges), ranges, [table_detection] * len(ranges))
+            pages = [page for batch in results for page in batch]
+    except (BrokenProcessPool, OSError) as e:
+        print(f"Parallel PDF extraction failed ({e}), extracting pages sequentially.")
+        return _extract_page_range(file_path, range(1, pages_total + 1), table_detection)
+
+    return sorted(pages, key=lambda page: page.number)
+
+
+def _splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        separators=list(CHUNK_SEPARATORS),
+        is_separator_regex=True,
+        add_start_index=True
+    )
+
+
+def iter_chunks(texts, window_chars=CHUNK_WINDOW_CHARS):
+    """Retrieval chunks of the newline-joined `texts` (e.g. page layout texts), in order.
+
+    Text is buffered until `window_chars` characters are available and then
+    split; the last two pieces of a window may continue in the next text, so
+    the buffer restarts where the second-to-last one starts. Memory stays
+    proportional to the window instead of the whole paper.
+    """
+    splitter = _splitter()
+    buffer = ""
+    for text in texts:
+        if not text:
+            continue
+        buffer = f"{buffer}\n{text}" if buffer else text
+        if len(buffer) < window_chars:
+            continue
+        pieces = splitter.create_documents([buffer])
+        if len(pieces) < 3:
+            continue
+        for piece in pieces[:-2]:
+            # Filter empty chunks and short text
+            if len(piece.page_content.strip()) > MIN_CHUNK_CHARS:
+                yield piece.page_content
+        buffer = buffer[pieces[-2].metadata["start_index"]:]
+
+    if buffer:
+        for piece in splitter.split_text(buffer):
+            if len(piece.strip()) > MIN_CHUNK_CHARS:
+                yield piece
+
+
+def split_chunks(text):
+    """Retrieval chunks of the layout text of a paper."""
+    return list(iter_chunks([text]))
+
+
+def embed_chunks(embedding_model, chunks):
+    """float32 embedding matrix of `chunks`; only chunks missing from the embedding cache are encoded."""
+    chunks = list(chunks)
+    cache = pdf_cache.EmbeddingCache(embedder_registry.embedding_id(embedding_model)) if config.pdf_cache_enabled else None
+    cached = cache.get_many(chunks) if cache else {}
+
+    missing = [i for i in range(len(chunks)) if i not in cached]
+    if missing:
+        encoded = embedder_registry.get_embedder(embedding_model).encode(
+            [chunks[i] for i in missing], convert_to_numpy=True, show_progress_bar=False
+        )
+        encoded = np.asarray(encoded, dtype='float32')
+        if cache:
+            cache.put_many([chunks[i] for i in missing], encoded)
+        cached.update(zip(missing, encoded))
+
+    if chunks:
+        embeddings = np.ascontiguousarray(np.stack([cached[i] for i in range(len(chunks))]), dtype='float32')
+    else:
+        embeddings = np.zeros((0, 0), dtype='float32')
+    embeddings.setflags(write=False)
+    return embeddings
+
+
+@dataclass(frozen=True)
+class PaperDocument:
+    path: str
+    # sha256 of the PDF file
+    content_hash: str
+    pages: tuple
+    chunks: tuple
+    embedding_model: str
+    # embedding_model plus the embedding backend (see embedder_registry.embedding_id)
+    embedding_id: str
+    _embeddings: np.ndarray = field(default=None, init=False, repr=False, compare=False)
+    _embeddings_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    @property
+    def embeddings(self):
+        """float32 array of shape (len(chunks), dim), read-only.
+
+        Computed on first access, so consumers that only read the text never
+        load the embedder.
+        """
+        if self._embeddings is None:
+            with self._embeddings_lock:
+                if self._embeddings is None:
+                    object.__setattr__(self, "_embeddings", embed_chunks(self.embedding_model, self.chunks))
+        return self._embeddings
+
+    @property
+    def text(self):
+        """Plain text of the whole paper (one line break after every non-empty page)."""
+        return "".join(page.text + "\n" for page in self.pages if page.text)
+
+    @property
+    def layout_text(self):
+        return "\n".join(page.layout_text for page in self.pages if page.layout_text)
+
+    @property
+    def tables(self):
+        return tuple(table for page in self.pages for table in page.tables)
+
+
+def _pages_to_json(pages):
+    return [[page.number, page.text, page.layout_text, page.tables] for page in pages]
+
+
+def _pages_from_json(entries):
+    return tuple(
+        Page(number, text, layout_text, tuple(_freeze_table(table) for table in tables))
+        for number, text, layout_text, tables in entries
+    )
+
+
+def extract_document(file_path, content_hash):
+    """(pages, chunks) of a paper, from the extraction cache when possible."""
+    cache = pdf_cache.get_extraction_cache() if config.pdf_cache_enabled else None
+    key = pdf_cache.settings_key(content_hash, extractor_settings())
+
+    entry = cache.get(key) if cache else None
+    if entry is not None:
+        return _pages_from_json(entry["pages"]), tuple(entry["chunks"])
+
+    pages = tuple(extract_pages(
+        file_path,
+        workers=config.pdf_extract_workers,
+        min_pages_per_worker=config.pdf_extract_min_pages_per_worker,
+        table_detection=config.pdf_table_detection
+    ))
+    chunks = tuple(iter_chunks(page.layout_text for page in pages))
+    if cache:
+        cache.put(key, {"pages": _pages_to_json(pages), "chunks": list(chunks)})
+    return pages, chunks
+
+
+def ingest_pdf(file_path, embedding_model=None):
+    """Parse and chunk a paper; its chunks are embedded on first use of `embeddings`."""
+    embedding_model = embedding_model or config.embedding_model_name
+    content_hash = pdf_cache.file_sha256(file_path)
+    pages, chunks = extract_document(file_path, content_hash)
+    return PaperDocument(
+        path=os.path.abspath(file_path),
+        content_hash=content_hash,
+        pages=pages,
+        chunks=chunks,
+        embedding_model=embedding_model,
+        embedding_id=embedder_registry.embedding_id(embedding_model)
+    )
+
+
+def stream_batch_size(memory_budget=None):
+    """Chunks per embedding batch of `stream_pdf` that fit in `memory_budget` bytes."""
+    memory_budget = memory_budget or config.pdf_ingest_memory_budget
+    return max(1, int(memory_budget // STREAM_BYTES_PER_CHUNK))
+
+
+def stream_pdf(file_path, embedding_model=None, memory_budget=None, table_detection=None):
+    """Yield (chunks, embeddings) batches of a paper in order, parsing one page at a time.
+
+    Unlike `ingest_pdf`, nothing is kept for the whole paper: the caller
+    consumes each batch (see paper_library) before the next one is built.
+    Batches hold at most `stream_batch_size(memory_budget)` chunks.
+    """
+    embedding_model = embedding_model or config.embedding_model_name
+    table_detection = table_detection or config.pdf_table_detection
+    _check_table_detection(table_detection)
+    batch_size = stream_batch_size(memory_budget)
+
+    pages = iter_pages(file_path, table_detection=table_detection)
+    batch = []
+    for chunk in iter_chunks(page.layout_text for page in pages):
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield tuple(batch), embed_chunks(embedding_model, batch)
+            batch = []
+    if batch:
+        yield tuple(batch), embed_chunks(embedding_model, batch)
+
+
+def document_key(document):
+    """Cache key of everything derived from a document: file content, extractor settings and embedding model."""
+    return pdf_cache.settings_key(
+        document.content_hash,
+        {**extractor_settings(), "embedding_model": document.embedding_id, **vector_index.index_settings()}
+    )
+
+
+def get_index(document):
+    """FAISS index over `document.embeddings` (see vector_index), loaded from disk (memory-mapped) when it was built before.
+
+    A loaded index does not need the embeddings, so the chunks are only embedded when the index is built.
+    """
+    store = pdf_cache.get_index_store() if config.pdf_cache_enabled else None
+    key = document_key(document)
+
+    index = store.load(key) if store else None
+    if index is not None and index.ntotal == len(document.chunks):
+        return vector_index.configure_search(index)
+
+    index = vector_index.build_index(document.embeddings)
+    if store:
+        store.save(key, index)
+    return vector_index.configure_search(index)
+
+
+_documents = OrderedDict()
+# Guards _documents and _ingest_locks only; parsing happens outside it
+_documents_lock = threading.Lock()
+# One lock per document being ingested, so that a second caller for the same paper waits
+# for the first instead of parsing it again, while other papers are ingested concurrently
+_ingest_locks = {}
+
+
+def _cached_document(key):
+    with _documents_lock:
+        document = _documents.get(key)
+        if document is not None:
+            _documents.move_to_end(key)
+        return document
+
+
+def get_document(file_path, embedding_model=None):
+    """The `PaperDocument` for `file_path`, parsed at most once per file version."""
+    embedding_model = embedding_model or config.embedding_model_name
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, embedder_registry.embedding_id(embedding_model))
+
+    document = _cached_document(key)
+    if document is not None:
+        return document
+
+    with _documents_lock:
+        ingest_lock = _ingest_locks.setdefault(key, threading.Lock())
+    with ingest_lock:
+        try:
+            document = _cached_document(key)
+            if document is None:
+                document = ingest_pdf(file_path, embedding_model)
+                with _documents_lock:
+                    _documents[key] = document
+                    while len(_documents) > MAX_CACHED_DOCUMENTS:
+                        _documents.popitem(last=False)
+        finally:
+            with _documents_lock:
+                _ingest_locks.pop(key, None)
+    return document
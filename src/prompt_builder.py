@@ -0,0 +1,72 @@
+"""Prompt layout that keeps provider-side prefix caches warm.
+
+Endpoints such as DeepSeek and OpenAI cache the KV state of prompt prefixes
+they have already seen. A prefix only matches if it is byte-identical, so
+anything that changes from call to call (runtime errors, current file
+contents) has to come after the parts that don't (instructions, keyword
+lists, reference files). `PromptBuilder` enforces that order: stable
+segments are always emitted first, in the order they were added, followed by
+the volatile tail.
+
+The volatile values are also what distinguishes one question from another,
+so `retrieval_query` searches on them rather than on the whole prompt.
+"""
+
+
+class PromptBuilder:
+    def __init__(self):
+        self._stable: list[str] = []
+        self._volatile: list[tuple[str, str]] = []
+
+    def stable(self, text):
+        """Add a segment that is identical across calls (instructions, keyword lists, references)."""
+        if text:
+            self._stable.append(text.strip())
+        return self
+
+    def volatile(self, label, value):
+        """Add a per-call value, emitted after all stable segments as `label: [[[ value ]]]`."""
+        self._volatile.append((label, str(value)))
+        return self
+
+    def extend(self, other):
+        """Append another builder's stable and volatile segments to this one."""
+        self._stable.extend(other._stable)
+        self._volatile.extend(other._volatile)
+        return self
+
+    @property
+    def stable_prefix(self):
+        return "\n\n".join(self._stable)
+
+    @property
+    def volatile_tail(self):
+        return "\n\n".join(f"{label}: [[[ {value} ]]]" for label, value in self._volatile)
+
+    @property
+    def volatile_items(self):
+        """[(label, value)] of the per-call values, in the order they were added."""
+        return list(self._volatile)
+
+    def build(self):
+        return "\n\n".join(part for part in (self.stable_prefix, self.volatile_tail) if part)
+
+    def __str__(self):
+        return self.build()
+
+
+def retrieval_query(question):
+    """(text for the dense search, segments for the lexical search) of a question string or PromptBuilder.
+
+    A PromptBuilder is searched on its non-empty volatile values only: the
+    stable part (instructions, keyword lists) is the same for every paper
+    and would dominate both searches. Each value is a separate lexical
+    segment, so a list of boundary names can match the chunk that gives
+    them without having to match the rest of the prompt as well.
+    """
+    if isinstance(question, PromptBuilder):
+        items = [(label, value) for label, value in question.volatile_items if value.strip()]
+        if items:
+            return "\n".join(f"{label}: {value}" for label, value in items), [value for _, value in items]
+    text = str(question)
+    return text, [text]
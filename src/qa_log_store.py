@@ -0,0 +1,193 @@
+"""Append-only JSONL storage for the QA logs written by GlobalLogManager.
+
+Full log entries are written by a background thread (`BackgroundLogWriter`);
+the process itself only keeps `summarize_entry` summaries in memory.
+
+Log entries are serialized once and buffered; the buffer is appended to the
+`.jsonl` file every `flush_every` entries or `flush_interval` seconds, so the
+cost of a log write no longer grows with the number of earlier calls.
+`export_json` compacts a JSONL log back into the indented JSON list that
+`all_qa_logs.json` used to contain:
+
+    python qa_log_store.py run_chatcfd/<case>/all_qa_logs.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+# Large text fields that are spilled to disk and replaced by hashes in memory
+BODY_FIELDS = ("user_prompt", "assistant_response", "reasoning_content")
+
+_FLUSH = object()
+
+
+class JsonlLogSink:
+    def __init__(self, path, flush_every=20, flush_interval=5.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._buffer.append(line)
+            due = (
+                len(self._buffer) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            if due:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(self._buffer) + "\n")
+        self._buffer.clear()
+
+    def close(self):
+        self.flush()
+
+
+class BackgroundLogWriter:
+    """Appends log entries to JSONL files from a daemon thread.
+
+    `submit` only enqueues; serialization and file I/O happen on the writer
+    thread. The queue is bounded, so a caller blocks instead of piling up
+    entries in memory when the disk cannot keep up.
+    """
+
+    def __init__(self, max_queue=1000, flush_every=20, flush_interval=5.0):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._sinks = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="qa-log-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, path, entry):
+        self._ensure_started()
+        self._queue.put((path, entry))
+
+    def flush(self):
+        """Block until everything submitted so far has been written."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush_sinks()
+                continue
+            try:
+                if item is _FLUSH:
+                    self._flush_sinks()
+                else:
+                    path, entry = item
+                    sink = self._sinks.get(path)
+                    if sink is None:
+                        sink = self._sinks[path] = JsonlLogSink(path, self.flush_every, self.flush_interval)
+                    sink.append(entry)
+            except Exception as e:
+                print(f"QA log writer failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _flush_sinks(self):
+        for sink in self._sinks.values():
+            sink.flush()
+        # Case log paths change from case to case; do not keep idle sinks around
+        self._sinks.clear()
+
+
+def summarize_entry(entry):
+    """Compact in-memory form of a log entry: body fields replaced by their hashes."""
+    summary = {k: v for k, v in entry.items() if k not in BODY_FIELDS}
+    for field in BODY_FIELDS:
+        value = entry.get(field)
+        if value is not None:
+            summary[f"{field}_sha256"] = hashlib.sha256(str(value).encode("utf-8")).hexdigest()
+    return summary
+
+
+def prune_spill_files(spill_dir, keep_days):
+    """Remove spill files from earlier processes that are older than `keep_days`."""
+    if keep_days is None or not os.path.isdir(spill_dir):
+        return
+    cutoff = time.time() - keep_days * 86400
+    for name in os.listdir(spill_dir):
+        path = os.path.join(spill_dir, name)
+        try:
+            if name.endswith(".jsonl") and os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def read_jsonl(path):
+    """Yield the entries of a JSONL log, skipping a truncated last line."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def export_json(jsonl_path, json_path=None):
+    """Write the entries of `jsonl_path` as one indented JSON list (the legacy format)."""
+    if json_path is None:
+        json_path = os.path.splitext(jsonl_path)[0] + ".json"
+
+    # Stream the entries so that the whole log never has to be held as one string
+    tmp_path = f"{json_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write("[")
+        count = 0
+        for entry in read_jsonl(jsonl_path):
+            out.write(",\n  " if count else "\n  ")
+            out.write(json.dumps(entry, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+            count += 1
+        out.write("\n]" if count else "]")
+    os.replace(tmp_path, json_path)
+    return json_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a JSONL QA log to the all_qa_logs.json format.")
+    parser.add_argument("jsonl_path")
+    parser.add_argument("json_path", nargs="?")
+    args = parser.parse_args()
+    print(export_json(args.jsonl_path, args.json_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,172 @@
 import os
+import sys
 import config
 from datetime import datetime
-import tiktoken
 import json
-from openai_client_factory import create_chat_client
+import time
+import hashlib
+import asyncio
+import atexit
+import openai
+import token_accounting
+import llm_rate_limiter
+from context_window import ConversationWindow
+from qa_log_store import BackgroundLogWriter, export_json, prune_spill_files, read_jsonl, summarize_entry
+from openai_client_factory import get_chat_client, get_async_chat_client, aclose_async_chat_clients
 
 def estimate_tokens(text: str, model_name: str) -> int:
     """Use tiktoken to estimate token count"""
-    try:
-        encoding = tiktoken.encoding_for_model(model_name)
-    except KeyError:
-        # If model not recognized, default to cl100k_base (GPT-4 encoding)
-        encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(text))
+    return token_accounting.count_tokens(text, model_name)
+
+# Frames from these modules are skipped when looking for the code that asked the question
+_CALL_SITE_SKIP_MODULES = {__name__, "asyncio", "concurrent", "threading", "llm_rate_limiter", "contextlib", "runpy"}
+
+def _call_site():
+    """`module.function` of the first caller outside qa_modules and the asyncio machinery."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "").split(".")[0]
+        if module not in _CALL_SITE_SKIP_MODULES:
+            stem = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+            return f"{stem}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+def _timing_fields(result, output_tokens, cache_hit):
+    fields = {"call_site": _call_site()}
+    if cache_hit:
+        # Timings stored with a cached result belong to the original call
+        return fields
+
+    wall_time = result.get("wall_time")
+    generation_time = result.get("decode_time") or wall_time
+    fields.update({
+        "wall_time": wall_time,
+        "ttft": result.get("ttft"),
+        "tokens_per_second": output_tokens / generation_time if generation_time else None
+    })
+    return fields
+
+LATENCY_PERCENTILES = (50, 95, 99)
+# Upper bounds (seconds) of the wall time histogram buckets
+WALL_TIME_BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300)
+
+def _percentile(sorted_values, p):
+    """Linearly interpolated percentile of an already sorted list."""
+    rank = (len(sorted_values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+def _distribution(values):
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    summary = {"count": len(values), "mean": sum(values) / len(values), "max": values[-1]}
+    for p in LATENCY_PERCENTILES:
+        summary[f"p{p}"] = _percentile(values, p)
+    return summary
+
+def _wall_time_histogram(values):
+    histogram = {f"<={bound}s": 0 for bound in WALL_TIME_BUCKETS}
+    histogram[f">{WALL_TIME_BUCKETS[-1]}s"] = 0
+    for value in values:
+        for bound in WALL_TIME_BUCKETS:
+            if value <= bound:
+                histogram[f"<={bound}s"] += 1
+                break
+        else:
+            histogram[f">{WALL_TIME_BUCKETS[-1]}s"] += 1
+    return histogram
+
+def _latency_statistics(logs, key):
+    groups = {}
+    for log in logs:
+        if log.get("cache_hit") or log.get("wall_time") is None:
+            continue
+        groups.setdefault(log.get(key) or "unknown", []).append(log)
+
+    stats = {}
+    for name, entries in sorted(groups.items()):
+        wall_times = [e["wall_time"] for e in entries]
+        stats[name] = {
+            "calls": len(entries),
+            "total_wall_time": sum(wall_times),
+            "wall_time": _distribution(wall_times),
+            "wall_time_histogram": _wall_time_histogram(wall_times),
+            "ttft": _distribution(e.get("ttft") for e in entries),
+            "tokens_per_second": _distribution(e.get("tokens_per_second") for e in entries)
+        }
+    return stats
 
 class GlobalLogManager:
+    """Process-wide QA log.
+
+    `logs` only holds compact summaries (token counts, flags and body hashes);
+    full entries are spilled to a per-process JSONL file under QA_LOG_PATH,
+    and to the case's all_qa_logs.jsonl when `config.case_log_write` is set,
+    by a background writer thread.
+    """
     _instance = None
     logs = []
+    metrics = {}
+    _writer = None
+    _spill_path = None
+    _case_log_path = None
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
+
+    @classmethod
+    def _get_writer(cls):
+        if cls._writer is None:
+            cls._writer = BackgroundLogWriter(config.log_queue_size, config.log_flush_every, config.log_flush_interval)
+            config.ensure_directory_exists(config.QA_LOG_PATH)
+            prune_spill_files(config.QA_LOG_PATH, config.log_spill_keep_days)
+            started = datetime.now().strftime("%Y%m%d_%H%M%S")
+            cls._spill_path = f'{config.QA_LOG_PATH}/qa_logs_{started}_{os.getpid()}.jsonl'
+        return cls._writer
     
     @classmethod
-    def _save_case_log(cls):
+    def _save_case_log(cls, log_entry):
         if config.case_log_write:
-            config.ensure_directory_exists(config.OUTPUT_PATH)
-            log_file_path = f'{config.OUTPUT_PATH}/all_qa_logs.json'
-            with open(log_file_path, 'w', encoding='utf-8') as f:
-                json.dump(cls.logs, f, ensure_ascii=False, indent=2)
+            cls._case_log_path = f'{config.OUTPUT_PATH}/all_qa_logs.jsonl'
+            cls._get_writer().submit(cls._case_log_path, log_entry)
 
     @classmethod
     def add_log(cls, log_entry):
-        cls.logs.append(log_entry)
-        cls._save_case_log()
+        log_entry["log_id"] = len(cls.logs)
+        cls._get_writer().submit(cls._spill_path, log_entry)
+        cls._save_case_log(log_entry)
+        cls.logs.append(summarize_entry(log_entry))
+        if log_entry.get("prompt_cache_hit_tokens"):
+            cls.increment_metric("prompt_cache_hit_tokens", log_entry["prompt_cache_hit_tokens"])
+
+    @classmethod
+    def flush(cls):
+        if cls._writer is not None:
+            cls._writer.flush()
+
+    @classmethod
+    def full_logs(cls):
+        """Yield the full entries (with prompts and responses) logged by this process."""
+        cls.flush()
+        if cls._spill_path and os.path.exists(cls._spill_path):
+            yield from read_jsonl(cls._spill_path)
+
+    @classmethod
+    def export_case_log(cls):
+        """Flush the case log and write it out as all_qa_logs.json as well."""
+        cls.flush()
+        if not cls._case_log_path or not os.path.exists(cls._case_log_path):
+            return None
+        return export_json(cls._case_log_path)
+
+    @classmethod
+    def increment_metric(cls, name, amount=1):
+        cls.metrics[name] = cls.metrics.get(name, 0) + amount
     
     @classmethod
     def _generate_statistics(cls):
@@ -42,17 +174,21 @@ class GlobalLogManager:
             "deepseek-v3": {
                 "total_calls": 0,
                 "total_prompt_tokens": 0,
-                "total_response_tokens": 0
+                "total_response_tokens": 0,
+                "total_prompt_cache_hit_tokens": 0
             },
             "deepseek-r1": {
                 "total_calls": 0,
                 "total_prompt_tokens": 0,
                 "total_response_tokens": 0,
-                "total_reasoning_tokens": 0
+                "total_reasoning_tokens": 0,
+                "total_prompt_cache_hit_tokens": 0
             }
         }
         
         for log in cls.logs:
+            if log.get("cache_hit"):
+                continue
             model_type = log["model_type"]
             if model_type == "deepseek-v3":
                 stats[model_type]["total_calls"] += 1
@@ -63,14 +199,37 @@ class GlobalLogManager:
                 stats[model_type]["total_prompt_tokens"] += log["prompt_tokens"]
                 stats[model_type]["total_response_tokens"] += log["response_tokens"]
                 stats[model_type]["total_reasoning_tokens"] += log["reasoning_tokens"]
+            if model_type in stats:
+                stats[model_type]["total_prompt_cache_hit_tokens"] += log.get("prompt_cache_hit_tokens") or 0
+
+        stats["latency"] = {
+            "by_model": _latency_statistics(cls.logs, "model_type"),
+            "by_call_site": _latency_statistics(cls.logs, "call_site")
+        }
+
+        stats["rate_limiter"] = llm_rate_limiter.get_metrics()
+
+        stats["response_cache"] = {
+            "hits": cls.metrics.get("response_cache_hits", 0),
+            "misses": cls.metrics.get("response_cache_misses", 0)
+        }
+
+        stats["error_rules"] = {
+            "hits": cls.metrics.get("error_rules_hits", 0),
+            "llm_fallbacks": cls.metrics.get("error_rules_llm_fallbacks", 0)
+        }
         
         return stats
     
     @classmethod
     def save_logs(cls, log_file="all_qa_logs.json", stats_file=None):
         # Save original logs
-        with open(log_file, 'w', encoding='utf-8') as f:
-            json.dump(cls.logs, f, ensure_ascii=False, indent=2)
+        cls.flush()
+        if cls._spill_path and os.path.exists(cls._spill_path):
+            export_json(cls._spill_path, log_file)
+        else:
+            with open(log_file, 'w', encoding='utf-8') as f:
+                json.dump([], f)
         
         # Generate and save statistics
         stats = cls._generate_statistics()
@@ -82,81 +241,452 @@ class GlobalLogManager:
         
         return log_file, stats_file
 
+atexit.register(GlobalLogManager.flush)
+
+class ResponseCache:
+    """Content-addressed on-disk cache of LLM completions.
+
+    Entries are keyed by model name, temperature and a hash of the messages.
+    The file mtime is refreshed on every hit so that eviction can drop the
+    least recently used entries once the cache exceeds `max_bytes`; entries
+    older than `max_age_days` are treated as misses and removed.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_age_days=None):
+        self.cache_dir = cache_dir or config.LLM_CACHE_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else config.llm_cache_max_bytes
+        self.max_age_days = max_age_days if max_age_days is not None else config.llm_cache_max_age_days
+        self._puts_since_eviction = 0
+
+    @staticmethod
+    def make_key(model_name, temperature, messages):
+        payload = json.dumps(
+            {"model": model_name, "temperature": temperature, "messages": messages},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _expired(self, created):
+        return self.max_age_days is not None and time.time() - created > self.max_age_days * 86400
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if self._expired(entry.get("created", 0)):
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["result"]
+
+    def put(self, key, result):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"created": time.time(), "result": result}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        self._puts_since_eviction += 1
+        if self._puts_since_eviction >= 50:
+            self.evict()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under `max_bytes`."""
+        self._puts_since_eviction = 0
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        entries = []
+        total_bytes = 0
+        now = time.time()
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # mtime is refreshed on hit, so it is a lower bound on creation age only
+                # for untouched entries; the precise age check happens in get().
+                if self.max_age_days is not None and now - stat.st_mtime > self.max_age_days * 86400:
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_bytes += stat.st_size
+
+        if self.max_bytes is None or total_bytes <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            self._remove(path)
+            total_bytes -= size
+            if total_bytes <= self.max_bytes:
+                break
+
+_response_cache = None
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+def _cache_lookup(model_name, temperature, messages):
+    key = ResponseCache.make_key(model_name, temperature, messages)
+    result = get_response_cache().get(key)
+    if result is not None:
+        GlobalLogManager.increment_metric("response_cache_hits")
+    else:
+        GlobalLogManager.increment_metric("response_cache_misses")
+    return key, result
+
+def _cache_store(key, result):
+    try:
+        get_response_cache().put(key, result)
+    except OSError as e:
+        print(f"Failed to write LLM response cache entry: {e}")
+
+def cached_completion(qa_interface, model_name, temperature, messages, use_cache=False):
+    """Call `qa_interface(messages)` through the response cache.
+
+    Returns a `(result, cache_hit)` tuple. Caching is opt-in: only prompts
+    whose answer is a classification or extraction (e.g. the yes/no error
+    checks in file_corrector) should pass `use_cache=True`, since a cached
+    sampled answer would be repeated on every retry and every run. The cache
+    is bypassed entirely when `use_cache` is False or `config.llm_cache_enabled`
+    is off.
+    """
+    if not (use_cache and config.llm_cache_enabled):
+        return qa_interface(messages), False
+
+    key, result = _cache_lookup(model_name, temperature, messages)
+    if result is not None:
+        return result, True
+
+    result = qa_interface(messages)
+    _cache_store(key, result)
+    return result, False
+
+async def cached_completion_async(async_qa_interface, model_name, temperature, messages, use_cache=False):
+    """Async counterpart of `cached_completion`."""
+    if not (use_cache and config.llm_cache_enabled):
+        return await async_qa_interface(messages), False
+
+    key, result = _cache_lookup(model_name, temperature, messages)
+    if result is not None:
+        return result, True
+
+    result = await async_qa_interface(messages)
+    _cache_store(key, result)
+    return result, False
+
+async def gather_bounded(coroutines, max_concurrency=None):
+    """Await `coroutines` concurrently, at most `max_concurrency` at a time, preserving order."""
+    semaphore = asyncio.Semaphore(max_concurrency or config.llm_max_concurrency)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(c) for c in coroutines))
+
+def ask_many(qa, questions, max_concurrency=None):
+    """Ask independent `questions` concurrently through `qa.ask_async`.
+
+    Returns the answers in the order of `questions`. Falls back to sequential
+    `qa.ask` calls when an event loop is already running in this thread.
+    """
+    questions = list(questions)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        return [qa.ask(question) for question in questions]
+
+    async def run_all():
+        try:
+            return await gather_bounded([qa.ask_async(q) for q in questions], max_concurrency)
+        finally:
+            await aclose_async_chat_clients()
+
+    return asyncio.run(run_all())
+
+def summarize_conversation(previous_summary, messages):
+    """Fold `messages` into `previous_summary` with a (cached) V3 call; used by ConversationWindow."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    summary_prompt = f'''Update the summary of a conversation about setting up an OpenFOAM case. Keep every concrete value (solver, turbulence model, boundary names and types, initial and boundary condition values, file names) and every decision that was made. Respond with the updated summary only.
+
+    Previous summary: [[[ {previous_summary or "None"} ]]]
+
+    New conversation turns: [[[ {transcript} ]]]
+    '''
+    return QA_NoContext_deepseek_V3(use_cache=True).ask(summary_prompt).strip()
+
+def _total_tokens(result):
+    return result["prompt_tokens"] + result["completion_tokens"] + (result.get("reasoning_tokens") or 0)
+
 class BaseQA_deepseek_V3:
     def __init__(self):
-        self.client = create_chat_client("DEEPSEEK_V3")
+        self.client = get_chat_client("DEEPSEEK_V3")
         self.model_name = os.environ.get("DEEPSEEK_V3_MODEL_NAME")
         self.qa_interface = self._setup_qa_interface()
+        self.async_qa_interface = self._setup_async_qa_interface()
         self._initialized = True
 
     def _setup_qa_interface(self):
         def get_deepseekV3_response(messages):
-            chat_completion = self.client.chat.completions.create(
-                messages=messages,
-                model=self.model_name,
-                temperature=config.V3_temperature,
-                stream=False
+            def request(deadline):
+                chat_completion = self.client.chat.completions.create(
+                    messages=messages,
+                    model=self.model_name,
+                    temperature=config.V3_temperature,
+                    stream=False,
+                    timeout=llm_rate_limiter.remaining_timeout(deadline)
+                )
+                
+                return {
+                    "content": chat_completion.choices[0].message.content,
+                    "prompt_tokens": chat_completion.usage.prompt_tokens,
+                    "completion_tokens": chat_completion.usage.completion_tokens,
+                    "prompt_cache_hit_tokens": token_accounting.cached_prompt_tokens(chat_completion.usage)
+                }
+
+            started = time.perf_counter()
+            result = llm_rate_limiter.call_with_retry(
+                "DEEPSEEK_V3",
+                request,
+                lambda: token_accounting.count_message_tokens(messages, self.model_name),
+                _total_tokens
             )
-            
-            return {
-                "content": chat_completion.choices[0].message.content,
-                "prompt_tokens": chat_completion.usage.prompt_tokens,
-                "completion_tokens": chat_completion.usage.completion_tokens
-            }
+            result["wall_time"] = time.perf_counter() - started
+            return result
 
         return get_deepseekV3_response
 
+    def _setup_async_qa_interface(self):
+        async def get_deepseekV3_response_async(messages):
+            async def request(deadline):
+                # The async client is bound to the running event loop, so look it up per call
+                client = get_async_chat_client("DEEPSEEK_V3")
+                chat_completion = await client.chat.completions.create(
+                    messages=messages,
+                    model=self.model_name,
+                    temperature=config.V3_temperature,
+                    stream=False,
+                    timeout=llm_rate_limiter.remaining_timeout(deadline)
+                )
+
+                return {
+                    "content": chat_completion.choices[0].message.content,
+                    "prompt_tokens": chat_completion.usage.prompt_tokens,
+                    "completion_tokens": chat_completion.usage.completion_tokens,
+                    "prompt_cache_hit_tokens": token_accounting.cached_prompt_tokens(chat_completion.usage)
+                }
+
+            started = time.perf_counter()
+            result = await llm_rate_limiter.call_with_retry_async(
+                "DEEPSEEK_V3",
+                request,
+                lambda: token_accounting.count_message_tokens(messages, self.model_name),
+                _total_tokens
+            )
+            result["wall_time"] = time.perf_counter() - started
+            return result
+
+        return get_deepseekV3_response_async
+
+    def _log(self, question, result, cache_hit=False, **extra):
+        GlobalLogManager.add_log({
+            "model_type": "deepseek-v3",
+            "user_prompt": question,
+            "assistant_response": result["content"],
+            "prompt_tokens": result["prompt_tokens"],
+            "response_tokens": result["completion_tokens"],
+            "prompt_cache_hit_tokens": result.get("prompt_cache_hit_tokens"),
+            "cache_hit": cache_hit,
+            **_timing_fields(result, result["completion_tokens"], cache_hit),
+            **extra,
+            "timestamp": datetime.now().isoformat()
+        })
+
     def ask(self, question: str):
         raise NotImplementedError
 
+    async def ask_async(self, question: str):
+        raise NotImplementedError
+
     def close(self):
         pass
 
 class QA_Context_deepseek_V3(BaseQA_deepseek_V3):
-    def __init__(self):
+    def __init__(self, token_budget: int | None = None):
         super().__init__()
-        self.conversation_history: list[dict[str, str]] = []
+        self.context = ConversationWindow(
+            summarize=summarize_conversation,
+            token_budget=token_budget,
+            model_name=self.model_name
+        )
+        self.conversation_history: list[dict[str, str]] = self.context.history
+
+    def pin(self, content: str, role: str = "system"):
+        """Add a message that is always sent, regardless of the token budget."""
+        self.context.pin(content, role)
 
     def ask(self, question: str):
-        self.conversation_history.append({"role": "user", "content": question})
-        result = self.qa_interface(self.conversation_history.copy())
+        self.context.append("user", question)
+        messages, dropped_tokens = self.context.build()
+        result = self.qa_interface(messages)
         
-        self.conversation_history.append({"role": "assistant", "content": result["content"]})
+        self.context.append("assistant", result["content"])
         
-        GlobalLogManager.add_log({
-            "model_type": "deepseek-v3",
-            "user_prompt": question,
-            "assistant_response": result["content"],
-            "prompt_tokens": result["prompt_tokens"],
-            "response_tokens": result["completion_tokens"],
-            "timestamp": datetime.now().isoformat()
-        })
+        self._log(question, result, context_dropped_tokens=dropped_tokens)
         
         return result["content"]
 
+    async def ask_async(self, question: str):
+        self.context.append("user", question)
+        messages, dropped_tokens = self.context.build()
+        result = await self.async_qa_interface(messages)
+
+        self.context.append("assistant", result["content"])
+
+        self._log(question, result, context_dropped_tokens=dropped_tokens)
+
+        return result["content"]
+
 class QA_NoContext_deepseek_V3(BaseQA_deepseek_V3):
+    def __init__(self, use_cache: bool = False):
+        super().__init__()
+        self.use_cache = use_cache
+
     def ask(self, question: str):
         messages = [{"role": "user", "content": question}]
-        result = self.qa_interface(messages)
+        result, cache_hit = cached_completion(
+            self.qa_interface, self.model_name, config.V3_temperature, messages, self.use_cache
+        )
         
-        GlobalLogManager.add_log({
-            "model_type": "deepseek-v3",
-            "user_prompt": question,
-            "assistant_response": result["content"],
-            "prompt_tokens": result["prompt_tokens"],
-            "response_tokens": result["completion_tokens"],
-            "timestamp": datetime.now().isoformat()
-        })
+        self._log(question, result, cache_hit)
         
         return result["content"]
 
+    async def ask_async(self, question: str):
+        messages = [{"role": "user", "content": question}]
+        result, cache_hit = await cached_completion_async(
+            self.async_qa_interface, self.model_name, config.V3_temperature, messages, self.use_cache
+        )
+
+        self._log(question, result, cache_hit)
+
+        return result["content"]
+
 class BaseQA_deepseek_R1:
     def __init__(self):
-        self.client = create_chat_client("DEEPSEEK_R1")
+        self.client = get_chat_client("DEEPSEEK_R1")
         self.model_name = os.environ.get("DEEPSEEK_R1_MODEL_NAME")
         self.qa_interface = self._setup_qa_interface()
+        self.async_qa_interface = self._setup_async_qa_interface()
         self._initialized = True
-        self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def _create_kwargs(self, messages, deadline):
+        kwargs = dict(
+            messages=messages,
+            model=self.model_name,
+            temperature=config.R1_temperature,
+            stream=True,
+            extra_body={"chat_template_kwargs": {"enable_thinking": False}},
+            timeout=llm_rate_limiter.remaining_timeout(deadline),
+        )
+        if config.llm_stream_include_usage:
+            # Ask the server for a final usage chunk so we don't have to re-tokenize
+            kwargs["stream_options"] = {"include_usage": True}
+        return kwargs
+
+    @staticmethod
+    def _disable_stream_usage(error):
+        """Turn off stream usage reporting if the endpoint rejected `stream_options`."""
+        if config.llm_stream_include_usage and "stream_options" in str(error):
+            print("Endpoint does not support stream_options, falling back to tokenizer estimates.")
+            config.llm_stream_include_usage = False
+            return True
+        return False
+
+    @staticmethod
+    def _collect_chunk(chunk, state):
+        if getattr(chunk, "usage", None) is not None:
+            state["usage"] = chunk.usage
+        if chunk.choices:
+            delta = chunk.choices[0].delta
+            if delta.content:
+                state["content"].append(delta.content)
+            if hasattr(delta, 'model_extra') and 'reasoning_content' in delta.model_extra:
+                state["reasoning"].append(str(delta.model_extra['reasoning_content']))
+            if state["first_token_at"] is None and (state["content"] or state["reasoning"]):
+                state["first_token_at"] = time.perf_counter()
+
+    def _build_result(self, messages, state):
+        finished = time.perf_counter()
+        completion_str = "".join(state["content"])
+        reasoning_str = "".join(state["reasoning"])
+
+        usage = token_accounting.usage_from_response(state["usage"])
+        if usage is not None:
+            # Server-reported usage; completion_tokens includes reasoning tokens there
+            reasoning_tokens = usage["reasoning_tokens"]
+            if reasoning_tokens is None:
+                reasoning_tokens = token_accounting.count_tokens(reasoning_str, self.model_name)
+            prompt_tokens = usage["prompt_tokens"]
+            completion_tokens = max(usage["completion_tokens"] - (usage["reasoning_tokens"] or 0), 0)
+            prompt_cache_hit_tokens = usage["prompt_cache_hit_tokens"]
+            usage_source = "server"
+        else:
+            # ===== Estimate token usage =====
+            prompt_tokens = token_accounting.count_message_tokens(messages, self.model_name)
+            completion_tokens = token_accounting.count_tokens(completion_str, self.model_name)
+            reasoning_tokens = token_accounting.count_tokens(reasoning_str, self.model_name)
+            prompt_cache_hit_tokens = None
+            usage_source = "estimate"
+
+        return {
+            "reasoning_content": reasoning_str,
+            "answer": completion_str,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "reasoning_tokens": reasoning_tokens,
+            "prompt_cache_hit_tokens": prompt_cache_hit_tokens,
+            "usage_source": usage_source,
+            # Timings of the attempt that succeeded (wall_time, set by the caller, includes retries)
+            "ttft": state["first_token_at"] - state["started"] if state["first_token_at"] else None,
+            "decode_time": finished - state["first_token_at"] if state["first_token_at"] else None
+        }
+
+    @staticmethod
+    def _new_stream_state(started):
+        """Accumulator for one streamed response; `started` is the perf_counter() taken before the request was sent."""
+        return {"content": [], "reasoning": [], "usage": None, "started": started, "first_token_at": None}
 
     def _setup_qa_interface(self):
         # def get_response(messages):
@@ -180,63 +710,76 @@ class BaseQA_deepseek_R1:
         #     }
 
         def get_response(messages):
-            # ===== Stream request to get content =====
-            stream = self.client.chat.completions.create(
-                messages=messages,
-                model=self.model_name,
-                temperature=config.R1_temperature,
-                stream=True,
-                extra_body={"chat_template_kwargs": {"enable_thinking": False}},
-            )
+            def request(deadline):
+                # ===== Stream request to get content =====
+                # TTFT is measured from before the request is sent, so it includes connection and queueing time
+                request_started = time.perf_counter()
+                try:
+                    stream = self.client.chat.completions.create(**self._create_kwargs(messages, deadline))
+                except openai.BadRequestError as e:
+                    if not self._disable_stream_usage(e):
+                        raise
+                    request_started = time.perf_counter()
+                    stream = self.client.chat.completions.create(**self._create_kwargs(messages, deadline))
 
-            full_content = []
-            reasoning_contents = []
-            
-            for chunk in stream:
-                if chunk.choices:
-                    delta = chunk.choices[0].delta
-                    if delta.content:
-                        full_content.append(delta.content)
-                    if hasattr(delta, 'model_extra') and 'reasoning_content' in delta.model_extra:
-                        reasoning_contents.append(str(delta.model_extra['reasoning_content']))
+                state = self._new_stream_state(request_started)
+                
+                for chunk in stream:
+                    llm_rate_limiter.check_deadline(deadline)
+                    self._collect_chunk(chunk, state)
 
-            # ===== Estimate token usage =====
-            # Estimate prompt tokens (serialize messages to string)
-            prompt_str = json.dumps(messages, ensure_ascii=False)
-            prompt_tokens = estimate_tokens(prompt_str, self.model_name)
-            
-            # Estimate completion tokens (actual returned content)
-            completion_str = "".join(full_content)
-            completion_tokens = estimate_tokens(completion_str, self.model_name)
-
-            return {
-                "reasoning_content": "".join(reasoning_contents),
-                "answer": completion_str,
-                "prompt_tokens": prompt_tokens,
-                "completion_tokens": completion_tokens
-            }
+                return self._build_result(messages, state)
+
+            started = time.perf_counter()
+            result = llm_rate_limiter.call_with_retry(
+                "DEEPSEEK_R1",
+                request,
+                lambda: token_accounting.count_message_tokens(messages, self.model_name),
+                _total_tokens
+            )
+            result["wall_time"] = time.perf_counter() - started
+            return result
 
 
         return get_response
 
-    def ask(self, question: str):
-        raise NotImplementedError
+    def _setup_async_qa_interface(self):
+        async def get_response_async(messages):
+            async def request(deadline):
+                client = get_async_chat_client("DEEPSEEK_R1")
+                request_started = time.perf_counter()
+                try:
+                    stream = await client.chat.completions.create(**self._create_kwargs(messages, deadline))
+                except openai.BadRequestError as e:
+                    if not self._disable_stream_usage(e):
+                        raise
+                    request_started = time.perf_counter()
+                    stream = await client.chat.completions.create(**self._create_kwargs(messages, deadline))
 
-    def close(self):
-        pass
+                state = self._new_stream_state(request_started)
 
-class QA_Context_deepseek_R1(BaseQA_deepseek_R1):
-    def __init__(self):
-        super().__init__()
-        self.conversation_history: list[dict[str, str]] = []
+                async for chunk in stream:
+                    self._collect_chunk(chunk, state)
 
-    def ask(self, question: str):
-        self.conversation_history.append({"role": "user", "content": question})
-        result = self.qa_interface(self.conversation_history.copy())
-        
-        self.conversation_history.append({"role": "assistant", "content": result["answer"]})
-        
-        reasoning_tokens = len(self.encoding.encode(result["reasoning_content"]))
+                return self._build_result(messages, state)
+
+            started = time.perf_counter()
+            result = await llm_rate_limiter.call_with_retry_async(
+                "DEEPSEEK_R1",
+                request,
+                lambda: token_accounting.count_message_tokens(messages, self.model_name),
+                _total_tokens
+            )
+            result["wall_time"] = time.perf_counter() - started
+            return result
+
+        return get_response_async
+
+    def _log(self, question, result, cache_hit=False, **extra):
+        reasoning_tokens = result.get("reasoning_tokens")
+        if reasoning_tokens is None:
+            # Entries cached before token accounting was added
+            reasoning_tokens = token_accounting.count_tokens(result["reasoning_content"], self.model_name)
         
         GlobalLogManager.add_log({
             "model_type": "deepseek-r1",
@@ -246,29 +789,81 @@ class QA_Context_deepseek_R1(BaseQA_deepseek_R1):
             "prompt_tokens": result["prompt_tokens"],
             "response_tokens": result["completion_tokens"],
             "reasoning_tokens": reasoning_tokens,
+            "prompt_cache_hit_tokens": result.get("prompt_cache_hit_tokens"),
+            "usage_source": result.get("usage_source", "estimate"),
+            "cache_hit": cache_hit,
+            **_timing_fields(result, result["completion_tokens"] + reasoning_tokens, cache_hit),
+            **extra,
             "timestamp": datetime.now().isoformat()
         })
+
+    def ask(self, question: str):
+        raise NotImplementedError
+
+    async def ask_async(self, question: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class QA_Context_deepseek_R1(BaseQA_deepseek_R1):
+    def __init__(self, token_budget: int | None = None):
+        super().__init__()
+        self.context = ConversationWindow(
+            summarize=summarize_conversation,
+            token_budget=token_budget,
+            model_name=self.model_name
+        )
+        self.conversation_history: list[dict[str, str]] = self.context.history
+
+    def pin(self, content: str, role: str = "system"):
+        """Add a message that is always sent, regardless of the token budget."""
+        self.context.pin(content, role)
+
+    def ask(self, question: str):
+        self.context.append("user", question)
+        messages, dropped_tokens = self.context.build()
+        result = self.qa_interface(messages)
+        
+        self.context.append("assistant", result["answer"])
+        
+        self._log(question, result, context_dropped_tokens=dropped_tokens)
         
         return result["answer"]
 
+    async def ask_async(self, question: str):
+        self.context.append("user", question)
+        messages, dropped_tokens = self.context.build()
+        result = await self.async_qa_interface(messages)
+
+        self.context.append("assistant", result["answer"])
+
+        self._log(question, result, context_dropped_tokens=dropped_tokens)
+
+        return result["answer"]
+
 class QA_NoContext_deepseek_R1(BaseQA_deepseek_R1):
+    def __init__(self, use_cache: bool = False):
+        super().__init__()
+        self.use_cache = use_cache
+
     def ask(self, question: str):
         messages = [{"role": "user", "content": question}]
-        result = self.qa_interface(messages)
-        
-        reasoning_tokens = len(self.encoding.encode(result["reasoning_content"]))
+        result, cache_hit = cached_completion(
+            self.qa_interface, self.model_name, config.R1_temperature, messages, self.use_cache
+        )
         
-        GlobalLogManager.add_log({
-            "model_type": "deepseek-r1",
-            "user_prompt": question,
-            "assistant_response": result["answer"],
-            "reasoning_content": result["reasoning_content"],
-            "prompt_tokens": result["prompt_tokens"],
-            "response_tokens": result["completion_tokens"],
-            "reasoning_tokens": reasoning_tokens,
-            "timestamp": datetime.now().isoformat()
-        })
+        self._log(question, result, cache_hit)
         
         return result["answer"]
-    
 
+    async def ask_async(self, question: str):
+        messages = [{"role": "user", "content": question}]
+        result, cache_hit = await cached_completion_async(
+            self.async_qa_interface, self.model_name, config.R1_temperature, messages, self.use_cache
+        )
+
+        self._log(question, result, cache_hit)
+
+        return result["answer"]
+    
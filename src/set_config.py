@@ -18,6 +18,21 @@ def _normalize_base_url(raw_url: str):
     normalized = parsed._replace(path=path, query="", params="", fragment="")
     return urlunparse(normalized), api_version
 
+def _pdf_min_similarity(config_data):
+    """Cosine retrieval threshold: pdf_chunk_min_similarity, else derived from an explicit pdf_chunk_d.
+
+    For unit-length embeddings a squared L2 distance d is a cosine
+    similarity of 1 - d / 2.
+    """
+    min_similarity = config_data.get("pdf_chunk_min_similarity")
+    chunk_d = config_data.get("pdf_chunk_d")
+    if min_similarity is None:
+        return config.pdf_chunk_min_similarity if chunk_d is None else 1 - chunk_d / 2
+    if chunk_d is not None and config_data.get("pdf_vector_metric", config.pdf_vector_metric) == "cosine":
+        print(f"Both pdf_chunk_d and pdf_chunk_min_similarity are set; the cosine metric uses "
+              f"pdf_chunk_min_similarity = {min_similarity} and ignores pdf_chunk_d = {chunk_d}.")
+    return min_similarity
+
 def read_in_config():
     config_data = []
     with open(f'{config.Base_PATH}/inputs/chatcfd_config.json', 'r', encoding='utf-8') as file:
@@ -51,7 +66,63 @@ def read_in_config():
     config.OpenFOAM_use_docker = config_data.get("OpenFOAM_use_docker", False)
     config.OpenFOAM_docker_exec = config_data.get("OpenFOAM_docker_exec", "")
     config.max_running_test_round = config_data["max_running_test_round"]
-    config.pdf_chunk_d = config_data["pdf_chunk_d"]
+    config.pdf_chunk_d = config_data.get("pdf_chunk_d", config.pdf_chunk_d)
+    config.pdf_vector_metric = config_data.get("pdf_vector_metric", config.pdf_vector_metric)
+    config.pdf_chunk_min_similarity = _pdf_min_similarity(config_data)
+    config.pdf_index_type = config_data.get("pdf_index_type", config.pdf_index_type)
+    config.pdf_hnsw_m = config_data.get("pdf_hnsw_m", config.pdf_hnsw_m)
+    config.pdf_hnsw_ef_construction = config_data.get("pdf_hnsw_ef_construction", config.pdf_hnsw_ef_construction)
+    config.pdf_hnsw_ef_search = config_data.get("pdf_hnsw_ef_search", config.pdf_hnsw_ef_search)
+    config.pdf_ivf_nlist = config_data.get("pdf_ivf_nlist", config.pdf_ivf_nlist)
+    config.pdf_ivf_nprobe = config_data.get("pdf_ivf_nprobe", config.pdf_ivf_nprobe)
+    config.pdf_pq_m = config_data.get("pdf_pq_m", config.pdf_pq_m)
+    config.pdf_pq_nbits = config_data.get("pdf_pq_nbits", config.pdf_pq_nbits)
+    config.pdf_retrieval_mode = config_data.get("pdf_retrieval_mode", config.pdf_retrieval_mode)
+    config.pdf_retrieval_candidates = config_data.get("pdf_retrieval_candidates", config.pdf_retrieval_candidates)
+    config.pdf_rrf_k = config_data.get("pdf_rrf_k", config.pdf_rrf_k)
+    config.pdf_bm25_min_share = config_data.get("pdf_bm25_min_share", config.pdf_bm25_min_share)
+    config.pdf_merge_max_questions = config_data.get("pdf_merge_max_questions", config.pdf_merge_max_questions)
+    config.pdf_merge_max_chunks = config_data.get("pdf_merge_max_chunks", config.pdf_merge_max_chunks)
+    config.pdf_extract_workers = config_data.get("pdf_extract_workers", config.pdf_extract_workers)
+    config.pdf_extract_min_pages_per_worker = config_data.get("pdf_extract_min_pages_per_worker", config.pdf_extract_min_pages_per_worker)
+    config.pdf_table_detection = config_data.get("pdf_table_detection", config.pdf_table_detection)
+    config.pdf_stream_min_pages = config_data.get("pdf_stream_min_pages", config.pdf_stream_min_pages)
+    config.pdf_ingest_memory_budget = config_data.get("pdf_ingest_memory_budget", config.pdf_ingest_memory_budget)
+    config.pdf_cache_enabled = config_data.get("pdf_cache_enabled", config.pdf_cache_enabled)
+    config.pdf_cache_max_bytes = config_data.get("pdf_cache_max_bytes", config.pdf_cache_max_bytes)
+    config.paper_library_enabled = config_data.get("paper_library_enabled", config.paper_library_enabled)
+    config.embedding_model_name = config_data.get("embedding_model_name", config.embedding_model_name)
+    config.embedding_backend = config_data.get("embedding_backend", config.embedding_backend)
+    config.embedding_device = config_data.get("embedding_device", config.embedding_device)
+    config.embedding_local_only = config_data.get("embedding_local_only", config.embedding_local_only)
+    config.embedding_threads = config_data.get("embedding_threads", config.embedding_threads)
+    config.llm_cache_enabled = config_data.get("llm_cache_enabled", config.llm_cache_enabled)
+    config.llm_cache_max_bytes = config_data.get("llm_cache_max_bytes", config.llm_cache_max_bytes)
+    config.llm_cache_max_age_days = config_data.get("llm_cache_max_age_days", config.llm_cache_max_age_days)
+    config.llm_pool_max_connections = config_data.get("llm_pool_max_connections", config.llm_pool_max_connections)
+    config.llm_pool_max_keepalive = config_data.get("llm_pool_max_keepalive", config.llm_pool_max_keepalive)
+    config.llm_pool_keepalive_expiry = config_data.get("llm_pool_keepalive_expiry", config.llm_pool_keepalive_expiry)
+    config.llm_connect_timeout = config_data.get("llm_connect_timeout", config.llm_connect_timeout)
+    config.llm_read_timeout = config_data.get("llm_read_timeout", config.llm_read_timeout)
+    config.llm_max_concurrency = config_data.get("llm_max_concurrency", config.llm_max_concurrency)
+    config.llm_stream_include_usage = config_data.get("llm_stream_include_usage", config.llm_stream_include_usage)
+    config.context_token_budget = config_data.get("context_token_budget", config.context_token_budget)
+    config.context_keep_recent_messages = config_data.get("context_keep_recent_messages", config.context_keep_recent_messages)
+    config.llm_rate_limits = config_data.get("llm_rate_limits", config.llm_rate_limits)
+    config.llm_max_retries = config_data.get("llm_max_retries", config.llm_max_retries)
+    config.llm_backoff_base = config_data.get("llm_backoff_base", config.llm_backoff_base)
+    config.llm_backoff_max = config_data.get("llm_backoff_max", config.llm_backoff_max)
+    config.llm_call_deadline = config_data.get("llm_call_deadline", config.llm_call_deadline)
+    config.llm_transport_mode = config_data.get("llm_transport_mode", config.llm_transport_mode)
+    config.llm_cassette_path = config_data.get("llm_cassette_path", config.llm_cassette_path)
+    config.llm_replay_latency = config_data.get("llm_replay_latency", config.llm_replay_latency)
+    config.llm_replay_chunk_latency = config_data.get("llm_replay_chunk_latency", config.llm_replay_chunk_latency)
+    config.llm_stub_port = config_data.get("llm_stub_port", config.llm_stub_port)
+    config.llm_stub_replies_path = config_data.get("llm_stub_replies_path", config.llm_stub_replies_path)
+    config.log_flush_every = config_data.get("log_flush_every", config.log_flush_every)
+    config.log_flush_interval = config_data.get("log_flush_interval", config.log_flush_interval)
+    config.log_queue_size = config_data.get("log_queue_size", config.log_queue_size)
+    config.log_spill_keep_days = config_data.get("log_spill_keep_days", config.log_spill_keep_days)
 
 def load_openfoam_environment():
     """Load OpenFOAM environment variables into the current Python process at once"""
@@ -0,0 +1,100 @@
+"""Token accounting for LLM calls.
+
+Usage reported by the server (the final usage chunk of a stream with
+`stream_options={"include_usage": True}`) is preferred; tokenizer estimates
+are only used when the endpoint does not report usage. Encoders are created
+once per model and token counts of message contents are memoized, so long
+conversations are not re-tokenized on every call.
+"""
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+import tiktoken
+
+# Chat formatting overhead per message / per reply, as used by OpenAI's cookbook estimate
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 2
+
+_COUNT_CACHE_SIZE = 8192
+# Short strings are cheaper to encode than to hash and look up
+_MIN_MEMO_LENGTH = 256
+
+_count_cache: OrderedDict = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name: str | None = None):
+    """Return the (cached) tiktoken encoding for `model_name`."""
+    if model_name:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            pass
+    # If model not recognized, default to cl100k_base (GPT-4 encoding)
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model_name: str | None = None) -> int:
+    """Count tokens of `text`, memoizing results for long strings."""
+    if not text:
+        return 0
+    encoding = get_encoding(model_name)
+    if len(text) < _MIN_MEMO_LENGTH:
+        return len(encoding.encode(text))
+
+    key = (encoding.name, hashlib.sha1(text.encode("utf-8")).digest())
+    with _count_cache_lock:
+        count = _count_cache.get(key)
+        if count is not None:
+            _count_cache.move_to_end(key)
+            return count
+
+    count = len(encoding.encode(text))
+    with _count_cache_lock:
+        _count_cache[key] = count
+        if len(_count_cache) > _COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return count
+
+
+def count_message_tokens(messages: list[dict], model_name: str | None = None) -> int:
+    """Estimate prompt tokens of a chat message list."""
+    total = TOKENS_PER_REPLY
+    for message in messages:
+        total += TOKENS_PER_MESSAGE
+        total += count_tokens(message.get("role", ""), model_name)
+        total += count_tokens(str(message.get("content") or ""), model_name)
+    return total
+
+
+def cached_prompt_tokens(usage) -> int | None:
+    """Prompt tokens served from the provider's prefix cache, if the endpoint reports them."""
+    if usage is None:
+        return None
+    # DeepSeek reports prompt_cache_hit_tokens; OpenAI-style endpoints use prompt_tokens_details.cached_tokens
+    hit_tokens = getattr(usage, "prompt_cache_hit_tokens", None)
+    if hit_tokens is None:
+        hit_tokens = (getattr(usage, "model_extra", None) or {}).get("prompt_cache_hit_tokens")
+    if hit_tokens is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        hit_tokens = getattr(details, "cached_tokens", None) if details is not None else None
+    return hit_tokens
+
+
+def usage_from_response(usage) -> dict | None:
+    """Normalize an OpenAI `usage` object into a plain dict, or None if absent."""
+    if usage is None:
+        return None
+
+    details = getattr(usage, "completion_tokens_details", None)
+    reasoning_tokens = getattr(details, "reasoning_tokens", None) if details is not None else None
+
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "reasoning_tokens": reasoning_tokens,
+        "prompt_cache_hit_tokens": cached_prompt_tokens(usage),
+    }
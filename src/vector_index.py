@@ -0,0 +1,174 @@
+"""FAISS index construction for chunk embeddings.
+
+With `config.pdf_vector_metric = "cosine"` vectors are L2-normalized and
+searched by inner product, so scores are cosine similarities and a single
+`pdf_chunk_min_similarity` threshold works for any corpus size. "l2" keeps
+the original unnormalized L2 search and the `pdf_chunk_d` threshold.
+
+`config.pdf_index_type` selects the index:
+- "flat": exact search, best for one paper.
+- "hnsw": graph index, sub-linear queries without training.
+- "ivfpq": inverted lists with product-quantized codes, the smallest
+  memory footprint for a large library; needs enough vectors to train and
+  falls back to "flat" below that.
+
+See benchmarks/bench_vector_index.py for build and query timings.
+"""
+import math
+
+import faiss
+import numpy as np
+
+import config
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+METRICS = ("cosine", "l2")
+
+# IVF-PQ needs about this many training vectors per inverted list
+IVF_MIN_POINTS_PER_LIST = 39
+
+# IndexIDMap only accepts search parameters (an ID selector) from faiss 1.8; earlier versions raise
+IDMAP_SEARCH_PARAMETERS = tuple(int(part) for part in faiss.__version__.split(".")[:2]) >= (1, 8)
+
+
+def normalize(vectors):
+    """L2-normalized float32 copy of `vectors` (zero vectors are left as they are)."""
+    vectors = np.array(vectors, dtype='float32', copy=True, ndmin=2)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def prepare(vectors, metric=None):
+    """Vectors as they must be passed to an index of the given metric (for add and search)."""
+    metric = metric or config.pdf_vector_metric
+    if metric == "cosine":
+        return normalize(vectors)
+    return np.ascontiguousarray(vectors, dtype='float32')
+
+
+def index_settings():
+    """Everything that determines the index built for a set of vectors."""
+    return {
+        "metric": config.pdf_vector_metric,
+        "index_type": config.pdf_index_type,
+        "hnsw_m": config.pdf_hnsw_m,
+        "hnsw_ef_construction": config.pdf_hnsw_ef_construction,
+        "ivf_nlist": config.pdf_ivf_nlist,
+        "pq_m": config.pdf_pq_m,
+        "pq_nbits": config.pdf_pq_nbits
+    }
+
+
+def _faiss_metric(metric):
+    return faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+
+
+def _ivf_nlist(n):
+    if config.pdf_ivf_nlist:
+        return config.pdf_ivf_nlist
+    # ~4 sqrt(n) lists, the usual starting point for IVF indexes
+    return max(1, int(4 * math.sqrt(n)))
+
+
+def _pq_m(dim):
+    """Largest number of sub-quantizers <= config.pdf_pq_m that divides `dim`."""
+    for m in range(min(config.pdf_pq_m, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def new_index(dim, metric=None, index_type=None, n_train=0):
+    """Empty index; "ivfpq" falls back to "flat" when `n_train` vectors are too few to train it."""
+    metric = metric or config.pdf_vector_metric
+    index_type = index_type or config.pdf_index_type
+    if metric not in METRICS:
+        raise ValueError(f"Unknown vector metric '{metric}', expected one of {METRICS}")
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    faiss_metric = _faiss_metric(metric)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, config.pdf_hnsw_m, faiss_metric)
+        index.hnsw.efConstruction = config.pdf_hnsw_ef_construction
+        return index
+
+    if index_type == "ivfpq":
+        nlist = _ivf_nlist(n_train)
+        if n_train >= nlist * IVF_MIN_POINTS_PER_LIST and n_train >= 2 ** config.pdf_pq_nbits:
+            quantizer = faiss.IndexFlat(dim, faiss_metric)
+            return faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim), config.pdf_pq_nbits, faiss_metric)
+
+    return faiss.IndexFlat(dim, faiss_metric)
+
+
+def build_index(vectors, metric=None, index_type=None):
+    vectors = prepare(vectors, metric)
+    index = new_index(vectors.shape[1], metric, index_type, n_train=len(vectors))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def base_index(index):
+    """The index wrapped by an IndexIDMap (see paper_library), or `index` itself."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def configure_search(index):
+    """Apply the query-time parameters (HNSW efSearch, IVF nprobe) to a built or loaded index."""
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = config.pdf_hnsw_ef_search
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = config.pdf_ivf_nprobe
+    return index
+
+
+def _search_parameters(index):
+    # Search parameters must match the index type, so they carry the configured efSearch / nprobe
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = config.pdf_hnsw_ef_search
+        return params
+    if faiss.try_extract_index_ivf(base) is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = config.pdf_ivf_nprobe
+        return params
+    return faiss.SearchParameters()
+
+
+def search(index, queries, k, metric=None, ids=None):
+    """(scores, ids) for the queries; scores are similarities for "cosine" and squared distances for "l2".
+
+    `ids` restricts the search to those vector ids (missing results are -1).
+    """
+    queries = prepare(queries, metric)
+    if ids is None:
+        return index.search(queries, min(k, index.ntotal))
+    ids = np.asarray(ids, dtype='int64')
+    k = max(1, min(k, len(ids), index.ntotal))
+    params = _search_parameters(index)
+    if isinstance(index, faiss.IndexIDMap) and not IDMAP_SEARCH_PARAMETERS:
+        # Select by position in the wrapped index, which takes search parameters, and map back to ids
+        id_map = faiss.vector_to_array(index.id_map)
+        params.sel = faiss.IDSelectorBatch(np.flatnonzero(np.isin(id_map, ids)).astype('int64'))
+        scores, positions = base_index(index).search(queries, k, params=params)
+        labels = np.full_like(positions, -1)
+        found = positions >= 0
+        labels[found] = id_map[positions[found]]
+        return scores, labels
+    params.sel = faiss.IDSelectorBatch(ids)
+    return index.search(queries, k, params=params)
+
+
+def is_relevant(score, metric=None):
+    metric = metric or config.pdf_vector_metric
+    if metric == "cosine":
+        return score >= config.pdf_chunk_min_similarity
+    return score < config.pdf_chunk_d
@@ -1,5 +1,10 @@
+import os
 from sentence_transformers import SentenceTransformer
 
-# This will automatically download and cache the model
-model = SentenceTransformer('BAAI/bge-base-en-v1.5')
-print("Model downloaded successfully!")
+# Download the retrieval embedding model and save it where src/embedder_registry.py looks for it
+model_name = 'sentence-transformers/all-mpnet-base-v2'
+target_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', model_name.split('/')[-1])
+
+model = SentenceTransformer(model_name)
+model.save(target_dir)
+print(f"Model downloaded successfully to {target_dir}!")
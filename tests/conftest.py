@@ -0,0 +1,111 @@
+"""Shared fixtures. The modules under src/ import each other by bare name, so src/ goes on sys.path."""
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_PATH)
+
+import config
+
+
+@pytest.fixture(autouse=True)
+def isolated_paths(tmp_path, monkeypatch):
+    """Point every on-disk store at a per-test directory and give the LLM clients dummy credentials."""
+    monkeypatch.setattr(config, "LLM_CACHE_PATH", str(tmp_path / "llm_cache"))
+    monkeypatch.setattr(config, "PDF_CACHE_PATH", str(tmp_path / "pdf_cache"))
+    monkeypatch.setattr(config, "PAPER_LIBRARY_PATH", str(tmp_path / "paper_library"))
+    monkeypatch.setattr(config, "QA_LOG_PATH", str(tmp_path / "qa_logs"))
+    for prefix in ("DEEPSEEK_V3", "DEEPSEEK_R1"):
+        monkeypatch.setenv(f"{prefix}_KEY", "test")
+        monkeypatch.setenv(f"{prefix}_BASE_URL", "http://127.0.0.1:9/v1")
+        monkeypatch.setenv(f"{prefix}_MODEL_NAME", prefix.lower())
+    return tmp_path
+
+
+class WhitespaceEncoding:
+    """Stands in for the tiktoken encoding, which is downloaded on first use."""
+
+    name = "whitespace"
+
+    def encode(self, text, **kwargs):
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def offline_encoding(monkeypatch):
+    import token_accounting
+
+    monkeypatch.setattr(token_accounting, "get_encoding", lambda model_name=None: WhitespaceEncoding())
+
+
+def write_text_pdf(path, pages):
+    """Minimal PDF with one Helvetica text line per entry of `pages` (each a list of lines)."""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for i, lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * i, 5 + 2 * i
+        kids.append(page_id)
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = ("BT /F1 10 Tf 60 740 Td 14 TL\n" + "\n".join(f"({line}) '" for line in escaped) + "\nET").encode("latin-1")
+        objects[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R"
+                            b" /Resources << /Font << /F1 3 0 R >> >> >>" % content_id)
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+    objects[2] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % len(kids)
+
+    data, offsets = bytearray(b"%PDF-1.4\n"), {}
+    for number in sorted(objects):
+        offsets[number] = len(data)
+        data += b"%d 0 obj\n" % number + objects[number] + b"\nendobj\n"
+    xref, size = len(data), max(objects) + 1
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    data += b"".join(b"%010d 00000 n \n" % offsets[number] for number in range(1, size))
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref)
+    path.write_bytes(bytes(data))
+    return str(path)
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedder standing in for the SentenceTransformer."""
+
+    dim = 64
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, **kwargs):
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        self.encoded += len(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return vectors
+
+
+@pytest.fixture
+def embedder(monkeypatch):
+    """Route every get_embedder call to one HashingEmbedder."""
+    import embedder_registry
+
+    instance = HashingEmbedder()
+    monkeypatch.setattr(embedder_registry, "get_embedder", lambda *args, **kwargs: instance)
+    return instance
+
+
+@pytest.fixture
+def log_manager(monkeypatch):
+    """GlobalLogManager with empty logs and its own writer, flushed at teardown."""
+    import qa_modules
+
+    manager = qa_modules.GlobalLogManager
+    monkeypatch.setattr(manager, "logs", [])
+    monkeypatch.setattr(manager, "metrics", {})
+    monkeypatch.setattr(manager, "_writer", None)
+    monkeypatch.setattr(manager, "_spill_path", None)
+    monkeypatch.setattr(manager, "_case_log_path", None)
+    yield manager
+    manager.flush()
@@ -0,0 +1,102 @@
+import pytest
+
+import token_accounting
+from context_window import SUMMARY_PREFIX, ConversationWindow
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    """One token per word, so budgets are easy to reason about (and no tokenizer download is needed)."""
+    monkeypatch.setattr(token_accounting, "count_tokens", lambda text, model_name=None: len(text.split()))
+
+
+def _message(i):
+    return " ".join([f"turn{i}"] * 16)  # 16 + 4 tokens per message
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, previous, messages):
+        self.calls.append((previous, [m["content"] for m in messages]))
+        return f"{previous} {len(messages)}".strip()
+
+
+def test_short_conversation_is_sent_verbatim():
+    window = ConversationWindow(summarize=RecordingSummarizer(), token_budget=1000, keep_recent_messages=2)
+    window.pin("You are a CFD assistant.")
+    window.append("user", "hello")
+    window.append("assistant", "hi")
+
+    messages, dropped = window.build()
+
+    assert [m["content"] for m in messages] == ["You are a CFD assistant.", "hello", "hi"]
+    assert dropped == 0
+
+
+def test_oldest_messages_fold_into_summary_within_budget():
+    summarize = RecordingSummarizer()
+    window = ConversationWindow(summarize=summarize, token_budget=100, keep_recent_messages=2)
+    window.pin("system prompt")
+    for i in range(6):
+        window.append("user" if i % 2 == 0 else "assistant", _message(i))
+
+    messages, dropped = window.build()
+
+    # 6 x 20 tokens do not fit; fold down to half the budget but keep at least 2 messages
+    assert messages[0]["content"] == "system prompt"
+    assert messages[1]["content"] == SUMMARY_PREFIX + "4"
+    assert [m["content"] for m in messages[2:]] == [_message(4), _message(5)]
+    assert summarize.calls == [("", [_message(i) for i in range(4)])]
+    assert window._tokens(messages) <= 100
+    assert dropped == 4 * 20 - window._tokens(messages[1:2])
+
+
+def test_summary_is_only_extended_when_more_messages_fall_out():
+    summarize = RecordingSummarizer()
+    window = ConversationWindow(summarize=summarize, token_budget=100, keep_recent_messages=2)
+    for i in range(6):
+        window.append("user", _message(i))
+    window.build()
+    window.build()
+    assert len(summarize.calls) == 1
+
+    for i in range(6, 9):
+        window.append("user", _message(i))
+    messages, _ = window.build()
+
+    assert len(summarize.calls) == 2
+    assert summarize.calls[1][0] == "4"
+    assert messages[0]["content"] == SUMMARY_PREFIX + "4 " + str(len(summarize.calls[1][1]))
+    assert messages[-1]["content"] == _message(8)
+
+
+def test_failed_summary_truncates_the_request_and_keeps_the_turns(capsys):
+    summarize = RecordingSummarizer()
+    failing = [True]
+
+    def flaky(previous, messages):
+        if failing[0]:
+            raise RuntimeError("endpoint down")
+        return summarize(previous, messages)
+
+    window = ConversationWindow(summarize=flaky, token_budget=60, keep_recent_messages=1)
+    for i in range(5):
+        window.append("user", _message(i))
+
+    messages, dropped = window.build()
+
+    # Plain truncation for this request, logged; nothing is marked as summarized
+    assert [m["content"] for m in messages] == [_message(4)]
+    assert dropped == 4 * 20
+    assert "endpoint down" in capsys.readouterr().out
+    assert window.summarized_count == 0 and window.summary == ""
+
+    failing[0] = False
+    window.append("user", _message(5))
+    messages, _ = window.build()
+
+    # The turns left out earlier go into the first successful summary
+    assert summarize.calls == [("", [_message(i) for i in range(5)])]
+    assert [m["content"] for m in messages] == [SUMMARY_PREFIX + "5", _message(5)]
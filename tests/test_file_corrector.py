@@ -0,0 +1,28 @@
+import config
+import file_corrector
+
+
+class RecordingQA:
+    prompts = []
+
+    def ask(self, prompt):
+        self.prompts.append(prompt)
+        return "advice"
+
+
+def test_reference_files_are_part_of_the_cached_prefix(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "OUTPUT_PATH", str(tmp_path))
+    monkeypatch.setattr(config, "case_ic_bc_from_paper", "U inlet 10 m/s")
+    monkeypatch.setattr(file_corrector, "QA_NoContext_deepseek_R1", RecordingQA)
+    monkeypatch.setattr(RecordingQA, "prompts", [])
+    (tmp_path / "0").mkdir()
+    (tmp_path / "0" / "U").write_text("internalField uniform (10 0 0);")
+    reference = "tutorial 0/U: dimensions [0 1 -1 0 0 0 0];"
+
+    for error in ("FOAM FATAL ERROR: missing inlet", "FOAM FATAL ERROR: bad outlet"):
+        file_corrector.analyze_running_error_with_reference_files(error, "0/U", None, reference)
+
+    first, second = RecordingQA.prompts
+    prefix = first[:first.index("File name: [[[")]
+    assert second.startswith(prefix)
+    assert f"Files from OpenFOAM tutorial: [[[ {reference} ]]]" in prefix
@@ -0,0 +1,69 @@
+import pytest
+
+from hybrid_retrieval import BM25Index, fuse, reciprocal_rank_fusion, tokenize
+
+CHUNKS = [
+    "The k-omega SST turbulence model is used for all the simulations in this paper.",
+    "The inlet velocity is 51.4 m/s and the outlet is a pressure outlet.",
+    "The mesh has 1.2 million hexahedral cells and the first cell height gives y+ below 1.",
+    "Results are compared with the experiment of the nozzle at a pressure ratio of 3.",
+    "This is the section where the authors thank the funding agency.",
+]
+
+
+@pytest.fixture(scope="module")
+def bm25():
+    return BM25Index(CHUNKS)
+
+
+def test_tokenize_keeps_symbols_units_and_numbers():
+    assert tokenize("The k-omega model, U = 51.4 m/s at Re 6e6") == ["k-omega", "model", "u", "51.4", "m/s", "re", "6e6"]
+
+
+@pytest.mark.parametrize("query", ["is the", "What is the capital of France?", "Who are they?"])
+def test_questions_sharing_only_common_words_get_no_lexical_hits(bm25, query):
+    assert bm25.search(query, 3) == ([], [])
+
+
+def test_exact_values_rank_first(bm25):
+    indices, scores = bm25.search("inlet velocity 51.4 m/s", 3)
+    assert indices[0] == 1
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_max_score_bounds_every_score(bm25):
+    for query in ("turbulence model", "pressure outlet nozzle", "unknown term"):
+        assert bm25.scores(query).max() <= bm25.max_score(query)
+
+
+def test_min_share_drops_weak_lexical_hits(bm25):
+    query = "turbulence model for the heat exchanger fouling study"
+    weak, _ = bm25.search(query, 3)
+    assert weak == [0]
+    assert bm25.search(query, 3, min_share=0.25) == ([], [])
+    assert bm25.search("turbulence model", 3, min_share=0.25)[0] == [0]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 1]]) == [1, 3, 2]
+
+
+def test_fuse_only_returns_eligible_ids():
+    dense_ranking = [4, 2, 0]
+    assert fuse(dense_ranking, [], [2], top_k=3) == [2]
+    assert fuse(dense_ranking, [0], [2], top_k=3) == [0, 2]
+    assert fuse(dense_ranking, [], [], top_k=3) == []
+
+
+def test_fuse_respects_top_k():
+    assert fuse([1, 2, 3], [3, 2, 1], [1, 2, 3], top_k=2) == [1, 3]
+
+
+def test_segments_are_searched_separately(bm25):
+    segments = ["inlet velocity 51.4 m/s", "k-omega SST turbulence model"]
+    # Together no chunk holds half of the query, each segment has its own chunk
+    assert bm25.search(" ".join(segments), 3, min_share=0.25) == ([], [])
+    # Both first in their segment: tied, ordered by id
+    assert bm25.search_segments(segments, 3, min_share=0.25) == [0, 1]
+    assert bm25.search_segments(["inlet velocity 51.4 m/s"], 3, min_share=0.25) == [1]
+    assert bm25.search_segments(["capital of France", "fouling study"], 3, min_share=0.25) == []
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+import llm_stub_server
+import qa_modules
+from openai_client_factory import aclose_async_chat_clients
+
+FIRST_TOKEN_LATENCY = 0.3
+
+
+@pytest.fixture
+def slow_stub(monkeypatch):
+    """Stub endpoint that waits before sending response headers, like a queued server."""
+    settings = llm_stub_server.StubSettings(default_reply="stub answer", first_token_latency=FIRST_TOKEN_LATENCY)
+    server, base_url = llm_stub_server.start_stub_server(settings=settings)
+    monkeypatch.setenv("DEEPSEEK_R1_BASE_URL", base_url)
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+MESSAGES = [{"role": "user", "content": "Which turbulence model is used?"}]
+
+
+def test_ttft_includes_time_before_response_headers(slow_stub):
+    result = qa_modules.QA_NoContext_deepseek_R1().qa_interface(MESSAGES)
+    assert result["answer"] == "stub answer"
+    assert result["ttft"] >= FIRST_TOKEN_LATENCY
+    assert result["wall_time"] >= result["ttft"]
+
+
+def test_async_ttft_includes_time_before_response_headers(slow_stub):
+    qa = qa_modules.QA_NoContext_deepseek_R1()
+
+    async def ask():
+        try:
+            return await qa.async_qa_interface(MESSAGES)
+        finally:
+            await aclose_async_chat_clients()
+
+    result = asyncio.run(ask())
+    assert result["ttft"] >= FIRST_TOKEN_LATENCY
+
+
+def test_percentiles_are_interpolated():
+    summary = qa_modules._distribution([4.0, None, 1.0, 3.0, 2.0])
+    assert summary["count"] == 4
+    assert summary["p50"] == pytest.approx(2.5)
+    assert summary["max"] == 4.0
+
+
+def test_latency_statistics_skip_cache_hits():
+    logs = [
+        {"call_site": "file_corrector.rewrite_file", "wall_time": 2.0, "ttft": 0.5, "tokens_per_second": 10.0},
+        {"call_site": "file_corrector.rewrite_file", "wall_time": 4.0, "ttft": 1.5, "tokens_per_second": 20.0},
+        {"call_site": "file_corrector.rewrite_file", "cache_hit": True, "wall_time": 100.0},
+    ]
+    stats = qa_modules._latency_statistics(logs, "call_site")["file_corrector.rewrite_file"]
+    assert stats["calls"] == 2
+    assert stats["total_wall_time"] == 6.0
+    assert stats["ttft"]["p50"] == pytest.approx(1.0)
+    assert stats["wall_time_histogram"]["<=2s"] == 1 and stats["wall_time_histogram"]["<=5s"] == 1
@@ -0,0 +1,123 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+import config
+import llm_rate_limiter
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiters(monkeypatch):
+    monkeypatch.setattr(llm_rate_limiter, "_limiters", {})
+    monkeypatch.setattr(config, "llm_rate_limits", {})
+    monkeypatch.setattr(config, "llm_max_retries", 5)
+    monkeypatch.setattr(config, "llm_backoff_base", 0.01)
+    monkeypatch.setattr(config, "llm_backoff_max", 0.01)
+    monkeypatch.setattr(config, "llm_call_deadline", 5.0)
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "http://127.0.0.1/v1/chat/completions"))
+
+
+def rate_limit_error(retry_after):
+    request = httpx.Request("POST", "http://127.0.0.1/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": str(retry_after)}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class FlakyRequest:
+    """Fails with the given errors, then returns "ok"; records the deadline of each attempt."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.deadlines = []
+
+    def __call__(self, deadline):
+        self.deadlines.append(deadline)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_token_bucket_waits_once_empty():
+    bucket = llm_rate_limiter.TokenBucket(60)
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_disabled_token_bucket_never_waits():
+    bucket = llm_rate_limiter.TokenBucket(None)
+    assert not bucket.enabled
+    assert bucket.reserve(10 ** 6) == 0.0
+
+
+def test_backoff_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(config, "llm_backoff_base", 1.0)
+    monkeypatch.setattr(config, "llm_backoff_max", 4.0)
+    assert all(0 <= llm_rate_limiter.backoff_delay(attempt) <= 4.0 for attempt in range(10))
+
+
+def test_retryable_errors_are_retried_under_one_deadline():
+    request = FlakyRequest(connection_error(), connection_error())
+    assert llm_rate_limiter.call_with_retry("TEST", request) == "ok"
+    assert len(request.deadlines) == 3
+    assert len(set(request.deadlines)) == 1
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(config, "llm_max_retries", 1)
+    request = FlakyRequest(connection_error(), connection_error(), connection_error())
+    with pytest.raises(openai.APIConnectionError):
+        llm_rate_limiter.call_with_retry("TEST", request)
+    assert len(request.deadlines) == 2
+
+
+def test_deadline_exceeded_is_not_retried():
+    request = FlakyRequest(llm_rate_limiter.LLMDeadlineExceeded("slow stream"))
+    with pytest.raises(llm_rate_limiter.LLMDeadlineExceeded):
+        llm_rate_limiter.call_with_retry("TEST", request)
+    assert len(request.deadlines) == 1
+
+
+def test_no_retry_when_backoff_would_pass_deadline(monkeypatch):
+    monkeypatch.setattr(config, "llm_call_deadline", 1.0)
+    request = FlakyRequest(rate_limit_error(30))
+    with pytest.raises(openai.RateLimitError):
+        llm_rate_limiter.call_with_retry("TEST", request)
+    assert len(request.deadlines) == 1
+
+
+def test_throttling_past_deadline_fails_fast(monkeypatch):
+    monkeypatch.setattr(config, "llm_rate_limits", {"TEST": {"requests_per_minute": 1}})
+    monkeypatch.setattr(config, "llm_call_deadline", 1.0)
+    assert llm_rate_limiter.call_with_retry("TEST", FlakyRequest()) == "ok"
+    request = FlakyRequest()
+    with pytest.raises(llm_rate_limiter.LLMDeadlineExceeded):
+        llm_rate_limiter.call_with_retry("TEST", request)
+    assert request.deadlines == []
+
+
+def test_async_call_uses_remaining_time(monkeypatch):
+    monkeypatch.setattr(config, "llm_call_deadline", 0.3)
+    attempts = []
+
+    async def request(deadline):
+        attempts.append(deadline)
+        if len(attempts) == 1:
+            raise connection_error()
+        await asyncio.sleep(10)
+
+    with pytest.raises(llm_rate_limiter.LLMDeadlineExceeded):
+        asyncio.run(llm_rate_limiter.call_with_retry_async("TEST", request))
+    assert len(attempts) == 2
+    assert len(set(attempts)) == 1
+
+
+def test_async_call_returns_result():
+    async def request(deadline):
+        return "ok"
+
+    assert asyncio.run(llm_rate_limiter.call_with_retry_async("TEST", request)) == "ok"
@@ -0,0 +1,139 @@
+import json
+
+import httpx
+import pytest
+
+import config
+import llm_transport
+import openai_client_factory
+import qa_modules
+from llm_stub_server import StubSettings, start_stub_server
+
+REPLIES = [
+    {"match": "inlet velocity", "reply": "The inlet velocity is 10 m/s."},
+    {"match": "turbulence model", "reply": "k-omega SST"},
+    {"match": "solver", "reply": "simpleFoam"},
+]
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server, base_url = start_stub_server(settings=StubSettings(replies=REPLIES))
+    for prefix in ("DEEPSEEK_V3", "DEEPSEEK_R1"):
+        monkeypatch.setenv(f"{prefix}_BASE_URL", base_url)
+    yield server, base_url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def transport(tmp_path, monkeypatch, log_manager):
+    """Switch llm_transport_mode with fresh clients and cassettes, as a new process would."""
+    monkeypatch.setattr(config, "llm_cassette_path", str(tmp_path / "cassette.jsonl"))
+    monkeypatch.setattr(config, "llm_stream_include_usage", True)
+    monkeypatch.setattr(openai_client_factory, "_client_registry", {})
+    monkeypatch.setattr(llm_transport, "_cassettes", {})
+
+    def switch(mode):
+        openai_client_factory.close_chat_clients()
+        llm_transport._cassettes.clear()
+        monkeypatch.setattr(config, "llm_transport_mode", mode)
+
+    yield switch
+    openai_client_factory.close_chat_clients()
+
+
+def _cassette(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _token_fields(log):
+    return {k: log.get(k) for k in ("prompt_tokens", "response_tokens", "reasoning_tokens", "usage_source")}
+
+
+def _record_then_replay(stub, transport, log_manager, run):
+    """Run `run()` against the stub with recording on, then again from the cassette with the stub stopped."""
+    transport("record")
+    recorded = run()
+    recorded_logs = list(log_manager.logs)
+
+    server, _ = stub
+    server.shutdown()
+    transport("replay")
+    log_manager.logs.clear()
+    replayed = run()
+    return recorded, replayed, recorded_logs, list(log_manager.logs)
+
+
+def test_v3_round_trip(stub, transport, log_manager):
+    question = "What is the inlet velocity?"
+    recorded, replayed, recorded_logs, replayed_logs = _record_then_replay(
+        stub, transport, log_manager, lambda: qa_modules.QA_NoContext_deepseek_V3().ask(question)
+    )
+
+    assert recorded == replayed == "The inlet velocity is 10 m/s."
+    [entry] = _cassette(config.llm_cassette_path)
+    assert entry["request"]["body"]["messages"] == [{"role": "user", "content": question}]
+    assert json.loads(entry["response"]["body"])["usage"]["completion_tokens"] == 6
+    assert [_token_fields(log) for log in replayed_logs] == [_token_fields(log) for log in recorded_logs]
+
+
+def test_r1_stream_round_trip_keeps_the_usage_chunk(stub, transport, log_manager):
+    question = "Which turbulence model is used?"
+    recorded, replayed, recorded_logs, replayed_logs = _record_then_replay(
+        stub, transport, log_manager, lambda: qa_modules.QA_NoContext_deepseek_R1().ask(question)
+    )
+
+    assert recorded == replayed == "k-omega SST"
+    [entry] = _cassette(config.llm_cassette_path)
+    events = entry["response"]["events"]
+    assert entry["request"]["body"]["stream_options"] == {"include_usage": True}
+    assert events[-1] == "data: [DONE]\n\n"
+    assert json.loads(events[-2][len("data: "):])["usage"]["completion_tokens"] == 2
+    assert replayed_logs[0]["usage_source"] == "server"
+    assert [_token_fields(log) for log in replayed_logs] == [_token_fields(log) for log in recorded_logs]
+
+
+def test_ask_many_round_trip(stub, transport, log_manager):
+    questions = ["Which solver is used?", "What is the inlet velocity?", "Which turbulence model is used?"]
+    recorded, replayed, _, _ = _record_then_replay(
+        stub, transport, log_manager, lambda: qa_modules.ask_many(qa_modules.QA_NoContext_deepseek_R1(), questions)
+    )
+
+    assert recorded == replayed == ["simpleFoam", "The inlet velocity is 10 m/s.", "k-omega SST"]
+    assert len(_cassette(config.llm_cassette_path)) == 3
+
+
+def test_replay_without_a_recording(tmp_path):
+    cassette = llm_transport.Cassette(str(tmp_path / "empty.jsonl"))
+    with pytest.raises(llm_transport.CassetteMissError):
+        cassette.next_response(llm_transport.request_key("POST", "/v1/chat/completions", b"{}"))
+
+
+def test_stub_server_replies_by_rule_and_streams_usage(stub):
+    _, base_url = stub
+    with httpx.Client(base_url=base_url) as client:
+        reply = client.post("/chat/completions", json={
+            "model": "r1", "messages": [{"role": "user", "content": "Which solver is used?"}],
+        }).json()
+        default = client.post("/chat/completions", json={"messages": [{"role": "user", "content": "Hello"}]}).json()
+        streamed = client.post("/chat/completions", json={
+            "messages": [{"role": "user", "content": "What is the inlet velocity?"}],
+            "stream": True, "stream_options": {"include_usage": True},
+        })
+        missing = client.post("/models", json={})
+
+    assert reply["choices"][0]["message"]["content"] == "simpleFoam"
+    assert reply["usage"] == {"prompt_tokens": 4, "completion_tokens": 1, "total_tokens": 5}
+    assert default["choices"][0]["message"]["content"] == StubSettings().default_reply
+
+    assert streamed.headers["content-type"] == "text/event-stream"
+    events = [line[len("data: "):] for line in streamed.text.split("\n\n") if line]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    content = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks if chunk["choices"])
+    assert content == "The inlet velocity is 10 m/s."
+    assert chunks[-1]["choices"] == [] and chunks[-1]["usage"]["completion_tokens"] == 6
+
+    assert missing.status_code == 404
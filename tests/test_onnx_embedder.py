@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+for module in ("torch", "onnx", "onnxruntime", "sentence_transformers", "tokenizers"):
+    pytest.importorskip(module)
+
+import onnx_embedder
+
+SENTENCES = [
+    "The inlet velocity is 10 m/s and the outlet is a fixed pressure boundary.",
+    "The k-omega SST turbulence model is used with a Reynolds number of 6e6.",
+    "The mesh has 120000 cells.",
+    "Total pressure at the nozzle inlet",
+]
+
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    """A small randomly initialised MPNet sentence-transformers model (mean pooling + Normalize)."""
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from tokenizers import Tokenizer, normalizers, pre_tokenizers, processors, trainers
+    from tokenizers.models import WordPiece
+    from transformers import MPNetConfig, MPNetModel, PreTrainedTokenizerFast
+
+    model_dir = tmp_path_factory.mktemp("tiny-mpnet")
+    tokenizer = Tokenizer(WordPiece(unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.BertNormalizer(lowercase=True)
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.train_from_iterator(
+        SENTENCES * 5, trainers.WordPieceTrainer(vocab_size=300, special_tokens=["<s>", "<pad>", "</s>", "[UNK]", "<mask>"])
+    )
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<s> $A </s>", special_tokens=[("<s>", tokenizer.token_to_id("<s>")), ("</s>", tokenizer.token_to_id("</s>"))]
+    )
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>", unk_token="[UNK]", pad_token="<pad>",
+        mask_token="<mask>", cls_token="<s>", sep_token="</s>"
+    ).save_pretrained(model_dir / "transformer")
+
+    torch.manual_seed(0)
+    MPNetModel(MPNetConfig(
+        vocab_size=300, hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64,
+        max_position_embeddings=66, pad_token_id=1
+    )).save_pretrained(model_dir / "transformer")
+
+    transformer = models.Transformer(str(model_dir / "transformer"), max_seq_length=16)
+    SentenceTransformer(modules=[transformer, models.Pooling(32, "mean"), models.Normalize()]).save(str(model_dir / "st"))
+    return str(model_dir / "st")
+
+
+def test_settings_read_from_the_sentence_transformers_modules(tiny_model):
+    assert onnx_embedder.sentence_transformer_settings(tiny_model) == {
+        "pooling": "mean", "normalize": True, "max_seq_length": 16
+    }
+
+
+def test_quantized_export_matches_sentence_transformer(tiny_model, tmp_path):
+    from sentence_transformers import SentenceTransformer
+
+    output_dir = onnx_embedder.export_quantized(tiny_model, str(tmp_path / "onnx"))
+    embedder = onnx_embedder.OnnxSentenceEmbedder(output_dir, threads=1)
+    # Includes a sentence longer than max_seq_length and batches with padding
+    sentences = SENTENCES + [" ".join(SENTENCES)]
+    actual = embedder.encode(sentences, batch_size=2)
+    expected = SentenceTransformer(tiny_model, device="cpu").encode(sentences)
+
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(np.linalg.norm(actual, axis=1), 1.0, rtol=1e-5)
+    assert np.min(np.sum(actual * expected, axis=1)) > 0.99
+    assert embedder.encode(SENTENCES[0]).shape == (32,)
+
+
+def test_inference_does_not_need_torch(tiny_model, tmp_path):
+    output_dir = onnx_embedder.export_quantized(tiny_model, str(tmp_path / "onnx"))
+    script = (
+        "import sys, onnx_embedder; "
+        f"onnx_embedder.OnnxSentenceEmbedder({output_dir!r}).encode(['inlet velocity']); "
+        "print('torch' in sys.modules)"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(onnx_embedder.__file__)
+    )
+    assert completed.stdout.strip() == "False"
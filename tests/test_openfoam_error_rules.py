@@ -0,0 +1,94 @@
+import pytest
+
+from openfoam_error_rules import errors_repeated, error_signature, is_dimension_error, missing_file, normalize_error
+
+DIMENSION_ERROR = """
+--> FOAM FATAL ERROR:
+incompatible dimensions for operation
+    [U[0 1 -1 0 0 0 0] ] + [p[0 2 -2 0 0 0 0] ]
+
+    From function checkMethod(const fvMatrix<Type>&, const fvMatrix<Type>&)
+"""
+MISSING_FILE_ERROR = """
+--> FOAM FATAL IO ERROR:
+cannot find file "/home/user/run/cavity/0/nut"
+
+file: /home/user/run/cavity/0/nut at line 0.
+
+    From function regIOobject::readStream()
+"""
+UNKNOWN_SCHEME_ERROR = """
+--> FOAM FATAL IO ERROR:
+Unknown discretisation scheme linearUpwindV
+
+Valid schemes are : 60 ( CoBlended Gauss ... )
+"""
+
+
+def _run(error, pid, date):
+    return f"""/*---------------------------------------------------------------------------*\\
+Build  : 10-abcdef
+Exec   : simpleFoam
+Date   : {date}
+Time   : 10:0{pid}:00
+PID    : {pid}
+Case   : /home/user/run/cavity
+\\*---------------------------------------------------------------------------*/
+Time = 1
+{error}
+#0  Foam::error::printStack(Foam::Ostream&) at ??:?
+#1  Foam::sigFpe::sigHandler(int) at 0x7f{pid}abc
+"""
+
+
+@pytest.mark.parametrize("error, expected", [
+    (DIMENSION_ERROR, True),
+    ("Entry dimensions [0 1 -1 0 0 0 0] != [0 2 -2 0 0 0 0]", True),
+    (MISSING_FILE_ERROR, False),
+    (UNKNOWN_SCHEME_ERROR, False),
+    ("Segmentation fault (core dumped)", False),
+    # Mentions dimensions without a known message: leave it to the LLM
+    ("--> FOAM FATAL ERROR: wrong dimension in field", None),
+    ("something unusual happened", None),
+    ("", None),
+])
+def test_is_dimension_error(error, expected):
+    assert is_dimension_error(error) is expected
+
+
+def test_missing_file_is_case_relative():
+    assert missing_file(MISSING_FILE_ERROR) == "0/nut"
+    assert missing_file(MISSING_FILE_ERROR, case_path="/home/user/run/cavity/") == "0/nut"
+    assert missing_file('cannot find file "system/fvSolution"') == "system/fvSolution"
+
+
+def test_missing_file_answers_no_or_defers():
+    assert missing_file(DIMENSION_ERROR) == "no"
+    assert missing_file(None) == "no"
+    # The phrase without a quoted path, or a path outside 0/ system/ constant/
+    assert missing_file("cannot find file") is None
+    assert missing_file('cannot find file "/etc/controlDict"') is None
+
+
+def test_normalize_error_drops_run_specific_lines():
+    first, second = _run(DIMENSION_ERROR, 1, "Jan 01 2024"), _run(DIMENSION_ERROR, 2, "Jan 02 2024")
+
+    assert first != second
+    assert normalize_error(first) == normalize_error(second)
+    assert "PID" not in normalize_error(first) and "#0" not in normalize_error(first)
+
+
+def test_error_signature_is_the_fatal_block():
+    signature = error_signature(_run(MISSING_FILE_ERROR, 1, "Jan 01 2024"))
+
+    assert signature.startswith("--> FOAM FATAL IO ERROR: cannot find file")
+    assert "From function" not in signature
+    assert error_signature("no fatal error here") is None
+
+
+def test_errors_repeated():
+    assert errors_repeated([_run(DIMENSION_ERROR, 1, "a"), _run(DIMENSION_ERROR, 2, "b")]) is True
+    # Same fatal error, different log output around it
+    assert errors_repeated([DIMENSION_ERROR, "Time = 5\n" + DIMENSION_ERROR]) is True
+    assert errors_repeated([DIMENSION_ERROR, MISSING_FILE_ERROR]) is False
+    assert errors_repeated([DIMENSION_ERROR, "Killed"]) is None
@@ -0,0 +1,68 @@
+import pytest
+
+import config
+import vector_index
+from conftest import write_text_pdf
+from paper_library import PaperLibrary
+
+NOZZLE = [[
+    "The convergent divergent nozzle is simulated with rhoCentralFoam.",
+    "The nozzle inlet total pressure is 500 kPa and the total temperature is 300 K.",
+    "The nozzle outlet static pressure is 101325 Pa.",
+]]
+AIRFOIL = [[
+    "The NACA0012 airfoil is simulated with simpleFoam.",
+    "The airfoil angle of attack is 4 degrees at a Reynolds number of 6e6.",
+    "The Spalart Allmaras turbulence model is used for the airfoil.",
+]]
+
+
+@pytest.fixture(params=[True, False], ids=["selector", "position-fallback"])
+def library(request, embedder, monkeypatch, tmp_path):
+    if request.param and not vector_index.IDMAP_SEARCH_PARAMETERS:
+        pytest.skip("this faiss does not take search parameters through IndexIDMap")
+    monkeypatch.setattr(vector_index, "IDMAP_SEARCH_PARAMETERS", request.param)
+    monkeypatch.setattr(config, "pdf_extract_workers", 1)
+    return PaperLibrary()
+
+
+def _texts(library, chunk_ids):
+    texts = library.chunk_texts(chunk_ids)
+    return [texts[chunk_id] for chunk_id in chunk_ids]
+
+
+def test_scoped_retrieval_only_returns_chunks_of_the_scope(library, tmp_path):
+    nozzle = library.add(write_text_pdf(tmp_path / "nozzle.pdf", NOZZLE))
+    airfoil = library.add(write_text_pdf(tmp_path / "airfoil.pdf", AIRFOIL))
+
+    question = "What is the total pressure at the nozzle inlet?"
+    [scoped] = library.retrieve([question], 3, doc_ids=[airfoil])
+    [everywhere] = library.retrieve([question], 3)
+
+    assert scoped and all(chunk_id in library._chunk_ids([airfoil]) for chunk_id in scoped)
+    assert "nozzle inlet total pressure" in " ".join(_texts(library, everywhere))
+    assert [document["doc_id"] for document in library.documents()] == [nozzle, airfoil]
+
+
+def test_unchanged_paper_is_not_reingested(library, embedder, tmp_path):
+    path = write_text_pdf(tmp_path / "nozzle.pdf", NOZZLE)
+    doc_id = library.add(path)
+    encoded = embedder.encoded
+
+    assert library.add(path) == doc_id
+    assert embedder.encoded == encoded
+
+
+def test_removed_paper_leaves_the_index(library, tmp_path):
+    nozzle_path = write_text_pdf(tmp_path / "nozzle.pdf", NOZZLE)
+    nozzle = library.add(nozzle_path)
+    airfoil = library.add(write_text_pdf(tmp_path / "airfoil.pdf", AIRFOIL))
+    nozzle_chunks = set(library._chunk_ids([nozzle]))
+
+    assert library.remove(nozzle_path) == [nozzle]
+
+    [found] = library.retrieve(["nozzle inlet total pressure"], 5)
+    assert not nozzle_chunks & set(found)
+    assert library.index.ntotal == len(library._chunk_ids([airfoil]))
+    assert [document["doc_id"] for document in library.documents()] == [airfoil]
+    assert library.remove(nozzle_path) == []
@@ -0,0 +1,164 @@
+import math
+
+import pytest
+
+import paper_tables
+from paper_tables import TableIndex, parse_number, parse_table, to_si
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1,000", 1000.0),
+    ("6×10^6", 6e6),
+    ("6 x 10⁶", 6e6),
+    ("10⁵", 1e5),
+    ("1.2E+5", 1.2e5),
+    ("-3e5", -3e5),
+    ("0.15", 0.15),
+    ("2.5×10⁻³", 2.5e-3),
+])
+def test_parse_number(text, expected):
+    assert parse_number(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("text", ["", "k-epsilon", "Case-1", "NH 3", "10 m/s", "1,00"])
+def test_parse_number_rejects_non_numbers(text):
+    assert parse_number(text) is None
+
+
+@pytest.mark.parametrize("value, unit, expected", [
+    (10, "m/s", (10, "m/s")),
+    (10, "m s⁻¹", (10, "m/s")),
+    (36, "km/h", (10, "m/s")),
+    (101.325, "kPa", (101325, "Pa")),
+    (1, "bar", (1e5, "Pa")),
+    (1, "atm", (101325, "Pa")),
+    (25, "℃", (298.15, "K")),
+    (32, "°F", (273.15, "K")),
+    (1.225, "kg/m³", (1.225, "kg/m3")),
+    (1.8e-5, "Pa s", (1.8e-5, "Pa·s")),
+    (5, "%", (0.05, "")),
+    (4, "deg", (4, "°")),
+])
+def test_to_si(value, unit, expected):
+    si_value, si_unit = to_si(value, unit)
+    assert si_value == pytest.approx(expected[0])
+    assert si_unit == expected[1]
+
+
+def test_to_si_leaves_unknown_units_and_missing_values():
+    assert to_si(3.0, "furlong") == (3.0, "")
+    assert to_si(None, "Pa") == (None, "Pa")
+    value, _ = to_si(math.nan, "kPa")
+    assert math.isnan(value)
+
+
+def test_quantities_in_words_and_symbols():
+    assert paper_tables.quantities_in("Inlet velocity (m/s)") == ["velocity"]
+    assert paper_tables.quantities_in("Pressure (P)") == ["pressure"]
+    assert paper_tables.quantities_in("Ma") == ["mach"]
+    assert paper_tables.quantities_in("k-omega SST model") == ["turbulence"]
+    assert paper_tables.quantities_in("Boundary") == []
+
+
+def test_parse_table_fills_merged_cells_and_types_numeric_columns():
+    table = parse_table([
+        ["Boundary", "Velocity (m/s)", "Pressure (kPa)"],
+        ["Inlet", "10", "101.3"],
+        [None, "12", None],
+        ["Outlet", "zeroGradient", "100"],
+    ])
+
+    assert table.label_columns == ("Boundary",)
+    assert table.text["Boundary"].tolist() == ["Inlet", "Inlet", "Outlet"]
+    assert table.units == {"Velocity (m/s)": "m/s", "Pressure (kPa)": "kPa"}
+    assert table.values["Pressure (kPa)"].tolist() == [101.3, 101.3, 100.0]
+    # Two of three cells are numbers
+    assert table.values["Velocity (m/s)"].dtype == "float64"
+    assert math.isnan(table.values["Velocity (m/s)"].iloc[2])
+
+
+def test_parse_table_without_data_rows():
+    assert parse_table([["Boundary", "Velocity"]]) is None
+    assert parse_table([["only one column"], ["x"]]) is None
+    assert parse_table([]) is None
+
+
+def test_table_index_converts_values_to_si():
+    tables = TableIndex([
+        [
+            ["Boundary", "Velocity (m/s)", "Total pressure (kPa)", "Temperature (°C)"],
+            ["Inlet", "75.18", "500", "27"],
+            ["Outlet", "", "101.325", ""],
+        ],
+        [
+            ["Parameter", "Value"],
+            ["Reynolds number", "6×10⁶"],
+            ["Conditions", "Ma = 0.3; α = 4°"],
+        ],
+    ])
+
+    assert tables.value("velocity") == pytest.approx(75.18)
+    pressures = tables.lookup("pressure")
+    assert pressures["si_value"].tolist() == pytest.approx([5e5, 101325])
+    assert set(pressures["si_unit"]) == {"Pa"}
+    assert tables.value("pressure", name="outlet") == pytest.approx(101325)
+    assert tables.value("temperature") == pytest.approx(300.15)
+    assert tables.value("reynolds") == pytest.approx(6e6)
+    assert tables.value("mach") == pytest.approx(0.3)
+    assert tables.value("angle_of_attack") == pytest.approx(4)
+    assert tables.value("density") is None
+    with pytest.raises(ValueError):
+        tables.lookup("colour")
+
+
+def test_prompt_rows_only_include_requested_quantities():
+    tables = TableIndex([
+        [
+            ["Boundary", "Velocity (m/s)", "Pressure (Pa)"],
+            ["Inlet", "10", "0"],
+        ],
+        [
+            ["Parameter", "Value"],
+            ["Mesh cells", "120000"],
+            ["Reynolds number", "6e6"],
+        ],
+    ])
+
+    prompt = tables.prompt_rows(["velocity", "reynolds"])
+
+    assert "Table 1:\n| Boundary | Velocity (m/s) |" in prompt
+    assert "Pressure" not in prompt
+    assert "| Reynolds number | 6e6 |" in prompt
+    assert "Mesh cells" not in prompt
+    assert tables.prompt_rows(["density"]) == ""
+
+
+def test_table_index_lists_each_value_once_and_needs_units_for_dimensional_quantities():
+    # Table 4 of temp/ComparisonofOpenFoamandANSYSFluent.pdf: OpenFOAM and Fluent settings side by side
+    tables = TableIndex([[
+        ["Boundary Name", None, "OF", "AF"],
+        ["Velocity _inlet", "Velocity", "fixedValue - 75.18 m/s", "75.18 m/s"],
+        [None, "Pressure", "zeroGradient", "Gauge Pressure–0"],
+        ["Pressure _outlet", "Pressure", "TotalPressure", "Gauge Pressure–0"],
+        [None, "Temperature", "fixedValue 300", "300 K"],
+    ]])
+
+    assert tables.lookup("velocity")["si_value"].tolist() == [75.18]
+    # "Gauge Pressure–0" gives no unit, "fixedValue 300" gives none either
+    assert tables.lookup("pressure").empty
+    assert tables.lookup("temperature")[["si_value", "si_unit", "column"]].values.tolist() == [[300.0, "K", "AF"]]
+    # The rows are still offered to the prompt through their labels
+    assert "| Pressure _outlet | Pressure | TotalPressure | Gauge Pressure–0 |" in tables.prompt_rows(["pressure"])
+
+
+def test_dimensionless_quantities_need_no_unit():
+    tables = TableIndex([[
+        ["Parameter", "Value"],
+        ["Reynolds number", "6e6"],
+        ["Angle of attack", "4"],
+        ["Turbulence intensity", "5 %"],
+    ]])
+
+    assert tables.value("reynolds") == pytest.approx(6e6)
+    assert tables.value("angle_of_attack") == pytest.approx(4)
+    assert tables.value("turbulence") == pytest.approx(0.05)
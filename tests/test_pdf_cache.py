@@ -0,0 +1,129 @@
+import os
+from contextlib import closing
+
+import numpy as np
+import pytest
+
+import pdf_cache
+
+
+@pytest.fixture(autouse=True)
+def no_pending_writes(monkeypatch):
+    monkeypatch.setattr(pdf_cache, "_pending_writes", {})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return pdf_cache.EmbeddingCache("sentence-transformers/all-mpnet-base-v2", cache_dir=str(tmp_path), max_bytes=None)
+
+
+def _vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).random((count, dim), dtype="float32")
+
+
+def test_embeddings_round_trip_as_one_file_per_batch(cache):
+    texts = [f"chunk {i}" for i in range(20)]
+    vectors = _vectors(20)
+    cache.put_many(texts, vectors)
+    assert len(cache._batch_paths()) == 1
+
+    found = cache.get_many(texts)
+    assert sorted(found) == list(range(20))
+    assert all(np.array_equal(found[i], vectors[i]) for i in found)
+
+
+def test_rechunked_paper_finds_chunks_from_several_batches(cache):
+    texts = [f"chunk {i}" for i in range(10)]
+    vectors = _vectors(10)
+    cache.put_many(texts[:4], vectors[:4])
+    cache.put_many(texts[4:8], vectors[4:8])
+
+    query = ["new chunk", texts[6], texts[1], texts[1]]
+    found = cache.get_many(query)
+    assert sorted(found) == [1, 2, 3]
+    assert np.array_equal(found[1], vectors[6])
+    assert np.array_equal(found[2], vectors[1]) and np.array_equal(found[3], vectors[1])
+
+
+def _loaded_paths(monkeypatch):
+    loaded = []
+    load = np.load
+    monkeypatch.setattr(pdf_cache.np, "load", lambda path, *args, **kwargs: loaded.append(path) or load(path, *args, **kwargs))
+    return loaded
+
+
+def test_miss_only_opens_the_batches_holding_the_missing_keys(cache, monkeypatch):
+    texts = [f"chunk {i}" for i in range(30)]
+    vectors = _vectors(30)
+    for start in range(0, 30, 5):
+        cache.put_many(texts[start:start + 5], vectors[start:start + 5])
+    loaded = _loaded_paths(monkeypatch)
+
+    found = cache.get_many(["new chunk", texts[7], texts[22]])
+
+    assert sorted(found) == [1, 2]
+    assert np.array_equal(found[2], vectors[22])
+    holding = {cache._batch_path(cache.batch_key([cache.text_key(t) for t in texts[start:start + 5]])) for start in (5, 20)}
+    assert set(loaded) == holding
+
+    loaded.clear()
+    assert cache.get_many(["new chunk"]) == {}
+    assert loaded == []
+
+
+def test_manifest_is_rebuilt_from_the_batch_files(cache):
+    texts = [f"chunk {i}" for i in range(6)]
+    vectors = _vectors(6)
+    cache.put_many(texts[:3], vectors[:3])
+    cache.put_many(texts[3:], vectors[3:])
+    os.remove(os.path.join(cache.model_dir, pdf_cache.MANIFEST_NAME))
+
+    found = cache.get_many([texts[4], texts[1]])
+
+    assert np.array_equal(found[0], vectors[4]) and np.array_equal(found[1], vectors[1])
+
+
+def test_evicted_batches_are_dropped_from_the_manifest(cache):
+    texts = [f"chunk {i}" for i in range(6)]
+    vectors = _vectors(6)
+    cache.put_many(texts[:3], vectors[:3])
+    cache.put_many(texts[3:], vectors[3:])
+    evicted = cache.batch_key([cache.text_key(t) for t in texts[:3]])
+    os.remove(cache._batch_path(evicted))
+
+    found = cache.get_many([texts[0], texts[5]])
+
+    assert sorted(found) == [1]
+    with closing(cache._manifest()) as db:
+        assert db.execute("SELECT COUNT(*) FROM batch_keys WHERE batch = ?", (evicted,)).fetchone() == (0,)
+        assert db.execute("SELECT COUNT(*) FROM batch_keys").fetchone() == (3,)
+
+
+def test_eviction_runs_every_n_writes(monkeypatch, tmp_path):
+    evictions = []
+    monkeypatch.setattr(pdf_cache, "evict_lru", lambda cache_dir, max_bytes: evictions.append(cache_dir))
+    for _ in range(pdf_cache.EVICT_EVERY_PUTS * 2 + 1):
+        pdf_cache.record_write(str(tmp_path), 10 ** 12, 1)
+    assert len(evictions) == 2
+
+
+def test_eviction_runs_once_a_fraction_of_the_budget_is_written(monkeypatch, tmp_path):
+    evictions = []
+    monkeypatch.setattr(pdf_cache, "evict_lru", lambda cache_dir, max_bytes: evictions.append(cache_dir))
+    budget = 1000
+    pdf_cache.record_write(str(tmp_path), budget, budget * pdf_cache.EVICT_WRITTEN_FRACTION / 2)
+    assert evictions == []
+    pdf_cache.record_write(str(tmp_path), budget, budget * pdf_cache.EVICT_WRITTEN_FRACTION / 2)
+    assert len(evictions) == 1
+
+
+def test_evict_lru_keeps_recently_used_files(tmp_path):
+    paths = []
+    for i, age in enumerate((300, 200, 100)):
+        path = tmp_path / f"{i}.bin"
+        path.write_bytes(b"x" * 100)
+        mtime = os.path.getmtime(path) - age
+        os.utime(path, (mtime, mtime))
+        paths.append(path)
+    pdf_cache.evict_lru(str(tmp_path), 200)
+    assert [path.exists() for path in paths] == [False, True, True]
@@ -0,0 +1,162 @@
+import pytest
+
+import config
+import main_run_chatcfd
+from conftest import write_text_pdf
+from hybrid_retrieval import BM25Index
+from pdf_chunk_ask_question import CFDCaseExtractor
+from prompt_builder import PromptBuilder, retrieval_query
+
+PAPER = [
+    [
+        "1. Introduction",
+        "Low speed flow around the NACA0012 airfoil has been studied with many turbulence models.",
+        "Transition and separation near stall remain difficult to predict with RANS approaches.",
+        "This paper compares a new model with the standard one for angles of attack from 0 to 15 degrees.",
+        "The results are compared with wind tunnel measurements at a chord Reynolds number of 6 million.",
+        "Experimental lift and drag coefficients are taken from the literature for the comparison.",
+        "Grid independence and the influence of the far field distance are discussed as well.",
+    ],
+    [
+        "2. Computational setup",
+        "The computational domain extends twenty chords from the airfoil in every direction.",
+        "A velocity inlet is imposed on the upstream inlet boundary and a pressure outlet on the outlet.",
+        "The airfoil surface is a no-slip adiabatic wall with the first cell at y+ below one.",
+        "The inlet velocity is 51.4 m/s and the turbulent viscosity ratio at the inlet is 3.",
+        "The fields U, p, nut and nuTilda are initialised with the free stream values.",
+        "The steady solver simpleFoam is used with second order upwind schemes.",
+    ],
+    [
+        "3. Acknowledgements",
+        "The authors thank the funding agency and the computing centre for their support.",
+        "The authors declare that they have no known competing financial interests.",
+        "Data will be made available on request from the corresponding author of this study.",
+        "The funders had no role in study design, data collection and analysis or publication.",
+        "All authors contributed to writing and reviewing the manuscript of this study.",
+        "The computing time was granted by the national supercomputing programme.",
+    ],
+]
+
+
+@pytest.fixture
+def extractor(embedder, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "pdf_extract_workers", 1)
+    extractor = CFDCaseExtractor()
+    extractor.process_pdf(write_text_pdf(tmp_path / "naca0012.pdf", PAPER))
+    return extractor
+
+
+@pytest.fixture
+def setup_prompt(monkeypatch):
+    """The boundary condition prompt pdf_chunk_ask sends for a NACA0012 case."""
+    monkeypatch.setattr(config, "case_boundary_names", "outlet, inlet, airfoil")
+    return main_run_chatcfd.boundary_conditions_prompt(["U", "p", "nut", "nuTilda"])
+
+
+def test_retrieval_query_is_the_volatile_values(setup_prompt):
+    text, segments = retrieval_query(setup_prompt)
+
+    assert segments == ["outlet, inlet, airfoil", "['U', 'p', 'nut', 'nuTilda']"]
+    assert text == "Case boundaries: outlet, inlet, airfoil\nFields: ['U', 'p', 'nut', 'nuTilda']"
+    assert retrieval_query("inlet velocity") == ("inlet velocity", ["inlet velocity"])
+    assert retrieval_query(PromptBuilder().stable("Only instructions.")) == (
+        "Only instructions.", ["Only instructions."]
+    )
+
+
+def test_setup_prompt_gets_lexical_hits_when_the_dense_threshold_rejects_everything(extractor, setup_prompt, monkeypatch):
+    monkeypatch.setattr(config, "pdf_retrieval_mode", "hybrid")
+    monkeypatch.setattr(config, "pdf_chunk_min_similarity", 1.01)
+    setup_chunk = next(i for i, chunk in enumerate(extractor.chunks) if "velocity inlet" in chunk)
+
+    # The whole prompt is mostly instructions and the boundary type list: no chunk reaches the floor
+    whole_prompt = BM25Index(extractor.chunks).search(str(setup_prompt), 5, min_share=config.pdf_bm25_min_share)
+    assert whole_prompt == ([], [])
+
+    [retrieved] = extractor._retrieve([setup_prompt], 3)
+
+    assert retrieved and retrieved[0] == setup_chunk
+    assert not any("funding agency" in extractor.chunks[i] for i in retrieved)
+
+
+def test_dense_query_leaves_out_the_instructions(extractor, setup_prompt, embedder, monkeypatch):
+    encoded = []
+    encode = embedder.encode
+    monkeypatch.setattr(embedder, "encode", lambda texts, **kwargs: encoded.extend(texts) or encode(texts, **kwargs))
+
+    extractor._retrieve([setup_prompt, "What is the inlet velocity?"], 3)
+
+    assert encoded == [retrieval_query(setup_prompt)[0], "What is the inlet velocity?"]
+
+
+def test_group_questions_merges_overlapping_excerpts_within_the_caps(extractor, monkeypatch):
+    monkeypatch.setattr(config, "pdf_merge_max_questions", 2)
+    monkeypatch.setattr(config, "pdf_merge_max_chunks", 4)
+
+    groups = extractor._group_questions([
+        [0, 1],
+        [1, 2],     # shares chunk 1 with the first question
+        [1, 3],     # would make a third member
+        [],         # nothing retrieved: not asked
+        [4, 5],
+        [5, 6, 7, 8],  # overlaps, but the union would be five chunks
+    ])
+
+    assert groups == [
+        ([0, 1], [0, 1, 2]),
+        ([2], [1, 3]),
+        ([4], [4, 5]),
+        ([5], [5, 6, 7, 8]),
+    ]
+
+
+@pytest.mark.parametrize("response, expected", [
+    ("### Answer 1\nU = 10 m/s\n\n### Answer 2:\np = 0", ["U = 10 m/s", "p = 0"]),
+    ("## Answer 2\nsecond\n# Answer 1\nfirst", ["first", "second"]),
+    ("Some preamble\n### Answer 1\nfirst\n### Answer 2\nsecond", ["first", "second"]),
+    ("### Answer 1\nfirst", None),
+    ("### Answer 1\nfirst\n### Answer 3\nthird", None),
+    ("The answer 1 is inline, not a heading", None),
+])
+def test_split_merged_answer(response, expected):
+    assert CFDCaseExtractor._split_merged_answer(response, 2) == expected
+
+
+def test_query_many_asks_unsplittable_groups_one_question_at_a_time(extractor, monkeypatch):
+    questions = ["inlet velocity", "outlet pressure", "funding", "turbulence model"]
+    monkeypatch.setattr(extractor, "_retrieve", lambda questions, top_k: [[0, 1], [1], [2], []])
+    asked = []
+
+    def ask_all(prompts, context):
+        asked.append(prompts)
+        if len(asked) == 1:
+            # The merged prompt is not answered in the requested format
+            return ["velocity and pressure in one paragraph", "no funding details"]
+        return [f"answer {n}" for n in range(len(prompts))]
+
+    monkeypatch.setattr(extractor, "_ask_all", ask_all)
+
+    answers = extractor.query_many(questions)
+
+    assert answers == ["answer 0", "answer 1", "no funding details", "No relevant CFD configuration information found"]
+    merged, separate = asked[0][0], asked[1]
+    assert "### Answer N" in merged and "Question 2: [[[ outlet pressure ]]]" in merged
+    # Each retried question only gets its own excerpts
+    chunks = extractor.chunks
+    assert separate == [
+        extractor._build_prompt("inlet velocity", [chunks[0], chunks[1]]),
+        extractor._build_prompt("outlet pressure", [chunks[1]]),
+    ]
+    assert [entry["status"] for entry in extractor.token_usage] == ["empty"]
+
+
+def test_query_many_splits_a_well_formed_merged_answer(extractor, monkeypatch):
+    monkeypatch.setattr(extractor, "_retrieve", lambda questions, top_k: [[0, 1], [1, 2]])
+    asked = []
+    monkeypatch.setattr(
+        extractor, "_ask_all",
+        lambda prompts, context: asked.append(prompts) or ["### Answer 1\nfirst\n### Answer 2\nsecond"]
+    )
+
+    assert extractor.query_many(["inlet velocity", "outlet pressure"]) == ["first", "second"]
+    assert len(asked) == 1 and len(asked[0]) == 1
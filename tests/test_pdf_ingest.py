@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+import pdf_ingest
+from conftest import write_text_pdf
+
+
+@pytest.fixture
+def fake_ingest(monkeypatch, tmp_path):
+    """Replace parsing with a slow stub that records which papers were ingested, and when."""
+    monkeypatch.setattr(pdf_ingest, "_documents", pdf_ingest.OrderedDict())
+    monkeypatch.setattr(pdf_ingest, "_ingest_locks", {})
+    calls = []
+
+    def ingest_pdf(file_path, embedding_model=None):
+        started = time.perf_counter()
+        time.sleep(0.2)
+        calls.append((file_path, started, time.perf_counter()))
+        return object()
+
+    monkeypatch.setattr(pdf_ingest, "ingest_pdf", ingest_pdf)
+    paths = []
+    for name in ("a.pdf", "b.pdf"):
+        path = tmp_path / name
+        path.write_bytes(b"%PDF-1.4\n")
+        paths.append(str(path))
+    return calls, paths
+
+
+def _run_concurrently(*paths):
+    results = [None] * len(paths)
+
+    def run(i, path):
+        results[i] = pdf_ingest.get_document(path, "model")
+
+    threads = [threading.Thread(target=run, args=(i, path)) for i, path in enumerate(paths)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_same_paper_is_ingested_once(fake_ingest):
+    calls, (path, _) = fake_ingest
+    first, second = _run_concurrently(path, path)
+    assert len(calls) == 1
+    assert first is second
+    assert pdf_ingest.get_document(path, "model") is first
+    assert pdf_ingest._ingest_locks == {}
+
+
+def test_different_papers_are_ingested_concurrently(fake_ingest):
+    calls, paths = fake_ingest
+    _run_concurrently(*paths)
+    (_, start_a, end_a), (_, start_b, end_b) = calls
+    assert start_a < end_b and start_b < end_a
+
+
+def test_pool_does_not_fork_the_caller():
+    assert pdf_ingest._pool_context().get_start_method() in ("forkserver", "spawn")
+
+
+def _paper_pages(count, lines_per_page=30):
+    words = "the k omega SST model resolves the turbulent boundary layer at the nozzle wall".split()
+    return [
+        [" ".join(words[(page + line + i) % len(words)] for i in range(12)) for line in range(lines_per_page)]
+        for page in range(count)
+    ]
+
+
+def test_text_does_not_need_the_embedder(tmp_path, monkeypatch):
+    import embedder_registry
+
+    def no_embedder(*args, **kwargs):
+        raise AssertionError("the embedder was loaded")
+
+    monkeypatch.setattr(embedder_registry, "get_embedder", no_embedder)
+    path = write_text_pdf(tmp_path / "paper.pdf", _paper_pages(2))
+    document = pdf_ingest.get_document(path, "model")
+    assert "nozzle wall" in document.text
+    assert document.chunks
+
+
+def test_embeddings_are_computed_once_on_first_use(tmp_path, embedder):
+    path = write_text_pdf(tmp_path / "paper.pdf", _paper_pages(2))
+    document = pdf_ingest.ingest_pdf(path, "model")
+    assert embedder.encoded == 0
+    embeddings = document.embeddings
+    assert embeddings.shape == (len(document.chunks), embedder.dim)
+    assert not embeddings.flags.writeable
+    assert document.embeddings is embeddings
+    assert embedder.encoded == len(document.chunks)
+
+
+def _page_texts(count):
+    return ["\n".join(lines) for lines in _paper_pages(count, lines_per_page=12)]
+
+
+@pytest.mark.parametrize("window_chars", [pdf_ingest.CHUNK_SIZE, 3 * pdf_ingest.CHUNK_SIZE, pdf_ingest.CHUNK_WINDOW_CHARS])
+def test_streamed_chunks_match_chunking_the_whole_text(window_chars):
+    texts = _page_texts(12)
+    texts[3] = ""
+    texts[5] = "METHODOLOGY:\n" + texts[5]
+    whole = pdf_ingest.split_chunks("\n".join(text for text in texts if text))
+    assert len(whole) > 10
+    assert list(pdf_ingest.iter_chunks(texts, window_chars=window_chars)) == whole
+
+
+def test_chunks_are_yielded_before_all_pages_are_read():
+    read = []
+
+    def pages():
+        for number, text in enumerate(_page_texts(20)):
+            read.append(number)
+            yield text
+
+    chunks = pdf_ingest.iter_chunks(pages(), window_chars=3 * pdf_ingest.CHUNK_SIZE)
+    next(chunks)
+    assert len(read) < 5
+
+
+def test_stream_pdf_batches_match_ingest(tmp_path, embedder):
+    path = write_text_pdf(tmp_path / "paper.pdf", _paper_pages(6))
+    budget = 4 * pdf_ingest.STREAM_BYTES_PER_CHUNK
+    batches = list(pdf_ingest.stream_pdf(path, "model", memory_budget=budget))
+
+    document = pdf_ingest.ingest_pdf(path, "model")
+    assert [chunk for chunks, _ in batches for chunk in chunks] == list(document.chunks)
+    assert len(batches) > 1
+    assert all(len(chunks) <= pdf_ingest.stream_batch_size(budget) for chunks, _ in batches)
+    assert all(embeddings.shape == (len(chunks), embedder.dim) for chunks, embeddings in batches)
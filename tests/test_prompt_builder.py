@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import token_accounting
+from prompt_builder import PromptBuilder
+
+
+def test_stable_segments_come_first_in_insertion_order():
+    prompt = (
+        PromptBuilder()
+        .stable("Instructions.")
+        .volatile("Error", "FOAM FATAL ERROR")
+        .stable("  Keyword list.  ")
+        .volatile("File", "0/U")
+    )
+
+    assert prompt.stable_prefix == "Instructions.\n\nKeyword list."
+    assert prompt.volatile_tail == "Error: [[[ FOAM FATAL ERROR ]]]\n\nFile: [[[ 0/U ]]]"
+    assert str(prompt) == prompt.stable_prefix + "\n\n" + prompt.volatile_tail
+
+
+def test_prefix_is_identical_across_calls():
+    def build(error):
+        return PromptBuilder().stable("Fix the case.").volatile("Error", error).stable("Reference files.").build()
+
+    first, second = build("missing 0/nut"), build("dimension mismatch in p")
+
+    prefix = "Fix the case.\n\nReference files.\n\n"
+    assert first.startswith(prefix) and second.startswith(prefix)
+
+
+def test_extend_keeps_stable_before_volatile():
+    question = PromptBuilder().stable("What is the inlet velocity?").volatile("Case", "nozzle")
+    prompt = PromptBuilder().stable("Instructions.").volatile("Excerpts", "...").extend(question)
+
+    assert prompt.build() == (
+        "Instructions.\n\nWhat is the inlet velocity?\n\nExcerpts: [[[ ... ]]]\n\nCase: [[[ nozzle ]]]"
+    )
+
+
+def test_empty_segments():
+    assert PromptBuilder().stable("").stable(None).build() == ""
+    assert PromptBuilder().volatile("Error", "").build() == "Error: [[[  ]]]"
+
+
+def test_cached_prompt_tokens_from_either_usage_format():
+    deepseek = SimpleNamespace(prompt_cache_hit_tokens=128)
+    openai = SimpleNamespace(prompt_tokens_details=SimpleNamespace(cached_tokens=64))
+    extra = SimpleNamespace(model_extra={"prompt_cache_hit_tokens": 32})
+
+    assert token_accounting.cached_prompt_tokens(deepseek) == 128
+    assert token_accounting.cached_prompt_tokens(openai) == 64
+    assert token_accounting.cached_prompt_tokens(extra) == 32
+    assert token_accounting.cached_prompt_tokens(SimpleNamespace()) is None
+    assert token_accounting.cached_prompt_tokens(None) is None
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import config
+import qa_log_store
+from qa_log_store import BackgroundLogWriter, JsonlLogSink, export_json, prune_spill_files, read_jsonl, summarize_entry
+
+
+def _entry(i):
+    return {
+        "model_type": "deepseek-r1",
+        "user_prompt": f"问题 {i}: what is the inlet velocity?",
+        "assistant_response": f"U = {i} m/s",
+        "prompt_tokens": 10 + i,
+        "nested": {"values": [i, None, 1.5]},
+    }
+
+
+def test_sink_appends_in_batches(tmp_path, monkeypatch):
+    path = tmp_path / "logs" / "qa.jsonl"
+    clock = [0.0]
+    monkeypatch.setattr("qa_log_store.time.monotonic", lambda: clock[0])
+    sink = JsonlLogSink(str(path), flush_every=3, flush_interval=10.0)
+
+    sink.append(_entry(0))
+    sink.append(_entry(1))
+    assert not path.exists()
+    sink.append(_entry(2))
+    assert len(list(read_jsonl(path))) == 3
+
+    sink.append(_entry(3))
+    clock[0] = 10.0
+    sink.append(_entry(4))
+    assert [entry["prompt_tokens"] for entry in read_jsonl(path)] == [10, 11, 12, 13, 14]
+
+
+def test_read_jsonl_skips_a_truncated_last_line(tmp_path):
+    path = tmp_path / "qa.jsonl"
+    path.write_text(json.dumps(_entry(0)) + "\n\n" + json.dumps(_entry(1))[:20], encoding="utf-8")
+    assert list(read_jsonl(path)) == [_entry(0)]
+
+
+def test_export_json_matches_the_old_all_qa_logs_json(tmp_path):
+    entries = [_entry(i) for i in range(3)]
+    sink = JsonlLogSink(str(tmp_path / "all_qa_logs.jsonl"))
+    for entry in entries:
+        sink.append(entry)
+    sink.close()
+
+    json_path = export_json(str(tmp_path / "all_qa_logs.jsonl"))
+
+    assert json_path == str(tmp_path / "all_qa_logs.json")
+    # The legacy file was json.dump(logs, f, ensure_ascii=False, indent=2)
+    with open(json_path, encoding="utf-8") as f:
+        assert f.read() == json.dumps(entries, ensure_ascii=False, indent=2)
+
+
+def test_export_json_of_an_empty_log(tmp_path):
+    (tmp_path / "qa.jsonl").write_text("", encoding="utf-8")
+    with open(export_json(str(tmp_path / "qa.jsonl"), str(tmp_path / "out.json")), encoding="utf-8") as f:
+        assert f.read() == json.dumps([], indent=2)
+
+
+def test_export_case_log_matches_the_old_all_qa_logs_json(tmp_path, monkeypatch, log_manager):
+    monkeypatch.setattr(config, "case_log_write", True)
+    monkeypatch.setattr(config, "OUTPUT_PATH", str(tmp_path / "case"))
+    entries = [_entry(i) for i in range(5)]
+    for entry in entries:
+        log_manager.add_log(entry)
+
+    json_path = log_manager.export_case_log()
+
+    assert json_path == str(tmp_path / "case" / "all_qa_logs.json")
+    with open(json_path, encoding="utf-8") as f:
+        assert f.read() == json.dumps(entries, ensure_ascii=False, indent=2)
+    assert [entry["log_id"] for entry in entries] == list(range(5))
+
+
+def test_export_case_log_without_case_logging(monkeypatch, log_manager):
+    monkeypatch.setattr(config, "case_log_write", False)
+    log_manager.add_log(_entry(0))
+    assert log_manager.export_case_log() is None
+
+
+def test_concurrent_writers_keep_their_own_order(tmp_path):
+    writer = BackgroundLogWriter(max_queue=16, flush_every=7, flush_interval=60.0)
+    path = str(tmp_path / "qa.jsonl")
+
+    def write(thread):
+        for seq in range(200):
+            writer.submit(path, {"thread": thread, "seq": seq})
+
+    threads = [threading.Thread(target=write, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.flush()
+
+    entries = list(read_jsonl(path))
+    assert len(entries) == 8 * 200
+    for thread in range(8):
+        assert [e["seq"] for e in entries if e["thread"] == thread] == list(range(200))
+
+
+def test_submit_blocks_while_the_queue_is_full(tmp_path, monkeypatch):
+    release = threading.Event()
+    append = JsonlLogSink.append
+
+    def slow_append(self, entry):
+        release.wait(5)
+        append(self, entry)
+
+    monkeypatch.setattr(JsonlLogSink, "append", slow_append)
+    writer = BackgroundLogWriter(max_queue=1, flush_every=1)
+    path = str(tmp_path / "qa.jsonl")
+    writer.submit(path, {"seq": 0})  # taken by the writer thread, which then waits
+    deadline = time.monotonic() + 5
+    while writer._queue.qsize() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.submit(path, {"seq": 1})  # fills the queue
+
+    blocked = threading.Thread(target=writer.submit, args=(path, {"seq": 2}))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+
+    release.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    writer.flush()
+    assert [e["seq"] for e in read_jsonl(path)] == [0, 1, 2]
+
+
+def test_prune_spill_files_keeps_recent_logs(tmp_path):
+    now = time.time()
+    ages = {"old.jsonl": 8, "recent.jsonl": 6, "old.json": 30}
+    for name, days in ages.items():
+        path = tmp_path / name
+        path.write_text("{}\n")
+        os.utime(path, (now - days * 86400, now - days * 86400))
+
+    prune_spill_files(str(tmp_path), None)
+    assert sorted(os.listdir(tmp_path)) == sorted(ages)
+
+    prune_spill_files(str(tmp_path), 7)
+    assert sorted(os.listdir(tmp_path)) == ["old.json", "recent.jsonl"]
+    prune_spill_files(str(tmp_path / "missing"), 7)
+
+
+def test_summarize_entry_replaces_bodies_by_hashes():
+    entry = dict(_entry(1), reasoning_content=None)
+    summary = summarize_entry(entry)
+
+    assert summary["user_prompt_sha256"] == hashlib.sha256(entry["user_prompt"].encode("utf-8")).hexdigest()
+    assert "assistant_response_sha256" in summary and "reasoning_content_sha256" not in summary
+    assert not set(qa_log_store.BODY_FIELDS) & set(summary)
+    assert summary["prompt_tokens"] == 11 and summary["nested"] == entry["nested"]
+
+
+def test_log_manager_keeps_summaries_and_spills_full_entries(log_manager):
+    entries = [_entry(i) for i in range(3)]
+    for entry in entries:
+        log_manager.add_log(entry)
+
+    assert log_manager.logs == [summarize_entry(entry) for entry in entries]
+    assert list(log_manager.full_logs()) == entries
+    assert os.path.dirname(log_manager._spill_path) == config.QA_LOG_PATH
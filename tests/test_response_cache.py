@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+import config
+import qa_modules
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(qa_modules, "_response_cache", None)
+    monkeypatch.setattr(config, "llm_cache_enabled", True)
+
+
+class CountingInterface:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, messages):
+        self.calls += 1
+        return {"content": f"answer {self.calls}", "prompt_tokens": 1, "completion_tokens": 1}
+
+
+MESSAGES = [{"role": "user", "content": "Is this a dimension error?"}]
+
+
+def test_cache_is_opt_in():
+    interface = CountingInterface()
+    first, hit = qa_modules.cached_completion(interface, "model", 0.7, MESSAGES)
+    second, _ = qa_modules.cached_completion(interface, "model", 0.7, MESSAGES)
+    assert not hit
+    assert interface.calls == 2
+    assert first["content"] != second["content"]
+
+
+def test_cached_completion_hits_on_identical_request():
+    interface = CountingInterface()
+    first, first_hit = qa_modules.cached_completion(interface, "model", 0.7, MESSAGES, use_cache=True)
+    second, second_hit = qa_modules.cached_completion(interface, "model", 0.7, MESSAGES, use_cache=True)
+    assert (first_hit, second_hit) == (False, True)
+    assert second == first
+    assert interface.calls == 1
+
+
+@pytest.mark.parametrize("model_name, temperature, content", [
+    ("other-model", 0.7, "Is this a dimension error?"),
+    ("model", 0.9, "Is this a dimension error?"),
+    ("model", 0.7, "Is this a missing file error?"),
+])
+def test_key_covers_model_temperature_and_messages(model_name, temperature, content):
+    interface = CountingInterface()
+    qa_modules.cached_completion(interface, "model", 0.7, MESSAGES, use_cache=True)
+    messages = [{"role": "user", "content": content}]
+    _, hit = qa_modules.cached_completion(interface, model_name, temperature, messages, use_cache=True)
+    assert not hit
+    assert interface.calls == 2
+
+
+def test_global_switch_bypasses_cache(monkeypatch):
+    monkeypatch.setattr(config, "llm_cache_enabled", False)
+    interface = CountingInterface()
+    qa_modules.cached_completion(interface, "model", 0.7, MESSAGES, use_cache=True)
+    _, hit = qa_modules.cached_completion(interface, "model", 0.7, MESSAGES, use_cache=True)
+    assert not hit
+    assert interface.calls == 2
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = qa_modules.ResponseCache(str(tmp_path / "cache"), max_age_days=0)
+    cache.put("ab" * 32, {"content": "old"})
+    assert cache.get("ab" * 32) is None
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = qa_modules.ResponseCache(str(tmp_path / "cache"), max_bytes=None)
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    for key in keys:
+        cache.put(key, {"content": "x" * 1000})
+    for age, key in zip((300, 200, 100), keys):
+        path = cache._entry_path(key)
+        os.utime(path, (os.path.getmtime(path) - age,) * 2)
+    cache.max_bytes = 2500
+    cache.evict()
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[1]) is not None and cache.get(keys[2]) is not None
+
+
+@pytest.mark.parametrize("qa_class", [qa_modules.QA_NoContext_deepseek_V3, qa_modules.QA_NoContext_deepseek_R1])
+def test_qa_objects_do_not_cache_by_default(qa_class):
+    assert qa_class().use_cache is False
+    assert qa_class(use_cache=True).use_cache is True
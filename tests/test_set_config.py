@@ -0,0 +1,27 @@
+import pytest
+
+import config
+import set_config
+
+
+@pytest.mark.parametrize("config_data, expected", [
+    ({}, 0.25),
+    ({"pdf_chunk_d": 1.5}, 0.25),
+    ({"pdf_chunk_d": 1.0}, 0.5),
+    ({"pdf_chunk_min_similarity": 0.4}, 0.4),
+])
+def test_cosine_threshold_follows_pdf_chunk_d_unless_set(config_data, expected, capsys):
+    assert set_config._pdf_min_similarity(config_data) == pytest.approx(expected)
+    assert capsys.readouterr().out == ""
+
+
+def test_both_thresholds_set_warns_that_pdf_chunk_d_is_ignored(capsys):
+    assert set_config._pdf_min_similarity({"pdf_chunk_d": 1.0, "pdf_chunk_min_similarity": 0.4}) == 0.4
+    assert "ignores pdf_chunk_d" in capsys.readouterr().out
+
+
+def test_l2_metric_uses_pdf_chunk_d_without_a_warning(monkeypatch, capsys):
+    monkeypatch.setattr(config, "pdf_vector_metric", "cosine")
+    data = {"pdf_vector_metric": "l2", "pdf_chunk_d": 1.0, "pdf_chunk_min_similarity": 0.4}
+    assert set_config._pdf_min_similarity(data) == 0.4
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,56 @@
+import faiss
+import numpy as np
+import pytest
+
+import config
+import vector_index
+
+
+@pytest.fixture(params=[True, False], ids=["selector", "position-fallback"])
+def idmap_search_parameters(request, monkeypatch):
+    """Run scoped searches both through IndexIDMap (faiss >= 1.8) and the fallback used by older faiss."""
+    if request.param and not vector_index.IDMAP_SEARCH_PARAMETERS:
+        pytest.skip("this faiss does not take search parameters through IndexIDMap")
+    monkeypatch.setattr(vector_index, "IDMAP_SEARCH_PARAMETERS", request.param)
+    return request.param
+
+
+def _library_index(index_type, vectors, ids):
+    index = faiss.IndexIDMap2(vector_index.new_index(vectors.shape[1], "cosine", index_type, n_train=len(vectors)))
+    index.add_with_ids(vector_index.prepare(vectors, "cosine"), ids)
+    return vector_index.configure_search(index)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_scoped_search_returns_the_best_ids_in_scope(idmap_search_parameters, index_type, monkeypatch):
+    monkeypatch.setattr(config, "pdf_hnsw_ef_search", 256)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 16)).astype("float32")
+    ids = rng.permutation(10_000)[:500].astype("int64")
+    in_scope = rng.random(500) < 0.2
+    queries = rng.normal(size=(3, 16)).astype("float32")
+    index = _library_index(index_type, vectors, ids)
+
+    scores, found = vector_index.search(index, queries, 5, "cosine", ids=ids[in_scope])
+
+    similarities = vector_index.prepare(queries, "cosine") @ vector_index.prepare(vectors[in_scope], "cosine").T
+    expected = ids[in_scope][np.argsort(-similarities, axis=1)[:, :5]]
+    np.testing.assert_array_equal(found, expected)
+    np.testing.assert_allclose(scores, -np.sort(-similarities, axis=1)[:, :5], rtol=1e-5)
+
+
+def test_scope_smaller_than_k_pads_with_minus_one(idmap_search_parameters):
+    vectors = np.eye(4, dtype="float32")
+    index = _library_index("flat", vectors, np.array([10, 11, 12, 13], dtype="int64"))
+
+    _, found = vector_index.search(index, vectors[:1], 3, "cosine", ids=[11, 99])
+
+    assert found.tolist() == [[11, -1]]
+
+
+def test_scoped_search_on_an_empty_index(idmap_search_parameters):
+    index = faiss.IndexIDMap2(vector_index.new_index(4, "cosine", "flat"))
+
+    _, found = vector_index.search(index, np.ones((1, 4), dtype="float32"), 3, "cosine", ids=[1, 2])
+
+    assert found.tolist() == [[-1]]